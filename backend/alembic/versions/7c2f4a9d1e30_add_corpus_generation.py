@@ -0,0 +1,30 @@
+"""Add corpus_generation counter table
+
+Revision ID: 7c2f4a9d1e30
+Revises: 0142b0438618
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2f4a9d1e30'
+down_revision = '0142b0438618'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tabla de una sola fila con la generación del corpus de documentos legales
+    op.create_table('corpus_generation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('generation', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('corpus_generation')
@@ -0,0 +1,48 @@
+"""Add query_jobs queue table
+
+Revision ID: 9b4e1c7d2a55
+Revises: 7c2f4a9d1e30
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e1c7d2a55'
+down_revision = '7c2f4a9d1e30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Cola persistente de consultas con arriendo por worker
+    op.create_table('query_jobs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('query_text', sa.Text(), nullable=False),
+    sa.Column('user_id', sa.String(length=100), nullable=True),
+    sa.Column('source', sa.String(length=20), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('lease_owner', sa.String(length=100), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('response_text', sa.Text(), nullable=True),
+    sa.Column('sources', sa.Text(), nullable=True),
+    sa.Column('confidence_score', sa.Float(), nullable=True),
+    sa.Column('needs_human_review', sa.Boolean(), nullable=False),
+    sa.Column('review_reason', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_query_jobs_user_id'), 'query_jobs', ['user_id'], unique=False)
+    op.create_index('ix_query_jobs_status_available', 'query_jobs', ['status', 'available_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_query_jobs_status_available', table_name='query_jobs')
+    op.drop_index(op.f('ix_query_jobs_user_id'), table_name='query_jobs')
+    op.drop_table('query_jobs')
@@ -26,7 +26,8 @@ from .endpoints import (
     casos,
     admin,
     chat,
-    notificaciones
+    notificaciones,
+    bulk
 )
 
 # Crear un router principal para la API
@@ -53,4 +54,5 @@ api_router.include_router(facturas.router, prefix="/facturas", tags=["facturas"]
 api_router.include_router(casos.router, prefix="/casos", tags=["casos"])
 api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
 api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
-api_router.include_router(notificaciones.router, prefix="/notificaciones", tags=["notificaciones"]) 
\ No newline at end of file
+api_router.include_router(notificaciones.router, prefix="/notificaciones", tags=["notificaciones"])
+api_router.include_router(bulk.router, prefix="/bulk", tags=["bulk"]) 
\ No newline at end of file
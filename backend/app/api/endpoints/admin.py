@@ -5,6 +5,7 @@ from typing import List, Dict, Any
 from datetime import datetime, timedelta
 
 from app.db.session import get_db
+from app.core.registry import registry
 from app.services.auth_service import AuthService
 from app.services.metricas_service import MetricasService
 from app.services.facturacion_service import FacturacionService
@@ -116,4 +117,58 @@ async def get_analytics(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
-        ) 
\ No newline at end of file
+        )
+
+@router.get("/llm-usage")
+async def get_llm_usage(
+    top_users: int = 20,
+    current_user: Usuario = Depends(auth_service.get_current_admin_user)
+) -> Dict[str, Any]:
+    """
+    Uso del LLM del proceso: tokens, latencia, reintentos y costo estimado
+    (totales, por modelo, por operación, usuarios de mayor costo y por
+    minuto), respuestas servidas sin llamar al LLM, estado del circuito, los
+    respaldos, el limitador de tasa y el enrutamiento de modelos, y estado de
+    los cachés.
+    
+    Args:
+        top_users: Usuarios de mayor costo a incluir
+        current_user: Usuario actual (debe ser admin)
+        
+    Returns:
+        Dict con la telemetría y las estadísticas de cada nivel
+    """
+    from app.services.ai_service import llm_telemetry, get_llm_stats, response_cache
+    
+    usage = llm_telemetry.snapshot(top_users=top_users)
+    usage["llm"] = get_llm_stats()
+    usage["response_cache"] = response_cache.stats()
+    
+    ai_service = registry.get_service("ai_service")
+    if ai_service is not None:
+        usage["single_flight"] = ai_service.in_flight.stats()
+        if ai_service.semantic_cache is not None:
+            usage["semantic_cache"] = ai_service.semantic_cache.stats()
+    answer_store = registry.get_service("answer_store")
+    if answer_store is not None:
+        usage["answer_store"] = answer_store.stats()
+    return usage
+
+@router.get("/model-routing")
+async def get_model_routing(
+    limit: int = 100,
+    current_user: Usuario = Depends(auth_service.get_current_admin_user)
+) -> Dict[str, Any]:
+    """
+    Resultados del enrutamiento de modelos por complejidad, para ajustar los umbrales.
+    
+    Args:
+        limit: Decisiones recientes a incluir (señales, nivel y resultado de cada consulta)
+        current_user: Usuario actual (debe ser admin)
+        
+    Returns:
+        Dict con los resultados por nivel y las decisiones recientes
+    """
+    from app.services.ai_service import model_router
+    
+    return {**model_router.stats(), "recent": model_router.recent(limit)}
@@ -8,7 +8,10 @@ Incluye optimizaciones para reducir consumo de tokens y controles de uso.
 
 import os
 import json
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from datetime import datetime, date
@@ -18,8 +21,10 @@ import hashlib
 from app.db.database import get_db
 from app.schemas.legal_document import SearchQuery
 from app.schemas.query import LegalResponse
+from app.core.registry import registry
 from app.services.search_service import SearchService
-from app.services.ai_service import AIService
+from app.services.ai_service import AIService, llm_telemetry
+from app.services.answer_store import AnswerStore
 import sys
 from pathlib import Path
 
@@ -28,11 +33,24 @@ backend_dir = Path(__file__).resolve().parent.parent.parent.parent
 if str(backend_dir) not in sys.path:
     sys.path.append(str(backend_dir))
 
-from config import DAILY_QUERY_LIMIT, ECONOMY_MODE
+from config import DAILY_QUERY_LIMIT, ECONOMY_MODE, ANSWER_STORE_DB, PRECOMPUTED_ANSWERS_ENABLED
 
 router = APIRouter()
-search_service = SearchService()
-ai_service = AIService()
+# Reutilizar el servicio de búsqueda compartido
+search_service = registry.get_service("search_service")
+if search_service is None:
+    search_service = SearchService()
+    registry.register_service("search_service", search_service)
+# Reutilizar el servicio de IA compartido (y su pool de conexiones)
+ai_service = registry.get_service("ai_service")
+if ai_service is None:
+    ai_service = AIService()
+    registry.register_service("ai_service", ai_service)
+# Respuestas precalculadas para las preguntas frecuentes (y registro de consultas)
+answer_store = registry.get_service("answer_store")
+if answer_store is None:
+    answer_store = AnswerStore(ANSWER_STORE_DB, enabled=PRECOMPUTED_ANSWERS_ENABLED)
+    registry.register_service("answer_store", answer_store)
 
 # Control de uso diario
 usage_file = os.path.join(backend_dir, "usage_stats.json")
@@ -66,6 +84,32 @@ def increment_daily_usage() -> None:
     except Exception as e:
         print(f"Error al actualizar estadísticas de uso: {str(e)}")
 
+def _client_id(request: Request) -> str:
+    """Identifica al cliente de una consulta anónima para el reparto del límite de tasa"""
+    return request.client.host if request.client else "anonimo"
+
+def _precomputed_response(query_text: str, db: Session, start_time: datetime):
+    """
+    Respuesta precalculada vigente para la consulta, o None si no existe.
+    Hace E/S bloqueante (SQLite del almacén y generación del corpus): en los
+    endpoints asíncronos se ejecuta con run_in_threadpool.
+    """
+    answer_store.log_query(query_text)
+    stored = answer_store.get(db, query_text)
+    if stored is None:
+        return None
+    llm_telemetry.record_cache_hit("precomputed")
+    return LegalResponse(
+        query=query_text,
+        response=stored["response"],
+        references=stored["references"],
+        confidence_score=stored["confidence_score"],
+        needs_human_review=stored["needs_human_review"],
+        review_reason=stored["review_reason"],
+        processing_time_ms=round((datetime.now() - start_time).total_seconds() * 1000, 2),
+        timestamp=datetime.now().isoformat()
+    )
+
 class LegalQuery(BaseModel):
     """Esquema para consultas legales directas"""
     query: str = Field(..., min_length=5, description="Consulta legal del usuario")
@@ -73,6 +117,7 @@ class LegalQuery(BaseModel):
 @router.post("/", response_model=LegalResponse)
 async def ask_legal_question(
     query: LegalQuery,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     """
@@ -83,6 +128,7 @@ async def ask_legal_question(
     
     Args:
         query: Consulta del usuario
+        request: Petición HTTP (el cliente identifica el turno en el límite de tasa)
         db: Sesión de base de datos
     
     Returns:
@@ -106,9 +152,15 @@ async def ask_legal_question(
         # Incrementar contador de uso
         increment_daily_usage()
         
+        # 0. Preguntas frecuentes: respuesta precalculada, sin búsqueda ni LLM
+        # (en un hilo, sin bloquear el bucle de eventos)
+        precomputed = await run_in_threadpool(_precomputed_response, query.query, db, datetime.now())
+        if precomputed is not None:
+            return precomputed
+        
         # 1. Buscar documentos relevantes con BM25 (limitados según configuración)
         search_query = SearchQuery(query=query.query, limit=5)  # Primero buscamos 5 y luego filtramos
-        search_results = search_service.search_documents(db, search_query)
+        search_results = await run_in_threadpool(search_service.search_documents, db, search_query)
         
         if not search_results:
             return LegalResponse(
@@ -122,10 +174,11 @@ async def ask_legal_question(
         
         # 2. Generar respuesta con GPT utilizando los documentos relevantes
         start_time = datetime.now()
-        response_text, confidence_score, needs_human_review, review_reason = ai_service.generate_response(
+        response_text, confidence_score, needs_human_review, review_reason = await ai_service.agenerate_response(
             query_text=query.query,
             search_results=search_results,
-            threshold=0.7
+            threshold=0.7,
+            user_id=_client_id(request)
         )
         
         # 3. Formatear respuesta con fuentes
@@ -151,4 +204,119 @@ async def ask_legal_question(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al procesar la consulta: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Serializa un evento en formato Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+@router.post("/stream")
+async def ask_legal_question_stream(
+    query: LegalQuery,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Variante en streaming del endpoint de consultas legales (Server-Sent Events).
+    
+    Eventos emitidos:
+    - references: documentos candidatos, enviados antes de que llegue la respuesta
+    - token: fragmento de texto del modelo ({"text": ...})
+    - done: respuesta final procesada (mismo esquema que LegalResponse), que
+      reemplaza al texto parcial (sin la línea de confianza y con referencias formateadas)
+    - error: error inesperado ({"detail": ...})
+    
+    Args:
+        query: Consulta del usuario
+        request: Petición HTTP (el cliente identifica el turno en el límite de tasa)
+        db: Sesión de base de datos
+    
+    Returns:
+        Respuesta text/event-stream
+    """
+    async def event_stream():
+        start_time = datetime.now()
+        try:
+            # Verificar límite diario
+            if get_daily_usage() >= DAILY_QUERY_LIMIT:
+                yield _sse_event("done", LegalResponse(
+                    query=query.query,
+                    response="Has alcanzado el límite diario de consultas. Por favor, intenta de nuevo mañana.",
+                    references=[],
+                    confidence_score=0.0,
+                    needs_human_review=True,
+                    review_reason="Límite diario excedido",
+                    processing_time_ms=0,
+                    timestamp=datetime.now().isoformat()
+                ))
+                return
+            
+            increment_daily_usage()
+            
+            # 0. Preguntas frecuentes: respuesta precalculada, sin búsqueda ni LLM
+            # (en un hilo, sin bloquear el bucle de eventos)
+            precomputed = await run_in_threadpool(_precomputed_response, query.query, db, start_time)
+            if precomputed is not None:
+                yield _sse_event("done", precomputed)
+                return
+            
+            # 1. Buscar documentos relevantes (en un hilo, sin bloquear el bucle de eventos)
+            search_query = SearchQuery(query=query.query, limit=5)
+            search_results = await run_in_threadpool(search_service.search_documents, db, search_query)
+            
+            if not search_results:
+                yield _sse_event("done", LegalResponse(
+                    query=query.query,
+                    response="No se encontraron documentos legales relevantes para responder a tu consulta. Por favor, intenta reformular tu pregunta o consulta con un abogado especializado.",
+                    references=[],
+                    confidence_score=0.0,
+                    processing_time_ms=0,
+                    timestamp=datetime.now().isoformat()
+                ))
+                return
+            
+            # 2. Referencias candidatas: el cliente puede mostrarlas mientras se genera la respuesta
+            yield _sse_event("references", {
+                "references": [
+                    {
+                        "id": doc.get("document_id"),
+                        "title": doc.get("title"),
+                        "reference": doc.get("reference_number", "N/A"),
+                        "relevance": doc.get("relevance_score", 0)
+                    }
+                    for doc in search_results
+                ]
+            })
+            
+            # 3. Transmitir la respuesta del modelo y procesarla al final
+            async for event, payload in ai_service.astream_response(
+                query_text=query.query,
+                search_results=search_results,
+                threshold=0.7,
+                user_id=_client_id(request)
+            ):
+                if event == "token":
+                    yield _sse_event("token", {"text": payload})
+                    continue
+                
+                response_text, confidence_score, needs_human_review, review_reason = payload
+                formatted_response = ai_service.format_response_with_sources(response_text, search_results)
+                processing_time_ms = (datetime.now() - start_time).total_seconds() * 1000
+                yield _sse_event("done", LegalResponse(
+                    query=query.query,
+                    response=formatted_response["response_text"],
+                    references=formatted_response["sources"],
+                    confidence_score=confidence_score,
+                    needs_human_review=needs_human_review,
+                    review_reason=review_reason if needs_human_review else None,
+                    processing_time_ms=round(processing_time_ms, 2),
+                    timestamp=datetime.now().isoformat()
+                ))
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Error al procesar la consulta: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,133 @@
+"""
+API de Generación Masiva
+-----------------------
+Trabajos de generación de respuestas para lotes de preguntas (formularios de
+ingreso, regeneración tras un cambio normativo). Sólo administradores.
+"""
+
+import os
+import uuid
+import tempfile
+from pathlib import Path
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi.responses import FileResponse
+
+import config
+from app.core.registry import registry
+from app.models.usuario import Usuario
+from app.services.auth_service import AuthService
+from app.services.bulk_generation import BulkGenerator, BulkJobManager, read_questions
+
+router = APIRouter()
+auth_service = AuthService()
+
+# Formatos aceptados para el archivo de preguntas
+QUESTION_FILE_TYPES = (".txt", ".csv", ".jsonl")
+
+
+def _new_generator() -> BulkGenerator:
+    """Generador sobre los servicios de búsqueda y de IA compartidos"""
+    from app.services.query_worker import shared_services
+
+    search_service, ai_service = shared_services()
+    return BulkGenerator(
+        search_service,
+        ai_service,
+        concurrency=config.BULK_CONCURRENCY,
+        retrieval_batch_size=config.BULK_RETRIEVAL_BATCH_SIZE
+    )
+
+
+# Reutilizar el administrador de trabajos compartido
+bulk_jobs = registry.get_service("bulk_jobs")
+if bulk_jobs is None:
+    bulk_jobs = BulkJobManager(config.BULK_JOBS_DIR, _new_generator)
+    registry.register_service("bulk_jobs", bulk_jobs)
+
+
+def _existing_job(job_id: str) -> str:
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trabajo no encontrado")
+    if not bulk_jobs.exists(job_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trabajo no encontrado")
+    return job_id
+
+
+@router.post("/")
+async def create_bulk_job(
+    file: UploadFile = File(...),
+    current_user: Usuario = Depends(auth_service.get_current_admin_user)
+) -> Dict[str, Any]:
+    """
+    Crea un trabajo de generación masiva y lo inicia en segundo plano.
+
+    Args:
+        file: Preguntas en .txt (una por línea), .csv o .jsonl
+        current_user: Usuario actual (debe ser admin)
+
+    Returns:
+        Estado inicial del trabajo
+    """
+    suffix = Path(file.filename or "").suffix.lower()
+    if suffix not in QUESTION_FILE_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Formato no soportado; use {', '.join(QUESTION_FILE_TYPES)}"
+        )
+
+    content = await file.read()
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as upload:
+        upload.write(content)
+    try:
+        questions = read_questions(upload.name)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Archivo de preguntas inválido: {str(e)}")
+    finally:
+        os.unlink(upload.name)
+
+    if not questions:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El archivo no contiene preguntas")
+    if len(questions) > config.BULK_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo {config.BULK_MAX_QUESTIONS} preguntas por trabajo"
+        )
+
+    job_id = bulk_jobs.create(questions)
+    return bulk_jobs.status(job_id)
+
+
+@router.get("/{job_id}")
+async def get_bulk_job(
+    job_id: str,
+    current_user: Usuario = Depends(auth_service.get_current_admin_user)
+) -> Dict[str, Any]:
+    """Estado y progreso de un trabajo"""
+    return bulk_jobs.status(_existing_job(job_id))
+
+
+@router.post("/{job_id}/resume")
+async def resume_bulk_job(
+    job_id: str,
+    current_user: Usuario = Depends(auth_service.get_current_admin_user)
+) -> Dict[str, Any]:
+    """Reanuda un trabajo interrumpido: sólo se generan las preguntas sin respuesta"""
+    if not bulk_jobs.start(_existing_job(job_id)):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El trabajo ya está en ejecución")
+    return bulk_jobs.status(job_id)
+
+
+@router.get("/{job_id}/results")
+async def get_bulk_results(
+    job_id: str,
+    current_user: Usuario = Depends(auth_service.get_current_admin_user)
+):
+    """Resultados generados hasta el momento (JSONL, una respuesta por línea)"""
+    results_path = bulk_jobs.results_path(_existing_job(job_id))
+    if not os.path.exists(results_path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="El trabajo aún no tiene resultados")
+    return FileResponse(results_path, media_type="application/x-ndjson", filename=f"{job_id}.jsonl")
@@ -17,10 +17,16 @@ from app.schemas.legal_document import (
     LegalDocumentSearchResult,
     SearchQuery
 )
+from app.core.registry import registry
 from app.services.search_service import SearchService
 
 router = APIRouter()
-search_service = SearchService()
+# Obtener el servicio de búsqueda compartido desde registry o crear uno nuevo,
+# de modo que el índice calentado al arrancar sea el que atiende las peticiones
+search_service = registry.get_service("search_service")
+if search_service is None:
+    search_service = SearchService()
+    registry.register_service("search_service", search_service)
 
 
 @router.post("/", response_model=LegalDocumentResponse, status_code=status.HTTP_201_CREATED)
@@ -12,6 +12,7 @@ from pydantic import BaseModel, Field
 from app.db.database import get_db
 from app.models.legal_document import DocumentType
 from app.schemas.legal_document import SearchQuery
+from app.core.registry import registry
 from app.services.search_service import SearchService
 
 
@@ -36,7 +37,11 @@ class SearchResponse(BaseModel):
 
 
 router = APIRouter()
-search_service = SearchService()
+# Reutilizar el servicio de búsqueda compartido
+search_service = registry.get_service("search_service")
+if search_service is None:
+    search_service = SearchService()
+    registry.register_service("search_service", search_service)
 
 
 @router.post("/", response_model=SearchResponse)
@@ -12,10 +12,13 @@ from pydantic import BaseModel, Field
 import time
 from datetime import datetime
 
+from app.core.registry import registry
 from app.db.database import get_db
 from app.models.legal_document import DocumentType
 from app.schemas.legal_document import SearchQuery
-from app.services.optimized_bm25_service import OptimizedBM25Service
+from app.services.optimized_bm25_service import OptimizedBM25Service, InvalidCursorError
+from app.services.sharded_bm25_service import ShardedBM25Service
+from config import BM25_SHARDS
 
 
 # Esquemas de respuesta específicos para el endpoint de búsqueda
@@ -35,6 +38,11 @@ class SearchResponse(BaseModel):
     query: str = Field(..., description="Consulta realizada")
     cached: bool = Field(False, description="Indica si la respuesta completa proviene del caché")
     results: List[SearchResultItem] = Field(default_factory=list, description="Resultados de la búsqueda")
+    facets: Dict[str, Dict[str, int]] = Field(
+        default_factory=dict,
+        description="Conteos por faceta (document_type, category, subcategory, year) de los documentos que coinciden"
+    )
+    next_cursor: Optional[str] = Field(None, description="Cursor para obtener la página siguiente (None si no hay más resultados)")
     processing_time_ms: Optional[float] = Field(None, description="Tiempo de procesamiento en milisegundos")
     document_count: Optional[int] = Field(None, description="Número de documentos indexados")
     timestamp: str = Field(..., description="Marca de tiempo de la consulta")
@@ -42,11 +50,18 @@ class SearchResponse(BaseModel):
 
 # Crear router y servicio de búsqueda optimizado
 router = APIRouter()
-bm25_service = OptimizedBM25Service(
-    k1=1.5,  # Parámetro de saturación de término
-    b=0.75,  # Parámetro de normalización de longitud
-    use_cache=True
-)
+bm25_service = registry.get_service("bm25_service")
+if bm25_service is None:
+    if BM25_SHARDS > 1:
+        # Índice repartido entre varios procesos (corpus grandes)
+        bm25_service = ShardedBM25Service(num_shards=BM25_SHARDS, k1=1.5, b=0.75, use_cache=True)
+    else:
+        bm25_service = OptimizedBM25Service(
+            k1=1.5,  # Parámetro de saturación de término
+            b=0.75,  # Parámetro de normalización de longitud
+            use_cache=True
+        )
+    registry.register_service("bm25_service", bm25_service)
 
 
 @router.post("/", response_model=SearchResponse)
@@ -54,7 +69,10 @@ def search(
     query: str = Query(..., min_length=3, description="Texto de la consulta"),
     document_type: Optional[str] = Query(None, description="Tipo de documento a filtrar"),
     category: Optional[str] = Query(None, description="Categoría a filtrar"),
+    subcategory: Optional[str] = Query(None, description="Subcategoría a filtrar"),
+    year: Optional[int] = Query(None, ge=1800, le=2100, description="Año de emisión a filtrar"),
     limit: int = Query(10, ge=1, le=100, description="Número máximo de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto por la página anterior"),
     force_reindex: bool = Query(False, description="Forzar reconstrucción del índice BM25"),
     db: Session = Depends(get_db)
 ):
@@ -65,12 +83,16 @@ def search(
         query: Texto de la consulta
         document_type: Tipo de documento a filtrar (opcional)
         category: Categoría a filtrar (opcional)
-        limit: Número máximo de resultados
+        subcategory: Subcategoría a filtrar (opcional)
+        year: Año de emisión a filtrar (opcional)
+        limit: Número máximo de resultados por página
+        cursor: Cursor `next_cursor` de la página anterior (opcional)
         force_reindex: Forzar reconstrucción del índice BM25
         db: Sesión de base de datos
     
     Returns:
-        Respuesta con los resultados de búsqueda más relevantes
+        Respuesta con los resultados de búsqueda más relevantes y los conteos
+        de facetas para la navegación por filtros
     """
     # Validar la consulta
     if not query or len(query.strip()) < 3:
@@ -96,7 +118,10 @@ def search(
         query=query,
         document_type=doc_type,
         category=category,
-        limit=limit
+        subcategory=subcategory,
+        year=year,
+        limit=limit,
+        cursor=cursor
     )
     
     # Forzar reconstrucción del índice si se solicitó
@@ -106,8 +131,15 @@ def search(
     # Iniciar tiempo para medición de rendimiento
     start_time = time.time()
     
-    # Realizar la búsqueda optimizada
-    search_results = bm25_service.search_documents(db, search_query)
+    # Realizar la búsqueda optimizada (resultados y facetas en una sola pasada)
+    try:
+        search_output = bm25_service.search_documents_with_facets(db, search_query)
+    except InvalidCursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    search_results = search_output["results"]
     
     # Calcular tiempo de procesamiento en milisegundos
     processing_time = (time.time() - start_time) * 1000
@@ -123,6 +155,8 @@ def search(
         "query": query,
         "cached": is_cached,
         "results": search_results,
+        "facets": search_output["facets"],
+        "next_cursor": search_output["next_cursor"],
         "processing_time_ms": round(processing_time, 2),
         "document_count": index_status.get("document_count", 0),
         "timestamp": datetime.now().isoformat()
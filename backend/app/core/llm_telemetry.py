@@ -0,0 +1,266 @@
+"""
+Telemetría de Uso del LLM
+------------------------
+Registra cada llamada a OpenAI (modelo, tokens de entrada, de salida y en
+caché del proveedor, latencia, reintentos, resultado y costo estimado) y
+cada respuesta servida sin llamar al LLM (caché de respuestas, caché
+semántico, respuesta extractiva, precalculada o sólo con documentos).
+
+Los datos se agregan en memoria al registrarlos (totales, por modelo, por
+operación, por usuario y por minuto de la última hora): registrar una
+llamada sólo actualiza contadores bajo un lock, sin E/S en el camino de la
+solicitud. Se consultan con snapshot() (endpoint de administración) y
+render_prometheus() (GET /metrics).
+"""
+import time
+import threading
+from collections import deque, OrderedDict
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Precios en USD por millón de tokens (entrada, salida); se elige el prefijo más largo del modelo
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+# Fracción del precio de entrada que se cobra por los tokens en caché del proveedor
+CACHED_INPUT_PRICE_FACTOR = 0.5
+
+# Usuario de las llamadas sin usuario y de los que exceden el máximo de usuarios seguidos
+ANONYMOUS_USER = "anonimo"
+OTHER_USERS = "otros"
+
+
+def _new_rollup() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "errors": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "cost_usd": 0.0,
+        "latency_seconds": 0.0
+    }
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class LLMTelemetry:
+    """Agregados en memoria del uso y costo de las llamadas al LLM"""
+
+    def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None, max_users: int = 1000,
+                 latency_samples: int = 1000, window_minutes: int = 60):
+        """
+        Inicializa la telemetría
+
+        Args:
+            prices: Precios por modelo en USD por millón de tokens (entrada, salida)
+            max_users: Usuarios con agregados propios; el resto se suma en "otros"
+            latency_samples: Latencias recientes por modelo para los percentiles
+            window_minutes: Minutos con agregados por minuto
+        """
+        self.prices = dict(DEFAULT_PRICES)
+        self.prices.update(prices or {})
+        self.max_users = max_users
+        self.latency_samples = latency_samples
+        self.window_minutes = window_minutes
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._totals = _new_rollup()
+        self._by_model: Dict[str, Dict[str, Any]] = {}
+        self._by_operation: Dict[str, Dict[str, Any]] = {}
+        self._by_user: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._by_minute: Deque[Tuple[int, Dict[str, Any]]] = deque()
+        self._outcomes: Dict[Tuple[str, str], int] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._answered_by: Dict[str, int] = {}
+
+    def price_for(self, model: str) -> Tuple[float, float]:
+        """Precio (entrada, salida) del modelo; (0, 0) si no se conoce"""
+        matches = [prefix for prefix in self.prices if model.startswith(prefix)]
+        return self.prices[max(matches, key=len)] if matches else (0.0, 0.0)
+
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        """Costo estimado en USD de una llamada"""
+        input_price, output_price = self.price_for(model)
+        uncached = max(0, prompt_tokens - cached_tokens)
+        return (
+            uncached * input_price
+            + cached_tokens * input_price * CACHED_INPUT_PRICE_FACTOR
+            + completion_tokens * output_price
+        ) / 1_000_000
+
+    def _user_rollup(self, user_id: Optional[str]) -> Dict[str, Any]:
+        key = str(user_id) if user_id else ANONYMOUS_USER
+        if key not in self._by_user and len(self._by_user) >= self.max_users:
+            key = OTHER_USERS
+        rollup = self._by_user.get(key)
+        if rollup is None:
+            rollup = self._by_user[key] = _new_rollup()
+        return rollup
+
+    def _minute_rollup(self, now: float) -> Dict[str, Any]:
+        minute = int(now // 60) * 60
+        if not self._by_minute or self._by_minute[-1][0] != minute:
+            self._by_minute.append((minute, _new_rollup()))
+            while self._by_minute and self._by_minute[0][0] <= minute - self.window_minutes * 60:
+                self._by_minute.popleft()
+        return self._by_minute[-1][1]
+
+    def record_call(self, model: str, operation: str = "chat", user_id: Optional[str] = None,
+                    latency: float = 0.0, prompt_tokens: int = 0, completion_tokens: int = 0,
+                    cached_tokens: int = 0, attempts: int = 1, outcome: str = "ok") -> float:
+        """
+        Registra una llamada al LLM (con todos sus reintentos).
+
+        Args:
+            model: Modelo usado
+            operation: Flujo que hizo la llamada (respuesta, legal, streaming...)
+            user_id: Usuario que originó la consulta
+            latency: Segundos de la llamada exitosa
+            prompt_tokens: Tokens de entrada reportados por el proveedor
+            completion_tokens: Tokens de salida
+            cached_tokens: Tokens de entrada servidos desde el caché de prompts del proveedor
+            attempts: Intentos realizados
+            outcome: ok, o el motivo de la falla (error, rate_limited, circuit_open)
+
+        Returns:
+            Costo estimado en USD
+        """
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        with self._lock:
+            rollups = [
+                self._totals,
+                self._by_model.setdefault(model, _new_rollup()),
+                self._by_operation.setdefault(operation, _new_rollup()),
+                self._user_rollup(user_id),
+                self._minute_rollup(time.time())
+            ]
+            for rollup in rollups:
+                rollup["calls"] += 1
+                rollup["errors"] += outcome != "ok"
+                rollup["retries"] += max(0, attempts - 1)
+                rollup["prompt_tokens"] += prompt_tokens
+                rollup["completion_tokens"] += completion_tokens
+                rollup["cached_tokens"] += cached_tokens
+                rollup["cost_usd"] += cost
+                rollup["latency_seconds"] += latency
+            self._outcomes[(model, outcome)] = self._outcomes.get((model, outcome), 0) + 1
+            if outcome == "ok":
+                self._answered_by["llm"] = self._answered_by.get("llm", 0) + 1
+                samples = self._latencies.get(model)
+                if samples is None:
+                    samples = self._latencies[model] = deque(maxlen=self.latency_samples)
+                samples.append(latency)
+        return cost
+
+    def record_cache_hit(self, tier: str) -> None:
+        """Registra una respuesta servida sin llamar al LLM (caché o respuesta sin generación)"""
+        with self._lock:
+            self._answered_by[tier] = self._answered_by.get(tier, 0) + 1
+
+    def _summary(self, rollup: Dict[str, Any]) -> Dict[str, Any]:
+        summary = dict(rollup)
+        summary["cost_usd"] = round(rollup["cost_usd"], 6)
+        summary["latency_seconds"] = round(rollup["latency_seconds"], 3)
+        successful = rollup["calls"] - rollup["errors"]
+        summary["avg_latency_seconds"] = round(rollup["latency_seconds"] / successful, 3) if successful else None
+        summary["cached_token_rate"] = (
+            round(rollup["cached_tokens"] / rollup["prompt_tokens"], 3) if rollup["prompt_tokens"] else 0.0
+        )
+        return summary
+
+    def snapshot(self, top_users: int = 20) -> Dict[str, Any]:
+        """
+        Agregados actuales.
+
+        Args:
+            top_users: Usuarios de mayor costo a incluir
+
+        Returns:
+            Totales, por modelo (con percentiles de latencia), por operación,
+            usuarios de mayor costo, respuestas por nivel y agregados por minuto
+        """
+        with self._lock:
+            by_model = {}
+            for model, rollup in self._by_model.items():
+                latencies = list(self._latencies.get(model, ()))
+                by_model[model] = dict(
+                    self._summary(rollup),
+                    p50_latency_seconds=_percentile(latencies, 0.5),
+                    p95_latency_seconds=_percentile(latencies, 0.95)
+                )
+            users = sorted(self._by_user.items(), key=lambda item: -item[1]["cost_usd"])[:top_users]
+            answered = dict(self._answered_by)
+            total_answered = sum(answered.values())
+            return {
+                "since": self._started,
+                "totals": self._summary(self._totals),
+                "by_model": by_model,
+                "by_operation": {name: self._summary(rollup) for name, rollup in self._by_operation.items()},
+                "top_users": {user: self._summary(rollup) for user, rollup in users},
+                "tracked_users": len(self._by_user),
+                "answered_by": answered,
+                "llm_avoided_rate": (
+                    round(1 - answered.get("llm", 0) / total_answered, 3) if total_answered else 0.0
+                ),
+                "by_minute": [
+                    dict(self._summary(rollup), minute=minute) for minute, rollup in self._by_minute
+                ]
+            }
+
+    def render_prometheus(self, circuit_open: Optional[bool] = None) -> str:
+        """
+        Agregados en el formato de texto de Prometheus (sin etiquetas por usuario)
+
+        Args:
+            circuit_open: Si el circuito hacia el LLM no está cerrado (None omite el indicador)
+        """
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self._lock:
+            models = {model: dict(rollup) for model, rollup in self._by_model.items()}
+            outcomes = dict(self._outcomes)
+            answered = dict(self._answered_by)
+            latencies = {model: list(samples) for model, samples in self._latencies.items()}
+
+        metric("llm_requests_total", "counter", "Llamadas al LLM por modelo y resultado",
+               [({"model": model, "outcome": outcome}, count) for (model, outcome), count in outcomes.items()])
+        metric("llm_retries_total", "counter", "Reintentos de llamadas al LLM",
+               [({"model": model}, rollup["retries"]) for model, rollup in models.items()])
+        metric("llm_tokens_total", "counter", "Tokens por modelo y tipo",
+               [({"model": model, "type": kind}, rollup[f"{kind}_tokens"])
+                for model, rollup in models.items() for kind in ("prompt", "completion", "cached")])
+        metric("llm_cost_usd_total", "counter", "Costo estimado en USD",
+               [({"model": model}, round(rollup["cost_usd"], 6)) for model, rollup in models.items()])
+        metric("llm_latency_seconds", "summary", "Latencia de las llamadas exitosas al LLM",
+               [({"model": model, "quantile": str(q)}, _percentile(values, q))
+                for model, values in latencies.items() for q in (0.5, 0.95) if values])
+        for model in latencies:
+            successful = models[model]["calls"] - models[model]["errors"]
+            lines.append(f'llm_latency_seconds_sum{{model="{model}"}} {round(models[model]["latency_seconds"], 3)}')
+            lines.append(f'llm_latency_seconds_count{{model="{model}"}} {successful}')
+        metric("llm_answers_total", "counter", "Respuestas por nivel (llm o sin llamada al LLM)",
+               [({"tier": tier}, count) for tier, count in answered.items()])
+        if circuit_open is not None:
+            metric("llm_circuit_open", "gauge", "1 si el circuito hacia el LLM está abierto o semiabierto",
+                   [({}, int(circuit_open))])
+        return "\n".join(lines) + "\n"
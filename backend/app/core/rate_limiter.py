@@ -0,0 +1,316 @@
+"""
+Limitador de Tasa para Llamadas al LLM
+------------------------------------
+Cubeta de tokens doble (solicitudes por minuto y tokens por minuto) que se
+aplica antes de cada llamada a OpenAI, en lugar de reintentar después de un
+error 429. Las solicitudes que no caben esperan en una cola con turno
+rotativo por usuario, de modo que un usuario con muchas consultas no acapara
+la cuota. Los límites se ajustan con las cabeceras x-ratelimit-* de cada
+respuesta y un 429 pausa a todas las solicitudes hasta el tiempo indicado.
+
+Opcionalmente, el estado de las cubetas se comparte entre procesos (workers
+de gunicorn) mediante un archivo bloqueado con flock.
+"""
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, Mapping, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+# Intervalo de sondeo de las solicitudes que no están al frente de la cola
+POLL_INTERVAL = 0.05
+
+class RateLimitTimeout(Exception):
+    """La solicitud esperó en la cola más del tiempo máximo permitido"""
+
+class _Bucket:
+    """Cubeta de tokens con recarga continua de capacity unidades por minuto"""
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.level = float(capacity)
+        self.updated = time.time()
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated)
+        self.level = min(self.capacity, self.level + elapsed * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Segundos hasta que haya amount unidades disponibles (0 si ya las hay)"""
+        amount = min(amount, self.capacity)
+        if self.level >= amount or self.capacity <= 0:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"capacity": self.capacity, "level": self.level, "updated": self.updated}
+
+    def load(self, data: Mapping[str, float]) -> None:
+        self.capacity = data["capacity"]
+        self.level = data["level"]
+        self.updated = data["updated"]
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Convierte una duración de las cabeceras de OpenAI ("1s", "6m0s", "20ms")
+    a segundos.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    factors = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(amount) * factors[unit] for amount, unit in parts)
+
+class LLMRateLimiter:
+    """Limitador compartido por todas las llamadas al LLM del proceso"""
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int,
+                 max_wait: float = 30.0, state_path: Optional[str] = None):
+        """
+        Inicializa el limitador
+
+        Args:
+            requests_per_minute: Solicitudes por minuto permitidas
+            tokens_per_minute: Tokens (prompt + respuesta) por minuto permitidos
+            max_wait: Segundos máximos de espera en la cola
+            state_path: Archivo para compartir el estado entre procesos (opcional)
+        """
+        self.max_wait = max_wait
+        self.state_path = state_path if state_path and fcntl is not None else None
+        if state_path and fcntl is None:
+            logger.warning("flock no disponible; el limitador de tasa no se compartirá entre procesos")
+
+        self._lock = threading.Lock()
+        self._requests = _Bucket(requests_per_minute)
+        self._tokens = _Bucket(tokens_per_minute)
+        self._blocked_until = 0.0
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._stats = {"granted": 0, "waited": 0, "wait_seconds": 0.0, "timeouts": 0, "throttled": 0}
+
+    def _shared(self, update):
+        """Ejecuta update sobre las cubetas, sincronizadas con el archivo compartido si existe"""
+        if self.state_path is None:
+            return update()
+        with open(self.state_path, "a+") as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                content = state_file.read()
+                if content:
+                    state = json.loads(content)
+                    self._requests.load(state["requests"])
+                    self._tokens.load(state["tokens"])
+                    self._blocked_until = state["blocked_until"]
+                result = update()
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(json.dumps({
+                    "requests": self._requests.to_dict(),
+                    "tokens": self._tokens.to_dict(),
+                    "blocked_until": self._blocked_until
+                }))
+                return result
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
+
+    def _try_take(self, tokens: int) -> float:
+        """Consume una solicitud y tokens si hay cupo; si no, devuelve los segundos a esperar"""
+        def update():
+            now = time.time()
+            if self._blocked_until > now:
+                return self._blocked_until - now
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            wait = max(self._requests.wait_for(1), self._tokens.wait_for(tokens))
+            if wait == 0:
+                self._requests.level -= 1
+                self._tokens.level -= min(tokens, self._tokens.capacity)
+            return wait
+        return self._shared(update)
+
+    def _poll(self, user_id: str, ticket: object, tokens: int) -> float:
+        """
+        Intenta conceder el turno de una solicitud. Sólo la solicitud al frente
+        de la cola (turno rotativo entre usuarios) puede consumir cupo.
+
+        Returns:
+            0 si se concedió; en otro caso, segundos a esperar antes de reintentar
+        """
+        with self._lock:
+            head_user = next(iter(self._queues))
+            if head_user != user_id or self._queues[head_user][0] is not ticket:
+                return POLL_INTERVAL
+            wait = self._try_take(tokens)
+            if wait > 0:
+                return wait
+            # Conceder y pasar el turno al siguiente usuario
+            queue = self._queues.pop(user_id)
+            queue.popleft()
+            if queue:
+                self._queues[user_id] = queue
+            self._stats["granted"] += 1
+            return 0.0
+
+    def _enqueue(self, user_id: str) -> object:
+        ticket = object()
+        with self._lock:
+            self._queues.setdefault(user_id, deque()).append(ticket)
+        return ticket
+
+    def _dequeue(self, user_id: str, ticket: object, waited: float, timed_out: bool) -> None:
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[user_id]
+            if waited > 0:
+                self._stats["waited"] += 1
+                self._stats["wait_seconds"] += waited
+            if timed_out:
+                self._stats["timeouts"] += 1
+
+    def acquire(self, user_id: Optional[str], tokens: int) -> None:
+        """
+        Espera (bloqueando el hilo) hasta que haya cupo para una solicitud.
+
+        Args:
+            user_id: Usuario que origina la solicitud (para el reparto equitativo)
+            tokens: Tokens estimados de la solicitud (prompt + respuesta máxima)
+
+        Raises:
+            RateLimitTimeout: Si la espera supera max_wait
+        """
+        user_id = user_id or "anonimo"
+        ticket = self._enqueue(user_id)
+        start = time.time()
+        timed_out = False
+        try:
+            while True:
+                wait = self._poll(user_id, ticket, tokens)
+                if wait == 0:
+                    return
+                remaining = start + self.max_wait - time.time()
+                if remaining <= 0:
+                    timed_out = True
+                    raise RateLimitTimeout(f"Sin cupo hacia el LLM después de {self.max_wait:.0f} segundos")
+                time.sleep(min(wait, remaining))
+        finally:
+            waited = time.time() - start
+            self._dequeue(user_id, ticket, waited if waited > POLL_INTERVAL else 0, timed_out)
+
+    async def aacquire(self, user_id: Optional[str], tokens: int) -> None:
+        """
+        Versión asíncrona de acquire: espera con asyncio.sleep. Con estado
+        compartido, cada sondeo toma el flock del archivo en un hilo para no
+        bloquear el bucle de eventos mientras otro proceso lo tiene.
+        """
+        user_id = user_id or "anonimo"
+        ticket = self._enqueue(user_id)
+        start = time.time()
+        timed_out = False
+        try:
+            while True:
+                if self.state_path is None:
+                    wait = self._poll(user_id, ticket, tokens)
+                else:
+                    wait = await asyncio.to_thread(self._poll, user_id, ticket, tokens)
+                if wait == 0:
+                    return
+                remaining = start + self.max_wait - time.time()
+                if remaining <= 0:
+                    timed_out = True
+                    raise RateLimitTimeout(f"Sin cupo hacia el LLM después de {self.max_wait:.0f} segundos")
+                await asyncio.sleep(min(wait, remaining))
+        finally:
+            waited = time.time() - start
+            self._dequeue(user_id, ticket, waited if waited > POLL_INTERVAL else 0, timed_out)
+
+    def settle(self, reserved_tokens: int, used_tokens: Optional[int]) -> None:
+        """
+        Ajusta la cubeta de tokens con el consumo real de una solicitud.
+
+        Args:
+            reserved_tokens: Tokens descontados al conceder la solicitud
+            used_tokens: Tokens reportados por el proveedor (None si se desconocen)
+        """
+        if used_tokens is None:
+            return
+        def update():
+            self._tokens.refill(time.time())
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level + reserved_tokens - used_tokens)
+        with self._lock:
+            self._shared(update)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Adapta las cubetas a las cabeceras x-ratelimit-* de OpenAI: adopta los
+        límites reales de la cuenta y nunca supone más cupo del que queda.
+        """
+        def read(name: str) -> Optional[float]:
+            try:
+                value = headers.get(name)
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        limits = {
+            self._requests: (read("x-ratelimit-limit-requests"), read("x-ratelimit-remaining-requests")),
+            self._tokens: (read("x-ratelimit-limit-tokens"), read("x-ratelimit-remaining-tokens")),
+        }
+        if all(limit is None and remaining is None for limit, remaining in limits.values()):
+            return
+
+        def update():
+            now = time.time()
+            for bucket, (limit, remaining) in limits.items():
+                bucket.refill(now)
+                if limit:
+                    bucket.capacity = limit
+                if remaining is not None:
+                    bucket.level = min(bucket.level, remaining)
+        with self._lock:
+            self._shared(update)
+
+    def penalize(self, retry_after: float) -> None:
+        """
+        Registra un 429: ninguna solicitud sale hasta que pase retry_after.
+
+        Args:
+            retry_after: Segundos de pausa
+        """
+        def update():
+            self._blocked_until = max(self._blocked_until, time.time() + retry_after)
+            self._requests.level = min(self._requests.level, 0.0)
+        with self._lock:
+            self._shared(update)
+            self._stats["throttled"] += 1
+        logger.warning(f"Límite de tasa del proveedor alcanzado; solicitudes en pausa por {retry_after:.1f} segundos")
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve los límites vigentes y las métricas de espera"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+            stats["queued"] = sum(len(queue) for queue in self._queues.values())
+            stats["queued_users"] = len(self._queues)
+            stats["requests_per_minute"] = self._requests.capacity
+            stats["tokens_per_minute"] = self._tokens.capacity
+            stats["paused_for"] = round(max(0.0, self._blocked_until - time.time()), 3)
+        return stats
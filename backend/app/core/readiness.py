@@ -0,0 +1,61 @@
+"""
+Estado de Preparación de la Aplicación
+-----------------------------------
+Registra los componentes que deben calentarse al arrancar (índice de búsqueda,
+datos de NLTK, caché de consultas) para que el endpoint de readiness sólo
+reporte "ready" cuando el worker puede atender búsquedas sin arranque en frío.
+"""
+import logging
+import threading
+import time
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+class Readiness:
+    """Registro de componentes pendientes de calentamiento"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._components = {}
+        self._started_at = time.time()
+
+    def register(self, name):
+        """Registra un componente que debe completar su calentamiento"""
+        with self._lock:
+            self._components[name] = {"status": "pending", "detail": None}
+        logger.info(f"Componente '{name}' registrado para calentamiento")
+
+    def mark_ready(self, name, detail=None):
+        """Marca un componente como listo"""
+        with self._lock:
+            self._components[name] = {"status": "ready", "detail": detail}
+        logger.info(f"Componente '{name}' listo")
+
+    def mark_failed(self, name, error):
+        """
+        Marca un componente cuyo calentamiento falló. No bloquea la
+        preparación: el worker atenderá peticiones en frío en lugar de
+        quedar fuera del balanceador indefinidamente.
+        """
+        with self._lock:
+            detail = str(error).splitlines()[0] if str(error) else repr(error)
+            self._components[name] = {"status": "failed", "detail": detail}
+        logger.warning(f"Calentamiento de '{name}' fallido: {error}")
+
+    @property
+    def is_ready(self):
+        with self._lock:
+            return all(c["status"] != "pending" for c in self._components.values())
+
+    def status(self):
+        """Devuelve el estado de preparación de todos los componentes"""
+        with self._lock:
+            components = {name: dict(state) for name, state in self._components.items()}
+        return {
+            "ready": all(c["status"] != "pending" for c in components.values()),
+            "uptime_seconds": round(time.time() - self._started_at, 1),
+            "components": components
+        }
+
+# Crear instancia global
+readiness = Readiness()
@@ -0,0 +1,269 @@
+"""
+Resiliencia frente al Proveedor del LLM
+-------------------------------------
+- CircuitBreaker: tras varias fallas consecutivas del proveedor deja de
+  enviarle solicitudes durante un tiempo (circuito abierto) y luego permite
+  una sola solicitud de prueba (semiabierto) antes de volver a cerrarse.
+- RequestHedger: si una solicitud tarda más que el percentil 95 de las
+  latencias recientes, lanza una segunda solicitud idéntica y se queda con
+  la primera que responda, recortando la cola de latencias.
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """Interruptor de circuito por fallas consecutivas"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Inicializa el interruptor
+
+        Args:
+            failure_threshold: Fallas consecutivas que abren el circuito
+            reset_timeout: Segundos que el circuito permanece abierto antes de la prueba
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._stats = {"trips": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.time())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        elif self._state == self.HALF_OPEN and self._probe_in_flight and now - self._probe_started >= self.reset_timeout:
+            # La prueba terminó sin resultado (cancelada o sin cupo): permitir otra
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Indica si una solicitud puede ir al proveedor. En estado semiabierto
+        sólo se permite una solicitud de prueba a la vez.
+        """
+        with self._lock:
+            now = time.time()
+            state = self._current_state(now)
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_started = now
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self) -> None:
+        """Registra una respuesta correcta del proveedor (cierra el circuito)"""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Circuito del proveedor LLM cerrado nuevamente")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Registra una falla del proveedor; abre el circuito al llegar al umbral"""
+        with self._lock:
+            self._failures += 1
+            state = self._current_state(time.time())
+            if state == self.HALF_OPEN or (state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._probe_in_flight = False
+                self._stats["trips"] += 1
+                logger.warning(
+                    f"Circuito del proveedor LLM abierto tras {self._failures} fallas consecutivas "
+                    f"({self.reset_timeout:.0f} segundos)"
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve el estado del circuito y sus contadores"""
+        with self._lock:
+            now = time.time()
+            state = self._current_state(now)
+            stats = dict(self._stats)
+            stats["state"] = state
+            stats["consecutive_failures"] = self._failures
+            stats["open_for"] = round(max(0.0, self._opened_at + self.reset_timeout - now), 1) if state == self.OPEN else 0.0
+        return stats
+
+class RequestHedger:
+    """Solicitudes de respaldo tras una espera basada en el percentil 95"""
+    def __init__(self, enabled: bool = True, min_delay: float = 1.0,
+                 window: int = 200, min_samples: int = 20, max_workers: int = 32):
+        """
+        Inicializa el hedger
+
+        Args:
+            enabled: Si es False, las solicitudes se ejecutan sin respaldo
+            min_delay: Espera mínima en segundos antes de lanzar el respaldo
+            window: Latencias recientes consideradas para el percentil
+            min_samples: Muestras necesarias antes de empezar a lanzar respaldos
+            max_workers: Hilos para solicitudes síncronas con respaldo
+        """
+        self.enabled = enabled
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._max_workers = max_workers
+        self._stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+
+    def record(self, latency: float) -> None:
+        """Registra la latencia de una solicitud exitosa"""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def delay(self) -> Optional[float]:
+        """Espera antes del respaldo (None si no hay muestras suficientes o está desactivado)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return max(self.min_delay, p95)
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _timed(self, fn: Callable[[], Any]) -> Any:
+        start = time.time()
+        result = fn()
+        self.record(time.time() - start)
+        return result
+
+    def run(self, fn: Callable[[], Any], hedge_acquire: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Ejecuta fn y, si tarda más que delay(), lanza una segunda ejecución en
+        otro hilo. Devuelve el primer resultado exitoso; si ambas fallan, se
+        propaga la última excepción. La ejecución perdedora no se interrumpe,
+        pero su resultado se descarta. Sólo se mide la duración de fn: el cupo
+        de la solicitud principal se obtiene antes de llamar a run.
+
+        Args:
+            fn: Función que realiza la solicitud
+            hedge_acquire: Obtiene cupo para el respaldo antes de lanzarlo (opcional)
+
+        Returns:
+            Resultado de la primera ejecución exitosa
+        """
+        self._count("requests")
+        delay = self.delay()
+        if delay is None:
+            return self._timed(fn)
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="llm-hedge")
+        primary = self._executor.submit(self._timed, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        def hedged():
+            if hedge_acquire is not None:
+                hedge_acquire()
+            return self._timed(fn)
+
+        logger.info(f"Solicitud al LLM sin respuesta tras {delay:.2f} segundos; lanzando respaldo")
+        self._count("hedged")
+        hedge = self._executor.submit(hedged)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def arun(self, fn: Callable[[], Awaitable[Any]],
+                   hedge_acquire: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """
+        Versión asíncrona de run: el respaldo es otra tarea y la perdedora se cancela.
+
+        Args:
+            fn: Función que devuelve la corrutina de la solicitud
+            hedge_acquire: Función que devuelve la corrutina que obtiene cupo para el respaldo (opcional)
+
+        Returns:
+            Resultado de la primera ejecución exitosa
+        """
+        async def timed():
+            start = time.time()
+            result = await fn()
+            self.record(time.time() - start)
+            return result
+
+        async def hedged():
+            if hedge_acquire is not None:
+                await hedge_acquire()
+            return await timed()
+
+        self._count("requests")
+        delay = self.delay()
+        if delay is None:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            logger.info(f"Solicitud al LLM sin respuesta tras {delay:.2f} segundos; lanzando respaldo")
+            self._count("hedged")
+            hedge = asyncio.ensure_future(hedged())
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve la espera vigente y los contadores de respaldos"""
+        delay = self.delay()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["samples"] = len(self._latencies)
+        stats["hedge_delay"] = round(delay, 3) if delay is not None else None
+        return stats
@@ -0,0 +1,114 @@
+"""
+Coalescencia de Llamadas Idénticas (single-flight)
+-----------------------------------------------
+Permite que varias peticiones concurrentes con la misma clave compartan una
+única ejecución: la primera ejecuta la función y las demás esperan su
+resultado (o su excepción). Se usa para no repetir llamadas costosas al LLM
+cuando muchos usuarios preguntan lo mismo a la vez.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+# Configurar logger
+logger = logging.getLogger(__name__)
+
+class _Call:
+    """Ejecución en curso compartida por las peticiones síncronas"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Registro de ejecuciones en curso por clave"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[str, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Ejecuta fn una sola vez por clave entre hilos concurrentes.
+
+        Args:
+            key: Clave de la ejecución
+            fn: Función a ejecutar
+
+        Returns:
+            Resultado de fn (compartido con las peticiones que esperaban)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            logger.info(f"Esperando ejecución en curso para la clave {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Versión asíncrona de do: la corrutina se ejecuta en una tarea
+        independiente que esperan todas las peticiones con la misma clave. Si
+        cualquiera de ellas se cancela (incluida la primera), la ejecución
+        continúa para las demás.
+
+        Args:
+            key: Clave de la ejecución
+            fn: Función que devuelve la corrutina a ejecutar
+
+        Returns:
+            Resultado de la corrutina (compartido con las peticiones que esperaban)
+        """
+        task = self._async_calls.get(key)
+        if task is not None and not task.done():
+            self.coalesced += 1
+            logger.info(f"Esperando ejecución en curso para la clave {key}")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._async_calls[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda done, key=key: self._finish_async(key, done))
+        # shield: cancelar una petición no cancela la ejecución compartida
+        return await asyncio.shield(task)
+
+    def _finish_async(self, key: str, task: "asyncio.Task") -> None:
+        """Retira la ejecución terminada del registro"""
+        if self._async_calls.get(key) is task:
+            del self._async_calls[key]
+        # Evitar el aviso de excepción no recuperada cuando nadie esperaba
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve el número de ejecuciones reales y de peticiones coalescidas"""
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": in_flight + len(self._async_calls)
+        }
@@ -15,4 +15,7 @@ from app.models.feedback_usuario import FeedbackUsuario
 from app.models.calificacion import Calificacion
 from app.models.metrica_uso import MetricaUso
 from app.models.mensaje import Mensaje
-from app.models.factura import Factura 
\ No newline at end of file
+from app.models.factura import Factura 
+from app.models.legal_document import LegalDocument
+from app.models.corpus_generation import CorpusGeneration
+from app.models.query_job import QueryJob
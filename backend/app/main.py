@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse
 from app.core.config import settings
+from app.core.readiness import readiness
+import asyncio
 import logging
 
 # Configuración de logging primero
@@ -66,6 +68,34 @@ app.add_middleware(
 
 logger.info("✅ CORS configurado exitosamente")
 
+def warmup_search_services():
+    """
+    Calienta los servicios de búsqueda registrados (índice BM25, datos de NLTK
+    y caché de consultas recientes) y marca el componente como listo.
+    Se ejecuta en un hilo para no bloquear el bucle de eventos: /health sigue
+    respondiendo mientras /healthz indica que el worker aún no está listo.
+    """
+    import config
+    from app.db.database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        summary = {}
+        for name in ("search_service", "bm25_service"):
+            service = registry.get_service(name)
+            if service is None:
+                continue
+            if name == "bm25_service":
+                summary[name] = service.warmup(db, max_queries=config.SEARCH_WARMUP_QUERIES)
+            else:
+                summary[name] = service.warmup(db)
+        readiness.mark_ready("search_index", summary)
+    except Exception as e:
+        logger.error(f"❌ Error durante el calentamiento de búsqueda: {str(e)}")
+        readiness.mark_failed("search_index", e)
+    finally:
+        db.close()
+
 # Event handler para ejecutar seed al iniciar la aplicación
 @app.on_event("startup")
 async def startup_event():
@@ -102,23 +132,110 @@ async def startup_event():
     except Exception as e:
         logger.error(f"❌ Error durante startup: {str(e)}")
         # No interrumpir el inicio de la aplicación por errores de seed
+    
+    # Cargar los tokenizadores en un hilo: la primera carga descarga sus archivos
+    import config
+    from app.services.context_packer import load_encoders
+    asyncio.get_running_loop().run_in_executor(
+        None, load_encoders,
+        [None, config.GPT_MODEL, config.MODEL_ROUTER_SIMPLE_MODEL or None, config.MODEL_ROUTER_COMPLEX_MODEL or None]
+    )
+    
+    # Calentar índices de búsqueda en segundo plano antes de reportar readiness
+    if config.SEARCH_WARMUP_ENABLED:
+        readiness.register("search_index")
+        asyncio.get_running_loop().run_in_executor(None, warmup_search_services)
+        logger.info("🔥 Calentamiento de búsqueda iniciado en segundo plano")
+
+    # Workers de la cola de consultas de /queries dentro de la API
+    if config.QUERY_WORKERS_EMBEDDED:
+        from app.services.query_worker import QueryWorkerPool
+        query_queue = registry.get_service("query_queue")
+        if query_queue is not None:
+            from app.services.query_events import QueryEventPublisher
+            pool = QueryWorkerPool(
+                query_queue,
+                concurrency=config.QUERY_WORKERS,
+                poll_interval=config.QUERY_WORKER_POLL_INTERVAL,
+                events=QueryEventPublisher(settings.REDIS_URL, enabled=config.QUERY_EVENTS_ENABLED)
+            )
+            registry.register_service("query_worker_pool", pool)
+            await pool.start()
         
     logger.info("✅ Startup completado")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Liberar recursos compartidos al apagar la aplicación"""
+    # Detener los workers de consultas; las que queden en curso vuelven a la cola al vencer su arriendo
+    query_worker_pool = registry.get_service("query_worker_pool")
+    if query_worker_pool is not None:
+        await query_worker_pool.stop()
+        if query_worker_pool.events is not None:
+            await query_worker_pool.events.close()
+
+    from app.services.ai_service import close_async_http_client
+    await close_async_http_client()
+
+    bm25_service = registry.get_service("bm25_service")
+    if bm25_service is not None and hasattr(bm25_service, "close"):
+        bm25_service.close()
+
+    # Detener los trabajos de generación masiva (se reanudan con POST /bulk/{job_id}/resume)
+    bulk_jobs = registry.get_service("bulk_jobs")
+    if bulk_jobs is not None:
+        await bulk_jobs.stop()
+
+    # Escribir las consultas pendientes del registro de preguntas frecuentes
+    answer_store = registry.get_service("answer_store")
+    if answer_store is not None:
+        answer_store.flush()
+
 # Ruta raíz
 @app.get("/")
 def read_root():
     return {"status": "online", "message": "LegalAssista API funcionando correctamente"}
 
-# Endpoint health-check
+# Endpoint health-check (liveness: el proceso responde)
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-# Endpoint healthz para Kubernetes
+@app.get("/livez")
+def livez():
+    return {"status": "ok"}
+
+# Endpoint healthz para Kubernetes (readiness: el worker puede atender búsquedas)
 @app.get("/healthz")
 def healthz():
-    return {"status": "ok"}
+    from app.services.ai_service import get_llm_status
+    status = readiness.status()
+    # Estado del circuito hacia el LLM (informativo: un circuito abierto no saca al worker del
+    # balanceador). Las métricas internas están en /api/admin/llm-usage
+    status["llm"] = get_llm_status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "starting", **status})
+    return {"status": "ok", **status}
+
+@app.get("/readyz")
+def readyz():
+    return healthz()
+
+# Métricas de uso del LLM en formato Prometheus (tokens, costo, latencia, respuestas por nivel).
+# Exponen costos y volumen de uso: requieren METRICS_TOKEN (sin token configurado no existen)
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    import hmac
+    import config
+    from app.core.resilience import CircuitBreaker
+    from app.services.ai_service import circuit_breaker, llm_telemetry
+    if not config.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    authorization = request.headers.get("authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {config.METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido", headers={"WWW-Authenticate": "Bearer"})
+    circuit_open = circuit_breaker.state != CircuitBreaker.CLOSED
+    return PlainTextResponse(llm_telemetry.render_prometheus(circuit_open=circuit_open), media_type="text/plain; version=0.0.4")
 
 # Endpoint específico para probar CORS
 @app.get("/cors-test")
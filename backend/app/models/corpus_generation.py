@@ -0,0 +1,152 @@
+"""
+Modelo de Generación del Corpus
+------------------------------
+Este módulo define un contador de generación del corpus de documentos legales.
+Cada escritura confirmada sobre `legal_documents` incrementa el contador, de modo
+que los servicios de búsqueda pueden saber si su índice está desactualizado con
+una sola lectura por clave primaria en lugar de agregados sobre toda la tabla.
+
+Se detectan las escrituras hechas a través de una Session: objetos del ORM,
+actualizaciones y borrados masivos (query.update()/delete(), update(LegalDocument))
+y SQL textual que modifica `legal_documents`. Las escrituras hechas directamente
+sobre un Engine o una conexión, fuera de una Session, deben llamar a
+bump_corpus_generation() después de confirmarse.
+"""
+
+import re
+import logging
+import threading
+from sqlalchemy import Column, Integer, DateTime, event, update
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy import func as sqlfunc
+from sqlalchemy.orm import Session, object_session
+
+from app.db.base_class import Base
+from app.models.legal_document import LegalDocument
+
+logger = logging.getLogger(__name__)
+
+# Fila única que almacena el contador
+CORPUS_GENERATION_ROW_ID = 1
+
+# SQL textual que escribe sobre la tabla de documentos
+_RAW_DOCUMENT_WRITE = re.compile(
+    r"\b(insert\s+(or\s+\w+\s+)?into|update|delete\s+from|replace\s+into|truncate(\s+table)?)\s+[\"`\[]?legal_documents\b",
+    re.IGNORECASE
+)
+
+# Contador en memoria del proceso: se incrementa en cada commit que modifica
+# documentos, lo que permite detectar cambios locales sin consultar la base de datos
+_local_generation = 0
+_local_lock = threading.Lock()
+
+
+class CorpusGeneration(Base):
+    """Tabla de una sola fila con la generación actual del corpus legal"""
+    __tablename__ = "corpus_generation"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=sqlfunc.now(), onupdate=sqlfunc.now())
+
+    def __repr__(self):
+        return f"<CorpusGeneration(generation={self.generation})>"
+
+
+def local_generation() -> int:
+    """Devuelve la generación del corpus conocida por este proceso"""
+    return _local_generation
+
+
+def ensure_corpus_generation_table(bind) -> None:
+    """Crea la tabla del contador si todavía no existe"""
+    CorpusGeneration.__table__.create(bind, checkfirst=True)
+
+
+def get_corpus_generation(db: Session) -> int:
+    """
+    Lee la generación persistida del corpus.
+
+    Args:
+        db: Sesión de base de datos
+
+    Returns:
+        Generación actual (0 si la fila todavía no existe)
+    """
+    generation = (
+        db.query(CorpusGeneration.generation)
+        .filter(CorpusGeneration.id == CORPUS_GENERATION_ROW_ID)
+        .scalar()
+    )
+    return generation or 0
+
+
+def bump_corpus_generation(bind) -> None:
+    """
+    Incrementa el contador local y el persistido.
+    Los errores se registran pero no se propagan: una escritura de documentos
+    nunca debe fallar por no poder actualizar el contador.
+
+    Args:
+        bind: Engine o conexión sobre la que se confirmó la escritura
+    """
+    global _local_generation
+    with _local_lock:
+        _local_generation += 1
+
+    engine = getattr(bind, "engine", bind)
+    try:
+        with engine.begin() as conn:
+            ensure_corpus_generation_table(conn)
+            result = conn.execute(
+                update(CorpusGeneration)
+                .where(CorpusGeneration.id == CORPUS_GENERATION_ROW_ID)
+                .values(generation=CorpusGeneration.generation + 1)
+            )
+            if result.rowcount == 0:
+                conn.execute(
+                    CorpusGeneration.__table__.insert().values(
+                        id=CORPUS_GENERATION_ROW_ID, generation=1
+                    )
+                )
+    except Exception as e:
+        logger.error(f"Error al actualizar la generación del corpus: {str(e)}")
+
+
+def _mark_corpus_dirty(mapper, connection, target):
+    """Marca la sesión para incrementar la generación cuando se confirme"""
+    session = object_session(target)
+    if session is not None:
+        session.info["corpus_dirty"] = True
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(LegalDocument, _event_name, _mark_corpus_dirty)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_write(orm_execute_state):
+    """Marca la sesión ante escrituras masivas o SQL textual sobre los documentos"""
+    statement = orm_execute_state.statement
+    if isinstance(statement, TextClause):
+        dirty = bool(_RAW_DOCUMENT_WRITE.search(statement.text))
+    elif orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mappers = orm_execute_state.all_mappers
+        dirty = any(mapper.class_ is LegalDocument for mapper in mappers) or (
+            getattr(statement, "table", None) is LegalDocument.__table__
+        )
+    else:
+        dirty = False
+    if dirty:
+        orm_execute_state.session.info["corpus_dirty"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    if session.info.pop("corpus_dirty", False):
+        bump_corpus_generation(session.get_bind())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("corpus_dirty", None)
@@ -0,0 +1,52 @@
+"""
+Modelo de Trabajos de Consulta
+-----------------------------
+Cola persistente de las consultas de /queries. Cada fila es una consulta y
+su resultado; los workers la reservan con un arriendo (lease) con
+vencimiento, de modo que una consulta cuyo worker murió vuelve a la cola.
+"""
+
+from sqlalchemy import Column, String, Text, Integer, Float, Boolean, DateTime, Index
+from sqlalchemy import func as sqlfunc
+
+from app.db.base_class import Base
+
+
+class QueryJob(Base):
+    """Consulta encolada para búsqueda y generación de respuesta en segundo plano"""
+    __tablename__ = "query_jobs"
+
+    id = Column(String(36), primary_key=True)
+    query_text = Column(Text, nullable=False)
+    user_id = Column(String(100), nullable=True, index=True)
+    source = Column(String(20), nullable=False, default="web")
+
+    # Estado de la cola (valores de QueryStatus)
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime, nullable=False)  # No antes de esta fecha (espera entre reintentos)
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    # Resultado
+    response_text = Column(Text, nullable=True)
+    sources = Column(Text, nullable=True)  # Fuentes como JSON
+    confidence_score = Column(Float, nullable=True)
+    needs_human_review = Column(Boolean, nullable=False, default=False)
+    review_reason = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, server_default=sqlfunc.now())
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_query_jobs_status_available", "status", "available_at"),
+    )
+
+    def __repr__(self):
+        return f"<QueryJob(id={self.id}, status={self.status}, attempts={self.attempts})>"
+
+
+def ensure_query_jobs_table(bind) -> None:
+    """Crea la tabla de la cola si todavía no existe"""
+    QueryJob.__table__.create(bind, checkfirst=True)
@@ -74,4 +74,7 @@ class SearchQuery(BaseModel):
     query: str = Field(..., min_length=3, description="Consulta de búsqueda")
     document_type: Optional[DocumentType] = Field(None, description="Filtrar por tipo de documento")
     category: Optional[str] = Field(None, description="Filtrar por categoría")
-    limit: Optional[int] = Field(10, ge=1, le=100, description="Número máximo de resultados") 
\ No newline at end of file
+    subcategory: Optional[str] = Field(None, description="Filtrar por subcategoría")
+    year: Optional[int] = Field(None, description="Filtrar por año de emisión")
+    limit: Optional[int] = Field(10, ge=1, le=100, description="Número máximo de resultados")
+    cursor: Optional[str] = Field(None, description="Cursor opaco para obtener la página siguiente de resultados") 
\ No newline at end of file
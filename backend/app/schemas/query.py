@@ -31,7 +31,7 @@ class UserQuery(BaseModel):
     """Esquema para consultas de usuarios"""
     query_text: str = Field(..., min_length=5, description="Texto de la consulta del usuario")
     source: QuerySource = Field(default=QuerySource.WEB, description="Fuente de la consulta")
-    user_id: Optional[str] = Field(None, description="ID del usuario si está autenticado")
+    user_id: Optional[str] = Field(None, description="Obsoleto e ignorado: el usuario se toma del token de autenticación")
     metadata: Optional[Dict[str, Any]] = Field(None, description="Metadatos adicionales")
 
 
@@ -0,0 +1,60 @@
+"""
+Generación Masiva de Respuestas (línea de comandos)
+--------------------------------------------------
+Responde todas las preguntas de un archivo y escribe los resultados en JSONL
+(una respuesta por línea). Si el proceso se interrumpe, volver a ejecutarlo
+con el mismo archivo de salida continúa desde donde quedó; las preguntas en
+las que falló el LLM se vuelven a intentar.
+
+Uso:
+    python -m app.scripts.bulk_generate preguntas.csv respuestas.jsonl
+    python -m app.scripts.bulk_generate preguntas.txt respuestas.jsonl --concurrency 16
+"""
+import sys
+import asyncio
+import logging
+import argparse
+
+from config import BULK_CONCURRENCY, BULK_RETRIEVAL_BATCH_SIZE
+from app.services.ai_service import AIService, close_async_http_client
+from app.services.bulk_generation import BulkGenerator, read_questions
+from app.services.search_service import SearchService
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def bulk_generate(questions_path: str, output_path: str, concurrency: int, batch_size: int):
+    """
+    Ejecuta la generación masiva.
+
+    Args:
+        questions_path: Archivo de preguntas (.txt, .csv o .jsonl)
+        output_path: Archivo JSONL de resultados
+        concurrency: Llamadas simultáneas al LLM
+        batch_size: Preguntas por lote de búsqueda
+
+    Returns:
+        Resumen de la ejecución
+    """
+    questions = read_questions(questions_path)
+    generator = BulkGenerator(SearchService(), AIService(), concurrency=concurrency, retrieval_batch_size=batch_size)
+    try:
+        return await generator.run(questions, output_path)
+    finally:
+        await close_async_http_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera respuestas para todas las preguntas de un archivo")
+    parser.add_argument("questions", help="Archivo de preguntas (.txt, .csv o .jsonl)")
+    parser.add_argument("output", help="Archivo JSONL de resultados (se reanuda si ya existe)")
+    parser.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY,
+                        help="Llamadas simultáneas al LLM")
+    parser.add_argument("--batch-size", type=int, default=BULK_RETRIEVAL_BATCH_SIZE,
+                        help="Preguntas por lote de búsqueda")
+    args = parser.parse_args()
+    summary = asyncio.run(bulk_generate(args.questions, args.output, args.concurrency, args.batch_size))
+    # Código de salida distinto de cero si quedaron preguntas por reintentar
+    sys.exit(1 if summary["failed"] else 0)
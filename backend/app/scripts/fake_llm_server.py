@@ -0,0 +1,300 @@
+"""
+Servidor LLM Simulado (compatible con OpenAI)
+-------------------------------------------
+Servidor local y determinista que imita POST /v1/chat/completions de OpenAI
+(con y sin streaming) para pruebas de carga e integración sin gastar tokens
+ni salir a la red. Permite configurar:
+- Distribución de latencia hasta el primer token (fija, uniforme o lognormal)
+- Velocidad de generación en tokens por segundo
+- Inyección de errores: 429 (con retry-after), tiempos de espera agotados,
+  errores 500 y errores de longitud de contexto
+- Límite de solicitudes por minuto con cabeceras x-ratelimit-*
+- Caché de prefijos del proveedor: como OpenAI, los prefijos de prompt ya
+  vistos (desde 1024 tokens, en bloques de 128) se reportan en
+  usage.prompt_tokens_details.cached_tokens
+
+Con la misma semilla y el mismo orden de solicitudes, las latencias y los
+errores inyectados se repiten; el texto de la respuesta depende sólo del prompt.
+
+Uso:
+    FAKE_LLM_PORT=8099 FAKE_LLM_RATE_429=0.05 python -m app.scripts.fake_llm_server
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=sk-fake uvicorn app.main:app
+
+La configuración se puede cambiar en caliente con POST /_config y una
+solicitud puede forzar un error con la cabecera x-fake-llm-error
+(429, timeout, 500 o context_length).
+"""
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import deque, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from app.services.context_packer import count_tokens
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Vocabulario para construir respuestas deterministas
+_VOCABULARY = (
+    "el trabajador tiene derecho a la indemnización según el contrato de trabajo "
+    "y la ley laboral vigente sobre despido sin justa causa vacaciones cesantías "
+    "prima de servicios salario mínimo jornada horas extras liquidación"
+).split()
+
+# Granularidad y tamaño del caché de prefijos simulado
+PREFIX_CACHE_BLOCK_TOKENS = 128
+PREFIX_CACHE_SIZE = 10000
+
+class FakeLLMSettings(BaseModel):
+    """Parámetros del servidor simulado (variables de entorno FAKE_LLM_*)"""
+    latency: str = "lognormal"  # fixed | uniform | lognormal
+    latency_median: float = 0.8  # Segundos hasta el primer token (mediana)
+    latency_spread: float = 0.5  # Sigma (lognormal) o semiamplitud en segundos (uniform)
+    tokens_per_second: float = 60.0  # Velocidad de generación (0 = instantánea)
+    output_tokens: int = 80  # Tokens de la respuesta (limitados por max_tokens)
+    context_tokens: int = 16385  # Contexto máximo del modelo simulado
+    requests_per_minute: int = 0  # Límite del servidor (0 = sin límite)
+    rate_429: float = 0.0  # Probabilidad de responder 429
+    rate_timeout: float = 0.0  # Probabilidad de no responder (tiempo agotado en el cliente)
+    rate_500: float = 0.0  # Probabilidad de responder 500
+    timeout_seconds: float = 600.0  # Espera de las solicitudes que simulan un tiempo agotado
+    prefix_cache_min_tokens: int = 1024  # Prefijo mínimo reutilizable del caché de prompts (0 = sin caché)
+    seed: int = 42
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMSettings":
+        values = {}
+        for name, field in cls.model_fields.items():
+            value = os.environ.get(f"FAKE_LLM_{name.upper()}")
+            if value is not None:
+                values[name] = field.annotation(value)
+        return cls(**values)
+
+class FakeLLM:
+    """Estado del servidor: configuración, generador aleatorio y contadores"""
+    def __init__(self, settings: FakeLLMSettings):
+        self._lock = threading.Lock()
+        self.configure(settings)
+
+    def configure(self, settings: FakeLLMSettings) -> None:
+        with self._lock:
+            self.settings = settings
+            self._random = random.Random(settings.seed)
+            self._window = deque()
+            self._prefixes = OrderedDict()
+            self.stats = {"requests": 0, "completed": 0, "streamed": 0, "429": 0, "timeout": 0, "500": 0,
+                          "context_length": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+    def count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    def cached_tokens(self, prompt: str, prompt_tokens: int) -> int:
+        """Tokens del prefijo más largo del prompt ya visto; registra los prefijos del prompt"""
+        min_tokens = self.settings.prefix_cache_min_tokens
+        if not min_tokens or prompt_tokens < min_tokens:
+            return 0
+        chars_per_token = len(prompt) / prompt_tokens
+        cached = 0
+        with self._lock:
+            for block_end in range(min_tokens, prompt_tokens + 1, PREFIX_CACHE_BLOCK_TOKENS):
+                digest = hashlib.sha256(prompt[:int(block_end * chars_per_token)].encode("utf-8")).hexdigest()
+                if digest in self._prefixes:
+                    cached = block_end
+                    self._prefixes.move_to_end(digest)
+                else:
+                    self._prefixes[digest] = True
+            while len(self._prefixes) > PREFIX_CACHE_SIZE:
+                self._prefixes.popitem(last=False)
+        return cached
+
+    def draw(self) -> Dict[str, Any]:
+        """Sortea la latencia y el error inyectado de una solicitud"""
+        with self._lock:
+            settings = self.settings
+            self.stats["requests"] += 1
+            if settings.latency == "fixed":
+                latency = settings.latency_median
+            elif settings.latency == "uniform":
+                latency = self._random.uniform(settings.latency_median - settings.latency_spread,
+                                               settings.latency_median + settings.latency_spread)
+            else:
+                latency = self._random.lognormvariate(0, settings.latency_spread) * settings.latency_median
+            roll = self._random.random()
+            if roll < settings.rate_429:
+                error = "429"
+            elif roll < settings.rate_429 + settings.rate_timeout:
+                error = "timeout"
+            elif roll < settings.rate_429 + settings.rate_timeout + settings.rate_500:
+                error = "500"
+            else:
+                error = None
+
+            # Límite de solicitudes por minuto del servidor (ventana deslizante)
+            now = time.time()
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            remaining = None
+            reset = 0.0
+            if settings.requests_per_minute:
+                if error is None and len(self._window) >= settings.requests_per_minute:
+                    error = "429"
+                elif error is None:
+                    self._window.append(now)
+                remaining = max(0, settings.requests_per_minute - len(self._window))
+                reset = 60 - (now - self._window[0]) if self._window else 0.0
+        return {"latency": max(0.0, latency), "error": error, "remaining": remaining, "reset": reset}
+
+fake_llm = FakeLLM(FakeLLMSettings.from_env())
+app = FastAPI(title="Servidor LLM Simulado")
+
+def _rate_limit_headers(draw: Dict[str, Any]) -> Dict[str, str]:
+    settings = fake_llm.settings
+    if not settings.requests_per_minute:
+        return {}
+    return {
+        "x-ratelimit-limit-requests": str(settings.requests_per_minute),
+        "x-ratelimit-remaining-requests": str(draw["remaining"]),
+        "x-ratelimit-reset-requests": f"{draw['reset']:.3f}s"
+    }
+
+def _error(status_code: int, message: str, error_type: str, code: str, headers: Optional[Dict[str, str]] = None):
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": code}},
+        headers=headers
+    )
+
+def _answer_tokens(prompt: str, total: int) -> List[str]:
+    """Respuesta determinista (depende sólo del prompt) que cita [Doc1] e incluye la confianza"""
+    generator = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    words = ["Según", "[Doc1],"] + [generator.choice(_VOCABULARY) for _ in range(max(0, total - 6))]
+    return [word + " " for word in words] + ["\nCONFIANZA: 0.8"]
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "fake-llm", "object": "model", "created": 0, "owned_by": "local"}]}
+
+@app.get("/_stats")
+async def stats():
+    """Contadores del servidor para los informes de carga"""
+    return fake_llm.stats
+
+@app.post("/_config")
+async def configure(settings: FakeLLMSettings):
+    """Reemplaza la configuración y reinicia el generador aleatorio y los contadores"""
+    fake_llm.configure(settings)
+    logger.info(f"Configuración actualizada: {settings.model_dump()}")
+    return settings
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    settings = fake_llm.settings
+    draw = fake_llm.draw()
+    error = request.headers.get("x-fake-llm-error") or draw["error"]
+    headers = _rate_limit_headers(draw)
+
+    messages = body.get("messages", [])
+    prompt = "\n".join(str(message.get("content", "")) for message in messages)
+    prompt_tokens = count_tokens(prompt) + 4 * len(messages)
+    max_tokens = int(body.get("max_tokens") or settings.output_tokens)
+    completion_tokens = min(settings.output_tokens, max_tokens)
+
+    if prompt_tokens + max_tokens > settings.context_tokens or error == "context_length":
+        fake_llm.count("context_length")
+        return _error(
+            400,
+            f"This model's maximum context length is {settings.context_tokens} tokens. However, you requested "
+            f"{prompt_tokens + max_tokens} tokens ({prompt_tokens} in the messages, {max_tokens} in the completion).",
+            "invalid_request_error", "context_length_exceeded"
+        )
+    if error == "429":
+        fake_llm.count("429")
+        retry_after = max(1.0, draw["reset"]) if settings.requests_per_minute else 1.0
+        return _error(429, "Rate limit reached for requests", "requests", "rate_limit_exceeded",
+                      {**headers, "retry-after": f"{retry_after:.0f}"})
+    if error == "timeout":
+        fake_llm.count("timeout")
+        await asyncio.sleep(settings.timeout_seconds)
+        return _error(504, "Gateway timeout", "server_error", "timeout")
+    if error == "500":
+        fake_llm.count("500")
+        await asyncio.sleep(draw["latency"])
+        return _error(500, "The server had an error while processing your request.", "server_error", None)
+
+    pieces = _answer_tokens(prompt, completion_tokens)
+    cached_tokens = fake_llm.cached_tokens(prompt, prompt_tokens)
+    fake_llm.count("prompt_tokens", prompt_tokens)
+    fake_llm.count("completion_tokens", completion_tokens)
+    fake_llm.count("cached_tokens", cached_tokens)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    model = body.get("model", "fake-llm")
+    created = int(time.time())
+    token_delay = 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens}
+    }
+
+    if body.get("stream"):
+        fake_llm.count("streamed")
+
+        async def stream():
+            await asyncio.sleep(draw["latency"])
+            for piece in pieces:
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(token_delay)
+            final = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = usage
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+            fake_llm.count("completed")
+
+        return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+    await asyncio.sleep(draw["latency"] + token_delay * completion_tokens)
+    fake_llm.count("completed")
+    return JSONResponse(
+        content={
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(pieces).strip()},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        },
+        headers=headers
+    )
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.environ.get("FAKE_LLM_PORT", "8099"))
+    logger.info(f"Iniciando servidor LLM simulado en el puerto {port}: {fake_llm.settings.model_dump()}")
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
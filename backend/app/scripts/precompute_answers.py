@@ -0,0 +1,174 @@
+"""
+Precálculo de Respuestas Frecuentes
+----------------------------------
+Trabajo fuera de línea que llena el almacén de respuestas precalculadas:
+1. Desactiva las respuestas cuyos documentos citados cambiaron
+2. Reúne las preguntas del registro de consultas de /ask y las de los cachés
+   de búsqueda (BM25 y búsqueda simple)
+3. Agrupa preguntas casi idénticas (similitud del vectorizador del caché semántico)
+4. Genera con generate_legal_response la respuesta de los grupos más
+   frecuentes y guarda una nueva versión para cada uno
+
+Uso:
+    python -m app.scripts.precompute_answers --top 300 --min-hits 3
+"""
+import os
+import sqlite3
+import logging
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from config import (
+    ANSWER_STORE_DB, PRECOMPUTE_TOP_N, PRECOMPUTE_MIN_HITS, PRECOMPUTE_CLUSTER_THRESHOLD
+)
+from app.db.database import SessionLocal
+from app.schemas.legal_document import SearchQuery
+from app.services.ai_service import AIService
+from app.services.answer_store import AnswerStore, normalize_question
+from app.services.search_service import SearchService
+from app.services.semantic_cache import SemanticAnswerCache, polarity_terms
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cachés de búsqueda de los que se extraen preguntas: (ruta, tabla)
+SEARCH_CACHES = [
+    (os.path.join("cache", "search_cache.db"), "query_cache"),
+    (os.path.join("cache", "bm25_search_cache.db"), "bm25_query_cache"),
+]
+
+def _cached_questions() -> List[str]:
+    """Preguntas presentes en los cachés de búsqueda"""
+    questions = []
+    for path, table in SEARCH_CACHES:
+        if not os.path.exists(path):
+            continue
+        try:
+            conn = sqlite3.connect(path)
+            questions.extend(row[0] for row in conn.execute(f"SELECT DISTINCT query_text FROM {table}"))
+            conn.close()
+        except Exception as e:
+            logger.warning(f"No se pudieron leer las preguntas de {path}: {str(e)}")
+    return questions
+
+def collect_questions(store: AnswerStore, limit: int) -> List[Tuple[str, int]]:
+    """
+    Frecuencia de cada pregunta: la del registro de consultas; las que sólo
+    aparecen en los cachés de búsqueda cuentan una vez.
+
+    Returns:
+        Lista [(pregunta, frecuencia)] de mayor a menor frecuencia
+    """
+    counts: Dict[str, Tuple[str, int]] = {}
+    for text, hits in store.top_questions(limit):
+        counts[normalize_question(text)] = (text, hits)
+    for text in _cached_questions():
+        key = normalize_question(text)
+        if key and key not in counts:
+            counts[key] = (text, 1)
+    return sorted(counts.values(), key=lambda item: -item[1])
+
+def cluster_questions(questions: List[Tuple[str, int]], threshold: float) -> List[Dict[str, object]]:
+    """
+    Agrupa preguntas casi idénticas. Cada pregunta (de mayor a menor
+    frecuencia) se une al grupo más parecido cuyo representante supera la
+    similitud indicada y tiene las mismas palabras de polaridad ("sin"/"con",
+    "no"...: todas las variantes de un grupo reciben la misma respuesta); si
+    no, inicia un grupo nuevo.
+
+    Returns:
+        Grupos {"question": representante, "variants": [...], "hits": total}
+        ordenados por frecuencia total
+    """
+    embedder = SemanticAnswerCache(max_entries=1)
+    clusters = []
+    centers = []
+    polarities = []
+    for text, hits in questions:
+        vector = embedder.embed(text)
+        if not vector.any():
+            continue
+        polarity = polarity_terms(text)
+        if centers:
+            similarities = np.array(centers) @ vector
+            similarities[[p != polarity for p in polarities]] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                clusters[best]["variants"].append(text)
+                clusters[best]["hits"] += hits
+                continue
+        centers.append(vector)
+        polarities.append(polarity)
+        clusters.append({"question": text, "variants": [text], "hits": hits})
+    return sorted(clusters, key=lambda cluster: -cluster["hits"])
+
+def precompute_answers(top: int, min_hits: int, threshold: float) -> Dict[str, int]:
+    """
+    Ejecuta el trabajo completo.
+
+    Args:
+        top: Número máximo de grupos de preguntas a precalcular
+        min_hits: Frecuencia mínima de un grupo
+        threshold: Similitud mínima para agrupar preguntas
+
+    Returns:
+        Resumen con las respuestas invalidadas, guardadas y omitidas
+    """
+    store = AnswerStore(ANSWER_STORE_DB)
+    search_service = SearchService()
+    ai_service = AIService()
+    summary = {"invalidated": 0, "clusters": 0, "saved": 0, "skipped": 0}
+
+    db = SessionLocal()
+    try:
+        summary["invalidated"] = store.invalidate_stale(db)
+
+        clusters = cluster_questions(collect_questions(store, top * 10), threshold)
+        clusters = [cluster for cluster in clusters if cluster["hits"] >= min_hits][:top]
+        summary["clusters"] = len(clusters)
+
+        for cluster in clusters:
+            question = cluster["question"]
+            search_results = search_service.search_documents(db, SearchQuery(query=question, limit=5))
+            if not search_results:
+                summary["skipped"] += 1
+                continue
+
+            response_text, confidence_score, cited_documents, needs_review = ai_service.generate_legal_response(
+                query_text=question,
+                search_results=search_results,
+                user_id="precompute_answers"
+            )
+            # Sólo se sirven sin revisión las respuestas confiables
+            if needs_review:
+                logger.info(f"Respuesta omitida (confianza {confidence_score:.2f}): {question}")
+                summary["skipped"] += 1
+                continue
+
+            doc_ids = [doc["id"] for doc in cited_documents] or [doc.get("document_id") for doc in search_results]
+            version = store.save(db, question, cluster["variants"], {
+                "response": response_text,
+                "references": cited_documents,
+                "confidence_score": confidence_score,
+                "needs_human_review": False,
+                "review_reason": None
+            }, doc_ids)
+            summary["saved"] += 1
+            logger.info(f"Respuesta precalculada v{version} ({cluster['hits']} consultas): {question}")
+    finally:
+        db.close()
+
+    logger.info(f"Precálculo completado: {summary}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalcula respuestas para las preguntas más frecuentes")
+    parser.add_argument("--top", type=int, default=PRECOMPUTE_TOP_N, help="Grupos de preguntas a precalcular")
+    parser.add_argument("--min-hits", type=int, default=PRECOMPUTE_MIN_HITS, help="Frecuencia mínima de un grupo")
+    parser.add_argument("--threshold", type=float, default=PRECOMPUTE_CLUSTER_THRESHOLD,
+                        help="Similitud mínima para agrupar preguntas (0-1)")
+    args = parser.parse_args()
+    precompute_answers(args.top, args.min_hits, args.threshold)
@@ -0,0 +1,74 @@
+"""
+Workers de Consultas (proceso independiente)
+-------------------------------------------
+Procesa la cola persistente de consultas de /queries fuera de la API. Útil
+para escalar los workers por separado de los procesos web (con
+QUERY_WORKERS_EMBEDDED=False en la API).
+
+Uso:
+    python -m app.scripts.query_worker
+    python -m app.scripts.query_worker --workers 8
+
+Al recibir SIGINT o SIGTERM deja de reservar consultas y espera a las que
+estén en curso; las que no terminen a tiempo vuelven a la cola al vencer su
+arriendo.
+"""
+import signal
+import asyncio
+import logging
+import argparse
+
+import config
+from app.core.config import settings
+from app.core.registry import registry
+from app.services.ai_service import close_async_http_client
+from app.services.query_events import QueryEventPublisher
+from app.services.query_queue import QueryJobQueue
+from app.services.query_worker import QueryWorkerPool
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run_workers(workers: int, shutdown_timeout: float) -> None:
+    """
+    Ejecuta el pool de workers hasta recibir una señal de terminación.
+
+    Args:
+        workers: Consultas procesadas a la vez
+        shutdown_timeout: Segundos de espera por las consultas en curso al detenerse
+    """
+    queue = QueryJobQueue(
+        lease_seconds=config.QUERY_JOB_LEASE_SECONDS,
+        max_attempts=config.QUERY_JOB_MAX_ATTEMPTS,
+        retry_delay=config.QUERY_JOB_RETRY_DELAY
+    )
+    registry.register_service("query_queue", queue)
+    events = QueryEventPublisher(settings.REDIS_URL, enabled=config.QUERY_EVENTS_ENABLED)
+    pool = QueryWorkerPool(queue, concurrency=workers, poll_interval=config.QUERY_WORKER_POLL_INTERVAL,
+                           events=events)
+    registry.register_service("query_worker_pool", pool)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await pool.start()
+    await stop.wait()
+    logger.info("Deteniendo workers de consultas...")
+    await pool.stop(timeout=shutdown_timeout)
+    await events.close()
+    await close_async_http_client()
+    logger.info(f"Workers detenidos: {pool.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Procesa la cola de consultas de /queries")
+    parser.add_argument("--workers", type=int, default=config.QUERY_WORKERS,
+                        help="Consultas procesadas a la vez")
+    parser.add_argument("--shutdown-timeout", type=float, default=30.0,
+                        help="Segundos de espera por las consultas en curso al detenerse")
+    args = parser.parse_args()
+    asyncio.run(run_workers(args.workers, args.shutdown_timeout))
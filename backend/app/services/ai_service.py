@@ -17,11 +17,13 @@ import os
 import json
 import re
 import time
+import asyncio
 import logging
 import hashlib
-from functools import lru_cache
-from typing import List, Dict, Any, Optional, Tuple, Union
-from openai import OpenAI
+import textwrap
+import httpx
+from typing import List, Dict, Any, Optional, Tuple, Union, AsyncIterator
+from openai import OpenAI, AsyncOpenAI
 from datetime import datetime
 
 import sys
@@ -32,18 +34,112 @@ if str(backend_dir) not in sys.path:
     sys.path.append(str(backend_dir))
 
 from config import (
-    OPENAI_API_KEY, GPT_MODEL, validate_config, 
+    OPENAI_API_KEY, OPENAI_BASE_URL, GPT_MODEL, validate_config, 
     ECONOMY_MODE, MAX_TOKENS_OUTPUT, MAX_DOCUMENTS, 
-    MAX_CHARS_PER_DOC, ENABLE_CACHE, CACHE_DIR
+    ENABLE_CACHE, CACHE_DIR, OPENAI_MAX_CONNECTIONS,
+    PROMPT_TOKEN_BUDGET, LEGAL_PROMPT_TOKEN_BUDGET,
+    LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_RATE_LIMIT_MAX_WAIT, LLM_RATE_LIMIT_STATE_FILE,
+    LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_TIMEOUT, LLM_HEDGING_ENABLED, LLM_HEDGE_MIN_DELAY,
+    RESPONSE_CACHE_TTL, RESPONSE_CACHE_MEMORY_SIZE, RESPONSE_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MIN_OVERLAP, SEMANTIC_CACHE_SIZE,
+    EXTRACTIVE_ANSWERS_ENABLED, EXTRACTIVE_ANSWER_THRESHOLD,
+    LLM_PRICES, LLM_TELEMETRY_MAX_USERS,
+    MODEL_ROUTING_ENABLED, MODEL_ROUTER_SIMPLE_MODEL, MODEL_ROUTER_COMPLEX_MODEL,
+    MODEL_ROUTER_SIMPLE_THRESHOLD, MODEL_ROUTER_COMPLEX_THRESHOLD
 )
+from app.core.llm_telemetry import LLMTelemetry
+from app.core.rate_limiter import LLMRateLimiter, RateLimitTimeout, parse_reset
+from app.core.resilience import CircuitBreaker, RequestHedger
+from app.core.single_flight import SingleFlight
 from app.schemas.legal_document import LegalDocumentResponse
 from app.schemas.query import QueryResponse, QueryStatus
+from app.services.answer_router import ExtractiveAnswerRouter
+from app.services.context_packer import count_tokens, pack_documents
+from app.services.model_router import ModelRouter
+from app.services.response_cache import ResponseCache
+from app.services.semantic_cache import SemanticAnswerCache
 
 # Configurar logging
 logger = logging.getLogger("ai_service")
 
-# Cache en memoria para respuestas
-@lru_cache(maxsize=50)
+# Caché de respuestas de dos niveles (memoria + SQLite compartido entre workers)
+response_cache = ResponseCache(
+    db_path=os.path.join(CACHE_DIR, "ai_responses.db"),
+    ttl_seconds=RESPONSE_CACHE_TTL,
+    memory_size=RESPONSE_CACHE_MEMORY_SIZE,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES
+)
+
+# Limitador de tasa hacia OpenAI compartido por todas las llamadas del proceso
+rate_limiter = LLMRateLimiter(
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    max_wait=LLM_RATE_LIMIT_MAX_WAIT,
+    state_path=LLM_RATE_LIMIT_STATE_FILE or None
+)
+
+# Mensaje cuando una solicitud no obtiene cupo hacia OpenAI a tiempo
+RATE_LIMIT_MESSAGE = "El servicio está recibiendo demasiadas consultas. Intenta de nuevo en unos momentos."
+
+# Interruptor de circuito y solicitudes de respaldo frente a OpenAI (por proceso)
+circuit_breaker = CircuitBreaker(
+    failure_threshold=LLM_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=LLM_CIRCUIT_RESET_TIMEOUT
+)
+hedger = RequestHedger(enabled=LLM_HEDGING_ENABLED, min_delay=LLM_HEDGE_MIN_DELAY)
+
+# Error devuelto sin llamar a OpenAI mientras el circuito está abierto
+CIRCUIT_OPEN_MESSAGE = "El servicio de IA no está disponible temporalmente."
+
+# Razón de revisión de las respuestas basadas sólo en documentos (circuito abierto)
+RETRIEVAL_ONLY_REASON = "Respuesta basada solo en documentos: servicio de IA no disponible"
+RETRIEVAL_ONLY_INTRO = (
+    "El asistente de IA no está disponible en este momento. "
+    "Estos son los fragmentos más relevantes de los documentos encontrados:"
+)
+
+# Respuestas de generate_legal_response sin generación (no se deben guardar como respuesta)
+NO_LEGAL_DOCUMENTS_MESSAGE = "No se encontraron documentos legales relevantes para tu consulta. Por favor, reformula tu pregunta o consulta a un especialista en derecho laboral."
+LEGAL_UNAVAILABLE_MESSAGE = "Lo siento, hay un problema técnico con nuestro servicio. Por favor, intenta más tarde o contacta a un especialista en derecho laboral para tu consulta."
+LEGAL_ERROR_MESSAGE = "Lo siento, no pude procesar tu consulta legal en este momento debido a un error técnico. Por favor, intenta nuevamente más tarde o consulta a un especialista en derecho laboral."
+
+# Tokens, latencia y costo estimado de las llamadas a OpenAI (por proceso)
+def _load_prices() -> Dict[str, Tuple[float, float]]:
+    try:
+        return {model: tuple(price) for model, price in json.loads(LLM_PRICES or "{}").items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"⚠️ LLM_PRICES inválido, se usan los precios por defecto: {str(e)}")
+        return {}
+
+llm_telemetry = LLMTelemetry(prices=_load_prices(), max_users=LLM_TELEMETRY_MAX_USERS)
+
+# Preguntas frecuentes que se responden con un pasaje, sin llamar a OpenAI
+answer_router = ExtractiveAnswerRouter(threshold=EXTRACTIVE_ANSWER_THRESHOLD, enabled=EXTRACTIVE_ANSWERS_ENABLED)
+
+# Modelo y presupuesto de tokens según la complejidad de la consulta
+model_router = ModelRouter(
+    default_model=GPT_MODEL,
+    simple_model=MODEL_ROUTER_SIMPLE_MODEL or None,
+    complex_model=MODEL_ROUTER_COMPLEX_MODEL or None,
+    simple_threshold=MODEL_ROUTER_SIMPLE_THRESHOLD,
+    complex_threshold=MODEL_ROUTER_COMPLEX_THRESHOLD,
+    enabled=MODEL_ROUTING_ENABLED
+)
+
+def get_llm_status() -> Dict[str, Any]:
+    """Estado público del acceso al LLM (/healthz): sólo el estado del circuito"""
+    return {"circuit_state": circuit_breaker.state}
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Métricas internas del acceso al LLM (administradores): circuito, respaldos, limitador de tasa y enrutamiento"""
+    return {
+        "circuit_breaker": circuit_breaker.stats(),
+        "hedging": hedger.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "extractive_answers": answer_router.stats(),
+        "model_routing": model_router.stats()
+    }
+
 def get_cached_response(query_hash: str) -> Optional[Dict[str, Any]]:
     """
     Recupera una respuesta desde la caché basada en el hash de la consulta
@@ -52,19 +148,9 @@ def get_cached_response(query_hash: str) -> Optional[Dict[str, Any]]:
         query_hash: Hash MD5 de la consulta
         
     Returns:
-        Datos de respuesta cacheados o None si no existe
+        Datos de respuesta cacheados o None si no existe o expiró
     """
-    try:
-        cache_file = os.path.join(CACHE_DIR, f"{query_hash}.json")
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                logger.info(f"✅ Respuesta recuperada de caché: {cache_file}")
-                return data
-    except Exception as e:
-        logger.error(f"❌ Error al leer caché: {str(e)}")
-    
-    return None
+    return response_cache.get(query_hash)
 
 def save_to_cache(query_hash: str, response_data: Dict[str, Any]) -> bool:
     """
@@ -77,15 +163,7 @@ def save_to_cache(query_hash: str, response_data: Dict[str, Any]) -> bool:
     Returns:
         True si se guardó correctamente, False en caso contrario
     """
-    try:
-        cache_file = os.path.join(CACHE_DIR, f"{query_hash}.json")
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(response_data, f, ensure_ascii=False, indent=2)
-            logger.info(f"✅ Respuesta guardada en caché: {cache_file}")
-        return True
-    except Exception as e:
-        logger.error(f"❌ Error al guardar en caché: {str(e)}")
-        return False
+    return response_cache.set(query_hash, response_data)
 
 def create_query_hash(query_text: str, search_results: List[Dict[str, Any]]) -> str:
     """
@@ -113,17 +191,162 @@ def create_query_hash(query_text: str, search_results: List[Dict[str, Any]]) ->
     # Generar hash
     return hashlib.md5(hash_input.encode('utf-8')).hexdigest()
 
+# Cliente HTTP asíncrono compartido por todas las instancias del servicio.
+# Se crea dentro del bucle de eventos que lo usa y se recrea si el bucle cambia.
+_async_http_client: Optional[httpx.AsyncClient] = None
+_async_http_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Obtiene el cliente HTTP asíncrono compartido, con un pool de conexiones
+    persistentes hacia la API de OpenAI.
+    
+    Returns:
+        Cliente httpx.AsyncClient del bucle de eventos actual
+    """
+    global _async_http_client, _async_http_loop
+    loop = asyncio.get_running_loop()
+    if _async_http_client is None or _async_http_client.is_closed or _async_http_loop is not loop:
+        _async_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+        _async_http_loop = loop
+    return _async_http_client
+
+async def close_async_http_client() -> None:
+    """Cierra el cliente HTTP asíncrono compartido (al apagar la aplicación)"""
+    global _async_http_client, _async_http_loop
+    if _async_http_client is not None and not _async_http_client.is_closed:
+        await _async_http_client.aclose()
+    _async_http_client = None
+    _async_http_loop = None
+
+def canonical_prompt(text: str) -> str:
+    """Texto de un prompt sin la indentación del código ni espacios al final de las líneas"""
+    return "\n".join(line.rstrip() for line in textwrap.dedent(text).strip().splitlines())
+
+# Los prompts empiezan con las instrucciones fijas y los documentos, idénticos byte
+# a byte entre llamadas, y terminan con la consulta y la fecha: así el proveedor
+# reutiliza el prefijo en caché cuando se repite el contexto
+RESPONSE_SYSTEM_PROMPT = canonical_prompt("""
+    Asistente legal colombiano. Responde basándote SOLO en los documentos proporcionados.
+    REGLAS: No inventes información. Sé breve y directo. Cita fuentes como [DocX].
+    Si no tienes suficiente información, indica: "No tengo suficiente información en los documentos proporcionados".
+    ESTRUCTURA: 1) Respuesta directa, 2) Referencias legales.
+    Al final evalúa tu confianza (0-1): "CONFIANZA: [puntuación]"
+""")
+
+RESPONSE_USER_PROMPT = canonical_prompt("""
+    Responde usando solo los DOCUMENTOS. Incluye citas [DocX].
+
+    DOCUMENTOS:
+    {documents}
+
+    CONSULTA: {query}
+""")
+
+LEGAL_SYSTEM_PROMPT = canonical_prompt("""
+    Eres un asistente legal especializado en derecho laboral colombiano con amplia experiencia jurídica.
+    Tu ÚNICA función es proporcionar respuestas precisas basadas EXCLUSIVAMENTE en los documentos legales proporcionados.
+
+    ## REGLAS FUNDAMENTALES (CRÍTICAS - DEBES SEGUIRLAS SIN EXCEPCIÓN):
+
+    1. NUNCA inventes información, leyes, artículos o interpretaciones que NO aparezcan explícitamente en los documentos proporcionados.
+    2. NUNCA utilices tu conocimiento general sobre leyes - SOLO puedes usar la información que aparece en los documentos.
+    3. Si los documentos proporcionados no contienen información suficiente, DEBES indicarlo claramente.
+    4. SIEMPRE cita las fuentes específicas usando el formato [DocX] después de cada afirmación legal importante.
+    5. SIEMPRE incluye referencias legales exactas (números de ley, artículos específicos) tal como aparecen en los documentos.
+
+    ## ESTRUCTURA OBLIGATORIA DE LA RESPUESTA:
+
+    **RESPUESTA DIRECTA**:
+    Comienza con una respuesta concisa y directa a la consulta legal.
+
+    **FUNDAMENTO LEGAL**:
+    Explica detalladamente el fundamento legal citando documentos específicos.
+
+    **REQUISITOS Y CONDICIONES** (si aplica):
+    Enumera requisitos, plazos o condiciones especiales.
+
+    **REFERENCIAS LEGALES**:
+    Lista completa de documentos citados con sus referencias legales exactas.
+    Ejemplo:
+    • [Doc1] Ley 1010 de 2006, Artículo 2 - Definición de acoso laboral
+    • [Doc2] Código Sustantivo del Trabajo, Artículo 62 - Terminación del contrato
+
+    ## CUANDO NO HAY INFORMACIÓN SUFICIENTE:
+
+    Si la información proporcionada es insuficiente para responder adecuadamente:
+    1. Indica específicamente qué información falta para responder completamente
+    2. Proporciona la información parcial que SÍ está disponible en los documentos
+    3. Asigna una puntuación de confianza baja (0.0-0.3)
+    4. Incluye este texto exacto al inicio: "ADVERTENCIA: La información disponible es limitada para responder completamente a esta consulta."
+
+    ## EVALUACIÓN DE CONFIANZA:
+
+    Al final de tu respuesta, evalúa tu confianza en una escala de 0 a 1:
+    - 0.0-0.3: Información muy insuficiente o no relevante
+    - 0.4-0.6: Información parcial con algunas lagunas importantes
+    - 0.7-0.9: Información suficiente con documentos relevantes
+    - 1.0: Información completa y precisa con documentos altamente relevantes
+
+    Al final, DEBES incluir tu evaluación en el siguiente formato exacto:
+    "CONFIANZA: [puntuación]"
+""")
+
+LEGAL_USER_PROMPT = canonical_prompt("""
+    ## INSTRUCCIONES ESPECÍFICAS
+
+    IMPORTANTE:
+    - Responde basándote ÚNICAMENTE en los documentos proporcionados.
+    - Si no encuentras información suficiente, indícalo claramente.
+    - Cita las fuentes exactas para cada afirmación legal.
+    - Utiliza un lenguaje claro y accesible para personas sin formación jurídica.
+    - Estructura tu respuesta según el formato requerido.
+    - Incluye la sección "REFERENCIAS LEGALES" con todas las fuentes utilizadas.
+
+    Recuerda evaluar la confianza de tu respuesta al final.
+
+    ## DOCUMENTOS LEGALES RELEVANTES
+
+    {documents}
+
+    ## CONSULTA LEGAL
+
+    {query}
+
+    Fecha de la consulta: {timestamp}
+""")
+
 class AIService:
     """Servicio para generación de respuestas basadas en IA"""
 
     def __init__(self):
         """Inicializa el cliente de OpenAI y configura el modelo"""
         self.api_key = OPENAI_API_KEY
+        self.base_url = OPENAI_BASE_URL or None
         self.model = GPT_MODEL
         self.client = None
+        self.async_client = None
+        self._async_http_client = None
         self.max_retries = 3
         self.retry_delay = 2  # segundos
         
+        # Peticiones idénticas en curso comparten una sola llamada a OpenAI
+        self.in_flight = SingleFlight()
+        
+        # Caché opcional de respuestas para consultas parecidas (paráfrasis)
+        self.semantic_cache = SemanticAnswerCache(
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            min_overlap=SEMANTIC_CACHE_MIN_OVERLAP,
+            max_entries=SEMANTIC_CACHE_SIZE,
+            ttl_seconds=RESPONSE_CACHE_TTL
+        ) if SEMANTIC_CACHE_ENABLED else None
+        
         # Intentar inicializar el cliente
         self._initialize_client()
         
@@ -139,12 +362,36 @@ class AIService:
             return False
             
         try:
-            self.client = OpenAI(api_key=self.api_key)
+            # Sin reintentos internos del SDK: los reintentos pasan por el limitador y el circuito
+            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
             return True
         except Exception as e:
             logger.error(f"❌ Error al inicializar el cliente de OpenAI: {str(e)}")
             return False
     
+    def _get_async_client(self) -> Optional[AsyncOpenAI]:
+        """
+        Obtiene el cliente asíncrono de OpenAI sobre el pool HTTP compartido.
+        
+        Returns:
+            Cliente AsyncOpenAI, o None si la API key no está configurada
+        """
+        if not self.api_key or self.api_key in ["your_openai_api_key_here", "sk-your-actual-openai-api-key"]:
+            logger.error("❌ OPENAI_API_KEY no configurada o inválida")
+            return None
+        
+        http_client = get_async_http_client()
+        if self.async_client is None or self._async_http_client is not http_client:
+            try:
+                self.async_client = AsyncOpenAI(
+                    api_key=self.api_key, base_url=self.base_url, http_client=http_client, max_retries=0
+                )
+                self._async_http_client = http_client
+            except Exception as e:
+                logger.error(f"❌ Error al inicializar el cliente asíncrono de OpenAI: {str(e)}")
+                return None
+        return self.async_client
+    
     def is_api_key_valid(self) -> bool:
         """
         Verifica si la API key es válida haciendo una petición mínima.
@@ -163,25 +410,33 @@ class AIService:
             logger.error(f"❌ Error al verificar la API key: {str(e)}")
             return False
         
-    def format_bm25_context(self, query_text: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def format_bm25_context(
+        self, 
+        query_text: str, 
+        search_results: List[Dict[str, Any]],
+        token_budget: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
         Formatea los resultados de BM25 en un contexto estructurado y optimizado para GPT.
+        El contenido de cada documento se elige por pasajes completos dentro de un
+        presupuesto de tokens, priorizando los de mayor valor por token.
         
         Args:
             query_text: Texto de la consulta del usuario
             search_results: Lista de documentos relevantes recuperados con BM25
+            token_budget: Tokens disponibles para el contexto serializado como JSON
+                (por defecto PROMPT_TOKEN_BUDGET)
             
         Returns:
             Contexto estructurado como diccionario para enviar a GPT
         """
-        # Usar configuración optimizada para ahorrar tokens
-        max_docs = MAX_DOCUMENTS
-        max_chars = MAX_CHARS_PER_DOC
+        if token_budget is None:
+            token_budget = PROMPT_TOKEN_BUDGET
         
         # Limitar a los más relevantes
-        top_results = search_results[:max_docs]
+        top_results = search_results[:MAX_DOCUMENTS]
         
-        # Crear contexto estructurado
+        # Crear contexto estructurado (sin contenido; se completa al empaquetar)
         formatted_documents = []
         for i, doc in enumerate(top_results, 1):
             # Extraer identificadores para citas
@@ -201,25 +456,44 @@ class AIService:
             else:
                 legal_reference = doc.get('reference_number', 'N/A')
             
-            # Crear documento estructurado con snippet y contenido reducido
-            content = doc.get("snippet", "")[:max_chars]
-            
-            formatted_doc = {
+            formatted_documents.append({
                 "id": doc_id,
                 "titulo": doc.get("title", "Documento sin título"),
                 "referencia": legal_reference,
-                "contenido": content
-            }
-            
-            formatted_documents.append(formatted_doc)
+                "contenido": ""
+            })
         
-        # Crear contexto optimizado
-        context = {
-            "consulta": query_text,
-            "documentos": formatted_documents
-        }
+        def render(selection: List[Tuple[int, str]]) -> str:
+            return json.dumps(self._context_with(formatted_documents, selection), ensure_ascii=False)
+        
+        # Empaquetar los pasajes más valiosos en el presupuesto de tokens
+        packed = pack_documents(
+            query_text,
+            [
+                {"content": doc.get("content") or doc.get("snippet", ""), "score": doc.get("relevance_score", 0)}
+                for doc in top_results
+            ],
+            token_budget,
+            render,
+            model=self.model
+        )
         
-        return context
+        return self._context_with(formatted_documents, packed)
+    
+    @staticmethod
+    def _context_with(
+        formatted_documents: List[Dict[str, Any]], 
+        selection: List[Tuple[int, str]]
+    ) -> Dict[str, Any]:
+        """
+        Contexto de format_bm25_context con los documentos y contenidos seleccionados.
+        No incluye la consulta, que va al final del prompt.
+        """
+        return {
+            "documentos": [
+                dict(formatted_documents[index], contenido=content) for index, content in selection
+            ]
+        }
         
     def generate_gpt_response(
         self, 
@@ -228,7 +502,9 @@ class AIService:
         max_tokens: int = MAX_TOKENS_OUTPUT,
         temperature: float = 0.1,  # Reducido para respuestas más concisas
         model: str = None,
-        timeout: int = 30  # Reducido a 30 segundos
+        timeout: int = 30,  # Reducido a 30 segundos
+        user_id: Optional[str] = None,
+        operation: str = "chat"
     ) -> Tuple[Optional[str], Optional[str]]:
         """
         Genera una respuesta utilizando la API de OpenAI con manejo de errores y reintentos.
@@ -241,6 +517,8 @@ class AIService:
             temperature: Temperatura para controlar la creatividad (0-1)
             model: Modelo a utilizar (si es None, se usa el predeterminado)
             timeout: Tiempo máximo de espera para la respuesta en segundos
+            user_id: Usuario que origina la consulta (reparto equitativo del límite de tasa)
+            operation: Flujo que hace la llamada, para la telemetría de uso
             
         Returns:
             Tupla con (respuesta, error)
@@ -253,19 +531,204 @@ class AIService:
         
         # Usar el modelo especificado o el predeterminado
         model_to_use = model or self.model
-        
-        # Limpiar y truncar prompts si son muy largos
-        if len(prompt) > 4000:  # Reducción drástica de contexto
-            logger.warning(f"⚠️ Prompt demasiado largo ({len(prompt)} caracteres). Truncando...")
-            prompt = prompt[:4000]
+        reserved_tokens = self._log_prompt_size(prompt, system_message, model_to_use) + max_tokens
+        
+        def request():
+            raw_response = self.client.chat.completions.with_raw_response.create(
+                model=model_to_use,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+            return self._track_rate_limits(raw_response, reserved_tokens)
         
         attempts = 0
         while attempts < self.max_retries:
+            if not circuit_breaker.allow():
+                logger.warning("⚠️ Circuito abierto: no se envían solicitudes a OpenAI")
+                llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="circuit_open")
+                return None, CIRCUIT_OPEN_MESSAGE
             try:
+                # La espera por cupo no cuenta como latencia del proveedor ni dispara el respaldo
+                rate_limiter.acquire(user_id, reserved_tokens)
                 logger.info(f"🔄 Enviando solicitud a OpenAI (intento {attempts+1}/{self.max_retries})")
                 start_time = time.time()
                 
-                response = self.client.chat.completions.create(
+                # Si tarda más que el p95 reciente, se lanza una solicitud de respaldo (con su propio cupo)
+                response = hedger.run(request, hedge_acquire=lambda: rate_limiter.acquire(user_id, reserved_tokens))
+                circuit_breaker.record_success()
+                
+                execution_time = time.time() - start_time
+                logger.info(f"✅ Respuesta generada en {execution_time:.2f} segundos")
+                self._record_usage(
+                    model_to_use, operation, user_id, execution_time, attempts + 1,
+                    *self._usage_tokens(getattr(response, "usage", None))
+                )
+                
+                return response.choices[0].message.content.strip(), None
+                
+            except RateLimitTimeout as e:
+                logger.error(f"❌ {str(e)}")
+                llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="rate_limited")
+                return None, RATE_LIMIT_MESSAGE
+            except Exception as e:
+                fatal_error = self._handle_gpt_error(e, attempts)
+                if fatal_error:
+                    llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="error")
+                    return None, fatal_error
+                
+            attempts += 1
+            
+        llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts, outcome="error")
+        return None, f"No se pudo completar la solicitud después de {self.max_retries} intentos."
+        
+    async def agenerate_gpt_response(
+        self, 
+        prompt: str, 
+        system_message: str, 
+        max_tokens: int = MAX_TOKENS_OUTPUT,
+        temperature: float = 0.1,
+        model: str = None,
+        timeout: int = 30,
+        user_id: Optional[str] = None,
+        operation: str = "chat"
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Versión asíncrona de generate_gpt_response: usa AsyncOpenAI sobre el
+        pool HTTP compartido y espera con asyncio.sleep entre reintentos, de
+        modo que no bloquea el bucle de eventos mientras espera a OpenAI.
+        
+        Args:
+            prompt: Prompt para enviar a GPT
+            system_message: Mensaje del sistema para establecer el rol
+            max_tokens: Número máximo de tokens en la respuesta
+            temperature: Temperatura para controlar la creatividad (0-1)
+            model: Modelo a utilizar (si es None, se usa el predeterminado)
+            timeout: Tiempo máximo de espera para la respuesta en segundos
+            user_id: Usuario que origina la consulta (reparto equitativo del límite de tasa)
+            operation: Flujo que hace la llamada, para la telemetría de uso
+            
+        Returns:
+            Tupla con (respuesta, error)
+        """
+        client = self._get_async_client()
+        if client is None:
+            return None, "No se pudo inicializar el cliente de OpenAI. Verifica tu API key."
+        
+        model_to_use = model or self.model
+        reserved_tokens = self._log_prompt_size(prompt, system_message, model_to_use) + max_tokens
+        
+        async def request():
+            raw_response = await client.chat.completions.with_raw_response.create(
+                model=model_to_use,
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+            return self._track_rate_limits(raw_response, reserved_tokens)
+        
+        attempts = 0
+        while attempts < self.max_retries:
+            if not circuit_breaker.allow():
+                logger.warning("⚠️ Circuito abierto: no se envían solicitudes a OpenAI")
+                llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="circuit_open")
+                return None, CIRCUIT_OPEN_MESSAGE
+            try:
+                # La espera por cupo no cuenta como latencia del proveedor ni dispara el respaldo
+                await rate_limiter.aacquire(user_id, reserved_tokens)
+                logger.info(f"🔄 Enviando solicitud asíncrona a OpenAI (intento {attempts+1}/{self.max_retries})")
+                start_time = time.time()
+                
+                # Si tarda más que el p95 reciente, se lanza una solicitud de respaldo (con su propio cupo)
+                response = await hedger.arun(
+                    request, hedge_acquire=lambda: rate_limiter.aacquire(user_id, reserved_tokens)
+                )
+                circuit_breaker.record_success()
+                
+                execution_time = time.time() - start_time
+                logger.info(f"✅ Respuesta generada en {execution_time:.2f} segundos")
+                self._record_usage(
+                    model_to_use, operation, user_id, execution_time, attempts + 1,
+                    *self._usage_tokens(getattr(response, "usage", None))
+                )
+                
+                return response.choices[0].message.content.strip(), None
+                
+            except RateLimitTimeout as e:
+                logger.error(f"❌ {str(e)}")
+                llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="rate_limited")
+                return None, RATE_LIMIT_MESSAGE
+            except Exception as e:
+                fatal_error = self._handle_gpt_error(e, attempts)
+                if fatal_error:
+                    llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="error")
+                    return None, fatal_error
+                
+            attempts += 1
+            
+        llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts, outcome="error")
+        return None, f"No se pudo completar la solicitud después de {self.max_retries} intentos."
+        
+    async def agenerate_gpt_stream(
+        self, 
+        prompt: str, 
+        system_message: str, 
+        max_tokens: int = MAX_TOKENS_OUTPUT,
+        temperature: float = 0.1,
+        model: str = None,
+        timeout: int = 30,
+        user_id: Optional[str] = None,
+        operation: str = "chat"
+    ) -> AsyncIterator[str]:
+        """
+        Genera una respuesta en streaming, entregando los fragmentos de texto a
+        medida que llegan de OpenAI. Sólo se reintenta antes del primer
+        fragmento; una vez iniciado el stream, los errores se propagan.
+        
+        Args:
+            prompt: Prompt para enviar a GPT
+            system_message: Mensaje del sistema para establecer el rol
+            max_tokens: Número máximo de tokens en la respuesta
+            temperature: Temperatura para controlar la creatividad (0-1)
+            model: Modelo a utilizar (si es None, se usa el predeterminado)
+            timeout: Tiempo máximo de espera para la respuesta en segundos
+            user_id: Usuario que origina la consulta (reparto equitativo del límite de tasa)
+            operation: Flujo que hace la llamada, para la telemetría de uso
+            
+        Yields:
+            Fragmentos de texto de la respuesta
+            
+        Raises:
+            RuntimeError: Si no se pudo generar la respuesta
+        """
+        client = self._get_async_client()
+        if client is None:
+            raise RuntimeError("No se pudo inicializar el cliente de OpenAI. Verifica tu API key.")
+        
+        model_to_use = model or self.model
+        reserved_tokens = self._log_prompt_size(prompt, system_message, model_to_use) + max_tokens
+        
+        attempts = 0
+        while attempts < self.max_retries:
+            if not circuit_breaker.allow():
+                logger.warning("⚠️ Circuito abierto: no se envían solicitudes a OpenAI")
+                llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="circuit_open")
+                raise RuntimeError(CIRCUIT_OPEN_MESSAGE)
+            started = False
+            try:
+                await rate_limiter.aacquire(user_id, reserved_tokens)
+                logger.info(f"🔄 Enviando solicitud en streaming a OpenAI (intento {attempts+1}/{self.max_retries})")
+                start_time = time.time()
+                
+                raw_response = await client.chat.completions.with_raw_response.create(
                     model=model_to_use,
                     messages=[
                         {"role": "system", "content": system_message},
@@ -273,44 +736,179 @@ class AIService:
                     ],
                     temperature=temperature,
                     max_tokens=max_tokens,
-                    timeout=timeout
+                    timeout=timeout,
+                    stream=True,
+                    # El último fragmento trae el uso de tokens de la respuesta
+                    stream_options={"include_usage": True}
                 )
+                rate_limiter.update_from_headers(raw_response.headers)
+                parts = []
+                usage = None
+                async for chunk in raw_response.parse():
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not started:
+                            logger.info(f"✅ Primer fragmento recibido en {time.time() - start_time:.2f} segundos")
+                            started = True
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
                 
                 execution_time = time.time() - start_time
-                logger.info(f"✅ Respuesta generada en {execution_time:.2f} segundos")
-                
-                return response.choices[0].message.content.strip(), None
+                logger.info(f"✅ Respuesta en streaming completada en {execution_time:.2f} segundos")
+                circuit_breaker.record_success()
+                if usage:
+                    tokens = self._usage_tokens(usage)
+                else:
+                    # Si el proveedor no reporta uso, se estima con el texto recibido
+                    tokens = (reserved_tokens - max_tokens, count_tokens("".join(parts), model_to_use), 0)
+                rate_limiter.settle(reserved_tokens, tokens[0] + tokens[1])
+                self._record_usage(model_to_use, operation, user_id, execution_time, attempts + 1, *tokens)
+                return
                 
+            except RateLimitTimeout as e:
+                llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="rate_limited")
+                raise RuntimeError(RATE_LIMIT_MESSAGE) from e
             except Exception as e:
-                error_str = str(e)
-                logger.error(f"❌ Error al generar respuesta: {error_str}")
-                
-                # Analizar tipo de error
-                if "maximum context length" in error_str.lower():
-                    # Reducir longitud del prompt aún más
-                    prompt = prompt[:len(prompt)//2]
-                    logger.warning("⚠️ Reduciendo longitud del prompt para evitar exceder máximo de tokens")
-                elif "rate limit" in error_str.lower():
-                    # Esperar más tiempo en caso de límite de tasa
-                    wait_time = (2 ** attempts) * self.retry_delay
-                    logger.warning(f"⚠️ Límite de tasa excedido. Esperando {wait_time} segundos...")
-                    time.sleep(wait_time)
-                elif "billing hard limit" in error_str.lower() or "quota" in error_str.lower():
-                    logger.error("❌ Has excedido tu cuota de API. Verifica tu saldo y límites.")
-                    return None, "Cuota de API excedida. Verifica tu saldo y límites en OpenAI."
-                else:
-                    logger.error(f"❌ Error desconocido: {error_str}")
-                    return None, f"Error inesperado: {error_str}"
+                if started:
+                    circuit_breaker.record_failure()
+                    llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="error")
+                    raise RuntimeError(f"Error durante el streaming: {str(e)}")
+                fatal_error = self._handle_gpt_error(e, attempts)
+                if fatal_error:
+                    llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts + 1, outcome="error")
+                    raise RuntimeError(fatal_error)
                 
             attempts += 1
             
-        return None, f"No se pudo completar la solicitud después de {self.max_retries} intentos."
+        llm_telemetry.record_call(model_to_use, operation, user_id, attempts=attempts, outcome="error")
+        raise RuntimeError(f"No se pudo completar la solicitud después de {self.max_retries} intentos.")
+        
+    def _log_prompt_size(self, prompt: str, system_message: str, model: str) -> int:
+        """
+        Registra el tamaño en tokens del prompt. Los prompts ya se construyen
+        dentro de su presupuesto, por lo que aquí nunca se recortan: cortar el
+        texto rompería el JSON de los documentos.
+        
+        Returns:
+            Tokens del prompt (mensaje de sistema + usuario)
+        """
+        prompt_tokens = count_tokens(system_message, model) + count_tokens(prompt, model)
+        logger.info(f"📏 Prompt de {prompt_tokens} tokens")
+        return prompt_tokens
+        
+    def _track_rate_limits(self, raw_response: Any, reserved_tokens: int) -> Any:
+        """
+        Actualiza el limitador de tasa con las cabeceras y el uso real de una respuesta.
+        
+        Args:
+            raw_response: Respuesta cruda de OpenAI (with_raw_response)
+            reserved_tokens: Tokens reservados al pedir cupo
+            
+        Returns:
+            Respuesta de chat completions ya procesada
+        """
+        rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+        usage = getattr(response, "usage", None)
+        rate_limiter.settle(reserved_tokens, usage.total_tokens if usage else None)
+        return response
+        
+    def _usage_tokens(self, usage: Any) -> Tuple[int, int, int]:
+        """Tokens (entrada, salida, entrada en caché del proveedor) del uso reportado por OpenAI"""
+        if usage is None:
+            return 0, 0, 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        return (
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0,
+            getattr(details, "cached_tokens", 0) or 0
+        )
+        
+    def _record_usage(
+        self,
+        model: str,
+        operation: str,
+        user_id: Optional[str],
+        latency: float,
+        attempts: int,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int
+    ) -> None:
+        """Registra en la telemetría una llamada exitosa a OpenAI"""
+        cost = llm_telemetry.record_call(
+            model, operation, user_id,
+            latency=latency,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            attempts=attempts
+        )
+        logger.info(
+            f"💰 {prompt_tokens} tokens de entrada ({cached_tokens} en caché) y {completion_tokens} de salida, "
+            f"costo estimado ${cost:.5f}"
+        )
+        
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        """Segundos de espera indicados por las cabeceras de un error 429"""
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if not headers:
+            return None
+        if headers.get("retry-after-ms"):
+            return parse_reset(headers["retry-after-ms"] + "ms")
+        waits = [
+            parse_reset(headers.get(name))
+            for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        ]
+        waits = [wait for wait in waits if wait]
+        return max(waits) if waits else None
+        
+    def _handle_gpt_error(self, error: Exception, attempts: int) -> Optional[str]:
+        """
+        Analiza un error de OpenAI y decide cómo continuar. Tras un 429 no se
+        espera aquí: la pausa se aplica en el limitador de tasa, que retiene
+        el siguiente intento (y los de las demás solicitudes).
+        
+        Args:
+            error: Excepción de OpenAI
+            attempts: Intentos realizados hasta ahora
+            
+        Returns:
+            Error definitivo, o None si se puede reintentar
+        """
+        error_str = str(error)
+        logger.error(f"❌ Error al generar respuesta: {error_str}")
+        
+        # Analizar tipo de error
+        if "maximum context length" in error_str.lower():
+            # El proveedor respondió: no cuenta como falla para el circuito
+            circuit_breaker.record_success()
+            # Reintentar el mismo prompt no sirve; el presupuesto de tokens debe ajustarse
+            logger.error("❌ El prompt excede el contexto máximo del modelo. Revisa PROMPT_TOKEN_BUDGET.")
+            return "El prompt excede el contexto máximo del modelo."
+        elif "rate limit" in error_str.lower():
+            # Pausar todas las solicitudes del proceso (no sólo ésta) hasta que el proveedor lo permita
+            wait_time = self._retry_after(error) or (2 ** attempts) * self.retry_delay
+            logger.warning(f"⚠️ Límite de tasa excedido. Pausando solicitudes {wait_time} segundos...")
+            rate_limiter.penalize(wait_time)
+            return None
+        elif "billing hard limit" in error_str.lower() or "quota" in error_str.lower():
+            circuit_breaker.record_failure()
+            logger.error("❌ Has excedido tu cuota de API. Verifica tu saldo y límites.")
+            return "Cuota de API excedida. Verifica tu saldo y límites en OpenAI."
+        else:
+            # Tiempo de espera agotado, error de conexión o error del servidor
+            circuit_breaker.record_failure()
+            logger.error(f"❌ Error desconocido: {error_str}")
+            return f"Error inesperado: {error_str}"
         
     def generate_response(
         self, 
         query_text: str, 
         search_results: List[Dict[str, Any]],
-        threshold: float = 0.7
+        threshold: float = 0.7,
+        user_id: Optional[str] = None
     ) -> Tuple[str, float, bool, Optional[str]]:
         """
         Genera una respuesta a la consulta del usuario utilizando GPT.
@@ -320,6 +918,7 @@ class AIService:
             query_text: Texto de la consulta del usuario
             search_results: Documentos relevantes recuperados con BM25
             threshold: Umbral de confianza para decidir si se necesita revisión humana
+            user_id: Usuario que origina la consulta (reparto equitativo del límite de tasa)
             
         Returns:
             Tupla con:
@@ -328,9 +927,177 @@ class AIService:
             - Indicador de si necesita revisión humana
             - Razón de la revisión (opcional)
         """
+        query_hash, early_response = self._prepare_response(query_text, search_results)
+        if early_response:
+            return early_response
+        
+        extractive_response = self._extractive_response(query_text, search_results, threshold)
+        if extractive_response:
+            return extractive_response
+        
+        def generate():
+            system_prompt, user_prompt = self._build_response_prompts(query_text, search_results)
+            route = model_router.route(query_text, search_results, MAX_TOKENS_OUTPUT)
+            start_time = time.time()
+            
+            # Generar respuesta usando el método con manejo de errores
+            response_text, error = self.generate_gpt_response(
+                prompt=user_prompt,
+                system_message=system_prompt,
+                max_tokens=route["max_tokens"],
+                temperature=0.1,
+                model=route["model"],
+                user_id=user_id,
+                operation="response"
+            )
+            if error == CIRCUIT_OPEN_MESSAGE:
+                return self._retrieval_only_response(search_results)
+            
+            result = self._finalize_response(query_hash, response_text, error, threshold, query_text, search_results)
+            model_router.record_outcome(route, time.time() - start_time, response_text, error, result[1], result[2])
+            return result
+        
+        # Consultas idénticas concurrentes esperan la misma generación
+        flight_key = f"{query_hash or create_query_hash(query_text, search_results)}:{threshold}"
+        return self.in_flight.do(flight_key, generate)
+    
+    async def agenerate_response(
+        self, 
+        query_text: str, 
+        search_results: List[Dict[str, Any]],
+        threshold: float = 0.7,
+        user_id: Optional[str] = None
+    ) -> Tuple[str, float, bool, Optional[str]]:
+        """
+        Versión asíncrona de generate_response para endpoints async: la llamada
+        a OpenAI no bloquea el bucle de eventos.
+        
+        Args:
+            query_text: Texto de la consulta del usuario
+            search_results: Documentos relevantes recuperados con BM25
+            threshold: Umbral de confianza para decidir si se necesita revisión humana
+            user_id: Usuario que origina la consulta (reparto equitativo del límite de tasa)
+            
+        Returns:
+            Misma tupla que generate_response
+        """
+        # El caché de respuestas lee y escribe SQLite: fuera del bucle de eventos
+        query_hash, early_response = await asyncio.to_thread(self._prepare_response, query_text, search_results)
+        if early_response:
+            return early_response
+        
+        # El enrutado extractivo y el empaquetado del prompt cuentan tokens: también en un hilo
+        extractive_response = await asyncio.to_thread(self._extractive_response, query_text, search_results, threshold)
+        if extractive_response:
+            return extractive_response
+        
+        async def generate():
+            system_prompt, user_prompt = await asyncio.to_thread(self._build_response_prompts, query_text, search_results)
+            route = model_router.route(query_text, search_results, MAX_TOKENS_OUTPUT)
+            start_time = time.time()
+            
+            response_text, error = await self.agenerate_gpt_response(
+                prompt=user_prompt,
+                system_message=system_prompt,
+                max_tokens=route["max_tokens"],
+                temperature=0.1,
+                model=route["model"],
+                user_id=user_id,
+                operation="response"
+            )
+            if error == CIRCUIT_OPEN_MESSAGE:
+                return self._retrieval_only_response(search_results)
+            
+            result = await asyncio.to_thread(
+                self._finalize_response, query_hash, response_text, error, threshold, query_text, search_results
+            )
+            model_router.record_outcome(route, time.time() - start_time, response_text, error, result[1], result[2])
+            return result
+        
+        # Consultas idénticas concurrentes esperan la misma generación
+        flight_key = f"{query_hash or create_query_hash(query_text, search_results)}:{threshold}"
+        return await self.in_flight.ado(flight_key, generate)
+    
+    async def astream_response(
+        self, 
+        query_text: str, 
+        search_results: List[Dict[str, Any]],
+        threshold: float = 0.7,
+        user_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Versión en streaming de generate_response. Entrega los fragmentos del
+        modelo tal como llegan y, al terminar, la respuesta procesada (confianza,
+        limpieza y formato de referencias), que reemplaza al texto parcial.
+        
+        Args:
+            query_text: Texto de la consulta del usuario
+            search_results: Documentos relevantes recuperados con BM25
+            threshold: Umbral de confianza para decidir si se necesita revisión humana
+            user_id: Usuario que origina la consulta (reparto equitativo del límite de tasa)
+            
+        Yields:
+            Eventos ("token", texto) y un evento final ("done", tupla de generate_response)
+        """
+        # El caché de respuestas lee y escribe SQLite: fuera del bucle de eventos
+        query_hash, early_response = await asyncio.to_thread(self._prepare_response, query_text, search_results)
+        if not early_response:
+            early_response = await asyncio.to_thread(self._extractive_response, query_text, search_results, threshold)
+        if early_response:
+            yield "token", early_response[0]
+            yield "done", early_response
+            return
+        
+        system_prompt, user_prompt = await asyncio.to_thread(self._build_response_prompts, query_text, search_results)
+        route = model_router.route(query_text, search_results, MAX_TOKENS_OUTPUT)
+        start_time = time.time()
+        
+        parts = []
+        error = None
+        try:
+            async for delta in self.agenerate_gpt_stream(
+                prompt=user_prompt,
+                system_message=system_prompt,
+                max_tokens=route["max_tokens"],
+                temperature=0.1,
+                model=route["model"],
+                user_id=user_id,
+                operation="stream"
+            ):
+                parts.append(delta)
+                yield "token", delta
+        except Exception as e:
+            error = str(e)
+        
+        if error == CIRCUIT_OPEN_MESSAGE and not parts:
+            fallback = self._retrieval_only_response(search_results)
+            yield "token", fallback[0]
+            yield "done", fallback
+            return
+        
+        response_text = "".join(parts).strip() if not error else None
+        result = await asyncio.to_thread(
+            self._finalize_response, query_hash, response_text, error, threshold, query_text, search_results
+        )
+        model_router.record_outcome(route, time.time() - start_time, response_text, error, result[1], result[2])
+        yield "done", result
+    
+    def _prepare_response(
+        self, 
+        query_text: str, 
+        search_results: List[Dict[str, Any]]
+    ) -> Tuple[Optional[str], Optional[Tuple[str, float, bool, Optional[str]]]]:
+        """
+        Verifica la configuración, el caché y los resultados antes de llamar a GPT.
+        
+        Returns:
+            Tupla con (hash de la consulta, respuesta inmediata o None si hay que generar)
+        """
+        query_hash = None
+        
         # Verificar que la API key es válida
         if not validate_config():
-            return (
+            return query_hash, (
                 "Lo siento, hay un problema con la configuración del sistema. Un especialista revisará tu caso.",
                 0.0,
                 True,
@@ -343,13 +1110,28 @@ class AIService:
             cached_data = get_cached_response(query_hash)
             
             if cached_data:
-                return (
+                llm_telemetry.record_cache_hit("response_cache")
+                return query_hash, (
                     cached_data["response"],
                     cached_data["confidence"],
                     cached_data["needs_review"],
                     cached_data["review_reason"]
                 )
         
+        # Buscar una respuesta de una consulta parecida con los mismos documentos
+        if self.semantic_cache is not None and search_results:
+            similar_response = self.semantic_cache.get(query_text, self._context_doc_ids(search_results))
+            if similar_response:
+                llm_telemetry.record_cache_hit("semantic_cache")
+                if ENABLE_CACHE:
+                    save_to_cache(query_hash, {
+                        "response": similar_response[0],
+                        "confidence": similar_response[1],
+                        "needs_review": similar_response[2],
+                        "review_reason": similar_response[3]
+                    })
+                return query_hash, similar_response
+        
         # Si no hay suficientes resultados relevantes, devolver respuesta estándar
         if not search_results or len(search_results) == 0:
             default_response = (
@@ -367,40 +1149,112 @@ class AIService:
                     "review_reason": "Sin documentos relevantes"
                 })
                 
-            return default_response, 0.0, True, "Sin documentos relevantes"
-            
-        # Formatear el contexto de BM25 para GPT (versión optimizada)
-        context = self.format_bm25_context(query_text, search_results)
+            return query_hash, (default_response, 0.0, True, "Sin documentos relevantes")
         
-        # Optimizar el prompt para GPT (versión ultra concisa)
-        system_prompt = """
-        Asistente legal colombiano. Responde basándote SOLO en los documentos proporcionados.
-        REGLAS: No inventes información. Sé breve y directo. Cita fuentes como [DocX].
-        Si no tienes suficiente información, indica: "No tengo suficiente información en los documentos proporcionados".
-        ESTRUCTURA: 1) Respuesta directa, 2) Referencias legales.
-        Al final evalúa tu confianza (0-1): "CONFIANZA: [puntuación]"
+        return query_hash, None
+    
+    def _build_response_prompts(self, query_text: str, search_results: List[Dict[str, Any]]) -> Tuple[str, str]:
         """
+        Construye los prompts de sistema y de usuario para generate_response.
+        
+        Returns:
+            Tupla con (prompt de sistema, prompt de usuario)
+        """
+        def user_prompt_for(context_json: str) -> str:
+            return RESPONSE_USER_PROMPT.format(documents=context_json, query=query_text)
+        
+        # Formatear el contexto de BM25 con los tokens que dejan libres las instrucciones
+        instruction_tokens = (
+            count_tokens(RESPONSE_SYSTEM_PROMPT, self.model) + count_tokens(user_prompt_for(""), self.model)
+        )
+        context = self.format_bm25_context(
+            query_text, search_results, token_budget=PROMPT_TOKEN_BUDGET - instruction_tokens
+        )
         
         # Convertir contexto a formato JSON simplificado
         context_json = json.dumps(context, ensure_ascii=False)
         
-        user_prompt = f"""
-        CONSULTA: {query_text}
-        
-        DOCUMENTOS:
-        {context_json}
+        return RESPONSE_SYSTEM_PROMPT, user_prompt_for(context_json)
+    
+    def _retrieval_only_response(self, search_results: List[Dict[str, Any]]) -> Tuple[str, float, bool, Optional[str]]:
+        """
+        Respuesta sin LLM con los fragmentos BM25 de los documentos más
+        relevantes, usada mientras el circuito hacia OpenAI está abierto.
+        No se guarda en caché.
         
-        Responde usando solo estos documentos. Incluye citas [DocX].
+        Returns:
+            Misma tupla que generate_response
+        """
+        llm_telemetry.record_cache_hit("retrieval_only")
+        lines = [RETRIEVAL_ONLY_INTRO]
+        for i, doc in enumerate(search_results[:MAX_DOCUMENTS], 1):
+            reference = doc.get("reference_number")
+            title = doc.get("title", "Documento sin título") + (f" ({reference})" if reference else "")
+            lines.append(f"[Doc{i}] {title}: {doc.get('snippet', '').strip()}")
+        
+        return (
+            self._format_legal_references("\n\n".join(lines)),
+            0.0,
+            True,
+            RETRIEVAL_ONLY_REASON
+        )
+    
+    def _extractive_response(
+        self, 
+        query_text: str, 
+        search_results: List[Dict[str, Any]],
+        threshold: float
+    ) -> Optional[Tuple[str, float, bool, Optional[str]]]:
         """
+        Respuesta extractiva con el pasaje del documento más relevante cuando
+        el enrutador determina que responde la consulta de forma directa.
+        No se guarda en caché: generarla no cuesta una llamada a OpenAI.
         
-        # Generar respuesta usando el método con manejo de errores
-        response_text, error = self.generate_gpt_response(
-            prompt=user_prompt,
-            system_message=system_prompt,
-            max_tokens=MAX_TOKENS_OUTPUT,
-            temperature=0.1
+        Returns:
+            Misma tupla que generate_response, o None si hay que llamar al LLM
+        """
+        route = answer_router.route(query_text, search_results)
+        if route is None:
+            return None
+        
+        doc = search_results[0]
+        reference = doc.get("reference_number")
+        title = doc.get("title", "Documento sin título") + (f" ({reference})" if reference else "")
+        response_text = (
+            f"Según [Doc1], {title}:\n\n\"{route['passage']}\"\n\n"
+            f"**REFERENCIAS LEGALES:**\n- [Doc1] {title}"
+        )
+        logger.info(
+            f"⚡ Respuesta extractiva sin LLM ({route['question_type']}, puntuación {route['score']}, "
+            f"cobertura {route['coverage']}, margen {route['margin']})"
         )
         
+        llm_telemetry.record_cache_hit("extractive")
+        confidence_score = route["score"]
+        needs_human_review = confidence_score < threshold
+        review_reason = "Información parcial que requiere verificación" if needs_human_review else None
+        return self._format_legal_references(response_text), confidence_score, needs_human_review, review_reason
+    
+    def _context_doc_ids(self, search_results: List[Dict[str, Any]]) -> List[Any]:
+        """IDs de los documentos incluidos en el contexto, en el orden de las citas [DocN]"""
+        return [doc.get("document_id", doc.get("id")) for doc in search_results[:MAX_DOCUMENTS]]
+    
+    def _finalize_response(
+        self, 
+        query_hash: Optional[str], 
+        response_text: Optional[str], 
+        error: Optional[str], 
+        threshold: float,
+        query_text: Optional[str] = None,
+        search_results: Optional[List[Dict[str, Any]]] = None
+    ) -> Tuple[str, float, bool, Optional[str]]:
+        """
+        Procesa la respuesta de GPT: confianza, revisión humana, limpieza,
+        formato de referencias y almacenamiento en caché.
+        
+        Returns:
+            Misma tupla que generate_response
+        """
         # Si hubo un error, devolver mensaje de error
         if error:
             logger.error(f"❌ Error al generar respuesta: {error}")
@@ -445,6 +1299,13 @@ class AIService:
                 "review_reason": review_reason
             })
         
+        if self.semantic_cache is not None and query_text and search_results:
+            self.semantic_cache.set(
+                query_text,
+                self._context_doc_ids(search_results),
+                (clean_response, confidence_score, needs_human_review, review_reason)
+            )
+        
         return clean_response, confidence_score, needs_human_review, review_reason
     
     def _extract_confidence_score(self, response_text: str) -> float:
@@ -646,7 +1507,8 @@ class AIService:
         max_tokens: int = 1500,
         confidence_threshold: float = 0.7,
         model: str = None,
-        timeout: int = 60
+        timeout: int = 60,
+        user_id: Optional[str] = None
     ) -> Tuple[str, float, List[Dict[str, Any]], bool]:
         """
         Genera una respuesta legal detallada a partir de una consulta y resultados de búsqueda BM25.
@@ -662,6 +1524,7 @@ class AIService:
             confidence_threshold: Umbral para determinar si una respuesta es confiable
             model: Modelo específico a utilizar (si es None, usa el predeterminado)
             timeout: Tiempo máximo de espera para la respuesta en segundos
+            user_id: Usuario que origina la consulta (reparto equitativo del límite de tasa)
             
         Returns:
             Tupla con:
@@ -671,124 +1534,161 @@ class AIService:
             - requiere_revision: Indicador de si la respuesta necesita revisión humana
         """
         if not search_results:
-            return "No se encontraron documentos legales relevantes para tu consulta. Por favor, reformula tu pregunta o consulta a un especialista en derecho laboral.", 0.0, [], True
+            return NO_LEGAL_DOCUMENTS_MESSAGE, 0.0, [], True
         
         # Verificar cliente OpenAI
         if not self.client and not self._initialize_client():
             logger.error("❌ No se pudo inicializar el cliente de OpenAI")
-            return "Lo siento, hay un problema técnico con nuestro servicio. Por favor, intenta más tarde o contacta a un especialista en derecho laboral para tu consulta.", 0.0, [], True
+            return LEGAL_UNAVAILABLE_MESSAGE, 0.0, [], True
         
-        # Optimizar documentos para GPT
-        optimized_docs = self.optimize_document_context(
-            search_results=search_results,
-            max_documents=max_documents
+        # Sin un modelo explícito, el enrutador elige modelo y presupuesto según la complejidad
+        route = None if model else model_router.route(query_text, search_results, max_tokens)
+        system_prompt, user_prompt, optimized_docs, model_to_use = self._build_legal_prompts(
+            query_text, search_results, max_documents, route["model"] if route else model
         )
+        start_time = time.time()
         
-        # Formatear documentos para JSON
-        formatted_context = {
-            "consulta_legal": query_text,
-            "documentos_relevantes": optimized_docs,
-            "total_documentos": len(search_results),
-            "documentos_incluidos": len(optimized_docs),
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        # Sistema de prompt optimizado para respuestas legales
-        system_prompt = """
-        Eres un asistente legal especializado en derecho laboral colombiano con amplia experiencia jurídica.
-        Tu ÚNICA función es proporcionar respuestas precisas basadas EXCLUSIVAMENTE en los documentos legales proporcionados.
-        
-        ## REGLAS FUNDAMENTALES (CRÍTICAS - DEBES SEGUIRLAS SIN EXCEPCIÓN):
-        
-        1. NUNCA inventes información, leyes, artículos o interpretaciones que NO aparezcan explícitamente en los documentos proporcionados.
-        2. NUNCA utilices tu conocimiento general sobre leyes - SOLO puedes usar la información que aparece en los documentos.
-        3. Si los documentos proporcionados no contienen información suficiente, DEBES indicarlo claramente.
-        4. SIEMPRE cita las fuentes específicas usando el formato [DocX] después de cada afirmación legal importante.
-        5. SIEMPRE incluye referencias legales exactas (números de ley, artículos específicos) tal como aparecen en los documentos.
-        
-        ## ESTRUCTURA OBLIGATORIA DE LA RESPUESTA:
-        
-        **RESPUESTA DIRECTA**:
-        Comienza con una respuesta concisa y directa a la consulta legal.
-        
-        **FUNDAMENTO LEGAL**:
-        Explica detalladamente el fundamento legal citando documentos específicos.
-        
-        **REQUISITOS Y CONDICIONES** (si aplica):
-        Enumera requisitos, plazos o condiciones especiales.
-        
-        **REFERENCIAS LEGALES**:
-        Lista completa de documentos citados con sus referencias legales exactas.
-        Ejemplo:
-        • [Doc1] Ley 1010 de 2006, Artículo 2 - Definición de acoso laboral
-        • [Doc2] Código Sustantivo del Trabajo, Artículo 62 - Terminación del contrato
-        
-        ## CUANDO NO HAY INFORMACIÓN SUFICIENTE:
-        
-        Si la información proporcionada es insuficiente para responder adecuadamente:
-        1. Indica específicamente qué información falta para responder completamente
-        2. Proporciona la información parcial que SÍ está disponible en los documentos
-        3. Asigna una puntuación de confianza baja (0.0-0.3)
-        4. Incluye este texto exacto al inicio: "ADVERTENCIA: La información disponible es limitada para responder completamente a esta consulta."
-        
-        ## EVALUACIÓN DE CONFIANZA:
-        
-        Al final de tu respuesta, evalúa tu confianza en una escala de 0 a 1:
-        - 0.0-0.3: Información muy insuficiente o no relevante
-        - 0.4-0.6: Información parcial con algunas lagunas importantes
-        - 0.7-0.9: Información suficiente con documentos relevantes
-        - 1.0: Información completa y precisa con documentos altamente relevantes
-        
-        Al final, DEBES incluir tu evaluación en el siguiente formato exacto:
-        "CONFIANZA: [puntuación]"
+        # Generar respuesta usando el método con manejo de errores
+        response_text, error = self.generate_gpt_response(
+            prompt=user_prompt,
+            system_message=system_prompt,
+            max_tokens=route["max_tokens"] if route else max_tokens,
+            temperature=0.1,  # Temperatura más baja para respuestas más deterministas
+            model=model_to_use,
+            timeout=timeout,
+            user_id=user_id,
+            operation="legal"
+        )
+        result = self._finalize_legal_response(
+            response_text, error, search_results, optimized_docs, confidence_threshold
+        )
+        if route and error != CIRCUIT_OPEN_MESSAGE:
+            model_router.record_outcome(route, time.time() - start_time, response_text, error, result[1], result[3])
+        return result
+
+    async def agenerate_legal_response(
+        self,
+        query_text: str,
+        search_results: List[Dict[str, Any]],
+        max_documents: int = 5,
+        max_tokens: int = 1500,
+        confidence_threshold: float = 0.7,
+        model: str = None,
+        timeout: int = 60,
+        user_id: Optional[str] = None
+    ) -> Tuple[str, float, List[Dict[str, Any]], bool]:
+        """
+        Versión asíncrona de generate_legal_response (mismos argumentos y
+        resultado): la llamada a OpenAI usa el pool HTTP asíncrono compartido,
+        de modo que muchas consultas pueden generarse a la vez en un solo hilo.
         """
+        if not search_results:
+            return NO_LEGAL_DOCUMENTS_MESSAGE, 0.0, [], True
         
-        # Convertir contexto a formato JSON con indentación para mejor legibilidad
-        context_json = json.dumps(formatted_context, ensure_ascii=False, indent=2)
+        if self._get_async_client() is None:
+            logger.error("❌ No se pudo inicializar el cliente de OpenAI")
+            return LEGAL_UNAVAILABLE_MESSAGE, 0.0, [], True
         
-        # Crear prompt con instrucciones detalladas
-        user_prompt = f"""
-        ## CONSULTA LEGAL
+        # Sin un modelo explícito, el enrutador elige modelo y presupuesto según la complejidad
+        route = None if model else model_router.route(query_text, search_results, max_tokens)
+        # El empaquetado del contexto cuenta tokens de cada pasaje: fuera del bucle de eventos
+        system_prompt, user_prompt, optimized_docs, model_to_use = await asyncio.to_thread(
+            self._build_legal_prompts, query_text, search_results, max_documents, route["model"] if route else model
+        )
+        start_time = time.time()
+        response_text, error = await self.agenerate_gpt_response(
+            prompt=user_prompt,
+            system_message=system_prompt,
+            max_tokens=route["max_tokens"] if route else max_tokens,
+            temperature=0.1,
+            model=model_to_use,
+            timeout=timeout,
+            user_id=user_id,
+            operation="legal"
+        )
+        result = self._finalize_legal_response(
+            response_text, error, search_results, optimized_docs, confidence_threshold
+        )
+        if route and error != CIRCUIT_OPEN_MESSAGE:
+            model_router.record_outcome(route, time.time() - start_time, response_text, error, result[1], result[3])
+        return result
+
+    def _build_legal_prompts(
+        self,
+        query_text: str,
+        search_results: List[Dict[str, Any]],
+        max_documents: int,
+        model: Optional[str]
+    ) -> Tuple[str, str, List[Dict[str, Any]], str]:
+        """
+        Construye los prompts de generate_legal_response.
         
-        {query_text}
+        Returns:
+            Tupla con (prompt del sistema, prompt del usuario, documentos incluidos, modelo)
+        """
+        # Optimizar documentos para GPT
+        optimized_docs = self.optimize_document_context(
+            search_results=search_results,
+            max_documents=max_documents
+        )
         
-        ## DOCUMENTOS LEGALES RELEVANTES
+        # La fecha es lo único que cambia entre llamadas idénticas: va al final del prompt
+        timestamp = datetime.now().isoformat()
         
-        {context_json}
+        def context_for(selection: List[Tuple[int, str]]) -> Dict[str, Any]:
+            documents = [dict(optimized_docs[index], contenido=content) for index, content in selection]
+            return {
+                "documentos_relevantes": documents,
+                "total_documentos": len(search_results),
+                "documentos_incluidos": len(documents)
+            }
         
-        ## INSTRUCCIONES ESPECÍFICAS
+        def user_prompt_for(context_json: str) -> str:
+            return LEGAL_USER_PROMPT.format(documents=context_json, query=query_text, timestamp=timestamp)
         
-        IMPORTANTE:
-        - Responde basándote ÚNICAMENTE en los documentos proporcionados.
-        - Si no encuentras información suficiente, indícalo claramente.
-        - Cita las fuentes exactas para cada afirmación legal.
-        - Utiliza un lenguaje claro y accesible para personas sin formación jurídica.
-        - Estructura tu respuesta según el formato requerido.
-        - Incluye la sección "REFERENCIAS LEGALES" con todas las fuentes utilizadas.
+        # Empaquetar el contenido de los documentos en los tokens que dejan libres las instrucciones
+        model_to_use = model or self.model
+        instruction_tokens = (
+            count_tokens(LEGAL_SYSTEM_PROMPT, model_to_use) + count_tokens(user_prompt_for(""), model_to_use)
+        )
+        packed = pack_documents(
+            query_text,
+            [{"content": doc["contenido"], "score": doc["relevancia"]} for doc in optimized_docs],
+            LEGAL_PROMPT_TOKEN_BUDGET - instruction_tokens,
+            lambda selection: json.dumps(context_for(selection), ensure_ascii=False, indent=2),
+            model=model_to_use
+        )
+        formatted_context = context_for(packed)
+        optimized_docs = formatted_context["documentos_relevantes"]
         
-        Recuerda evaluar la confianza de tu respuesta al final.
+        # Convertir contexto a formato JSON con indentación para mejor legibilidad
+        user_prompt = user_prompt_for(json.dumps(formatted_context, ensure_ascii=False, indent=2))
+        return LEGAL_SYSTEM_PROMPT, user_prompt, optimized_docs, model_to_use
+
+    def _finalize_legal_response(
+        self,
+        response_text: Optional[str],
+        error: Optional[str],
+        search_results: List[Dict[str, Any]],
+        optimized_docs: List[Dict[str, Any]],
+        confidence_threshold: float
+    ) -> Tuple[str, float, List[Dict[str, Any]], bool]:
         """
+        Procesa la respuesta de GPT de generate_legal_response: confianza,
+        formato de referencias y documentos citados.
         
-        # Generar respuesta usando el método con manejo de errores
-        model_to_use = model or self.model
-        response_text, error = self.generate_gpt_response(
-            prompt=user_prompt,
-            system_message=system_prompt,
-            max_tokens=max_tokens,
-            temperature=0.1,  # Temperatura más baja para respuestas más deterministas
-            model=model_to_use,
-            timeout=timeout
-        )
+        Returns:
+            Misma tupla que generate_legal_response
+        """
+        # Mientras el circuito está abierto, responder sólo con los documentos
+        if error == CIRCUIT_OPEN_MESSAGE:
+            fallback_text = self._retrieval_only_response(search_results)[0]
+            return fallback_text, 0.0, [], True
         
         # Si hubo un error, devolver mensaje de error
         if error:
             logger.error(f"❌ Error al generar respuesta legal: {error}")
-            return (
-                f"Lo siento, no pude procesar tu consulta legal en este momento debido a un error técnico. Por favor, intenta nuevamente más tarde o consulta a un especialista en derecho laboral.",
-                0.0,
-                [],
-                True
-            )
+            return LEGAL_ERROR_MESSAGE, 0.0, [], True
         
         # Extraer la puntuación de confianza
         confidence_score = self._extract_confidence_score(response_text)
@@ -800,12 +1700,12 @@ class AIService:
         # Determinar si requiere revisión humana
         requires_human_review = confidence_score < confidence_threshold
         
-        # Extraer documentos citados
-        citations = self.extract_document_citations(formatted_response)
+        # Extraer documentos citados (antes del formato, que reemplaza [DocN] por [📄 DocN])
+        citations = self.extract_document_citations(clean_response)
         cited_documents = []
         
         for i, doc in enumerate(optimized_docs, 1):
-            doc_id = f"Doc{i}"
+            doc_id = doc["id"].strip("[]")
             if doc_id in citations:
                 cite_index = next((idx for idx, res in enumerate(search_results) 
                                 if res.get("title") == doc.get("titulo")), None)
@@ -0,0 +1,191 @@
+"""
+Enrutamiento de Respuestas Extractivas
+-------------------------------------
+Decide si una consulta tipo pregunta frecuente (salario mínimo, días de
+vacaciones, licencia de maternidad...) se puede responder directamente con un
+pasaje del documento mejor clasificado, sin llamar al LLM. La decisión combina:
+- El tipo de pregunta (cantidad, plazo, definición o derecho/obligación) y un
+  patrón de respuesta directa en el pasaje (cifra con unidad, definición,
+  "tiene derecho", "deberá"...)
+- La cobertura de los términos de la consulta en el pasaje
+- El margen de puntuación BM25 entre el primer y el segundo documento (con un
+  solo documento recuperado no hay margen con el que comparar y se usa 0)
+
+Las consultas largas o sobre la situación personal del usuario ("me
+despidieron", "mi empleador") siempre pasan al LLM.
+"""
+
+import re
+import logging
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from app.services.context_packer import count_tokens, split_passages
+
+logger = logging.getLogger("ai_service")
+
+# Palabras máximas de una consulta tipo pregunta frecuente
+MAX_QUERY_WORDS = 18
+
+# Cobertura mínima de los términos de la consulta en el pasaje
+MIN_COVERAGE = 0.5
+
+_NUMBER = (
+    r"(\d+(?:[.,]\d+)?|un|una|uno|dos|tres|cuatro|cinco|seis|siete|ocho|nueve|diez|once|doce|"
+    r"trece|catorce|quince|dieciseis|diecisiete|dieciocho|diecinueve|veinte|treinta|cuarenta|"
+    r"cincuenta|sesenta|noventa|cien|ciento)"
+)
+_UNIT = r"(\(\d+\)\s*)?(dias?|semanas?|mes(es)?|anos?|horas?|%|por ciento|salarios?|smmlv|pesos)"
+_QUANTITY = rf"\b{_NUMBER}\s+{_UNIT}\b|\$\s*\d"
+
+# Tipo de pregunta: (patrón en la consulta, patrón de respuesta directa en el pasaje)
+_QUESTION_TYPES = {
+    "cantidad": (
+        r"\bcuant[oa]s?\b|\bcual es el (valor|monto|porcentaje)\b|\bque porcentaje\b",
+        _QUANTITY
+    ),
+    "plazo": (
+        r"\bcuando\b|\bplazo\b|\btermino para\b",
+        rf"{_QUANTITY}|\bdentro de\b|\ba partir de\b|\bantes de\b"
+    ),
+    "definicion": (
+        r"^(que es|que son|en que consiste|que significa|que se entiende por|que se entiende)\b",
+        # {subject}: término definido; el pasaje debe definirlo, no sólo contener "es"
+        r"\b{subject}\s+(es|son)\s+(el|la|los|las|un|una|aquel|aquella|aquellos|aquellas)\b"
+        r"|\b{subject}\s+(consiste en|se define como|se entiende como)\b"
+        r"|\bse (entiende|denomina|define|llama)\s+(por\s+|como\s+)?{subject}\b"
+    ),
+    "derecho": (
+        r"\b(tengo|tiene|tienen) derecho\b|\b(puede|puedo|debe|debo)\b|\bes obligatori",
+        r"\btienen? derecho\b|\bdeberan?\b|\bestan? obligad|\bpodran?\b|\bse prohibe\b"
+    ),
+}
+
+# Consultas sobre la situación personal del usuario: requieren razonamiento
+_PERSONAL_CASE = re.compile(r"\b(mi|mis|me|nos)\b")
+
+# Palabras interrogativas que no cuentan como términos de la consulta
+_QUESTION_WORDS = {"cuant", "cual", "cuale", "cuand", "donde", "como", "tengo", "tiene", "puedo", "puede"}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def _definition_subject(normalized_query: str) -> str:
+    """Término definido en una pregunta de definición ("que es la prima" → "prima")"""
+    subject = re.sub(_QUESTION_TYPES["definicion"][0], "", normalized_query).strip(" ¿?¡!.")
+    return re.sub(r"^(el|la|los|las|un|una|lo)\s+", "", subject)
+
+
+class ExtractiveAnswerRouter:
+    """Decide qué consultas se responden con un pasaje, sin LLM"""
+
+    def __init__(self, threshold: float = 0.75, enabled: bool = True):
+        """
+        Inicializa el enrutador
+
+        Args:
+            threshold: Puntuación mínima (0-1) para responder sin LLM
+            enabled: Si es False, todas las consultas pasan al LLM
+        """
+        self.threshold = threshold
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"evaluated": 0, "answered": 0, "rejected_question": 0,
+                       "rejected_pattern": 0, "rejected_score": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def question_type(self, query_text: str) -> Optional[str]:
+        """Tipo de pregunta frecuente de la consulta, o None si no aplica la ruta extractiva"""
+        normalized = _normalize(query_text).strip(" ¿?¡!.")
+        words = normalized.split()
+        if not words or len(words) > MAX_QUERY_WORDS or _PERSONAL_CASE.search(normalized):
+            return None
+        for name, (query_pattern, _) in _QUESTION_TYPES.items():
+            if re.search(query_pattern, normalized):
+                return name
+        return None
+
+    def route(self, query_text: str, search_results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Evalúa si la consulta se responde con un pasaje del primer documento.
+
+        Args:
+            query_text: Consulta del usuario
+            search_results: Documentos recuperados con BM25, en orden de ranking
+
+        Returns:
+            Diccionario con el pasaje ("passage"), la puntuación ("score"), la
+            cobertura, el margen y el tipo de pregunta; None si debe usarse el LLM
+        """
+        if not self.enabled or not search_results:
+            return None
+        self._count("evaluated")
+
+        question_type = self.question_type(query_text)
+        if question_type is None:
+            self._count("rejected_question")
+            return None
+
+        terms = sorted({
+            word[:5] for word in re.findall(r"[a-zñ0-9]+", _normalize(query_text))
+            if len(word) > 3 and word[:5] not in _QUESTION_WORDS
+        })
+        answer_pattern = _QUESTION_TYPES[question_type][1]
+        if question_type == "definicion":
+            subject = _definition_subject(_normalize(query_text).strip(" ¿?¡!."))
+            # Sin término definido ningún pasaje cuenta como definición
+            answer_pattern = (
+                answer_pattern.replace("{subject}", re.escape(subject).replace("\\ ", r"\s+"))
+                if subject else r"(?!)"
+            )
+        top = search_results[0]
+        best = None
+        for passage in split_passages(top.get("content") or top.get("snippet", ""), count_tokens):
+            normalized = _normalize(passage)
+            if not re.search(answer_pattern, normalized):
+                continue
+            coverage = sum(1 for term in terms if term in normalized) / len(terms) if terms else 0.0
+            if best is None or coverage > best[0]:
+                best = (coverage, passage)
+        if best is None or best[0] < MIN_COVERAGE:
+            self._count("rejected_pattern")
+            return None
+
+        # Margen relativo entre el primer y el segundo documento. Con un solo
+        # documento no hay evidencia de margen: sólo la cobertura no basta
+        top_score = float(top.get("relevance_score") or 0)
+        if len(search_results) > 1 and top_score > 0:
+            second_score = float(search_results[1].get("relevance_score") or 0)
+            margin = max(0.0, 1.0 - second_score / top_score)
+        else:
+            margin = 0.0
+
+        coverage, passage = best
+        score = 0.5 * coverage + 0.5 * margin
+        if score < self.threshold:
+            self._count("rejected_score")
+            return None
+
+        self._count("answered")
+        return {
+            "passage": passage,
+            "score": round(score, 3),
+            "coverage": round(coverage, 3),
+            "margin": round(margin, 3),
+            "question_type": question_type
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve cuántas consultas se evaluaron y cuántas se respondieron sin LLM"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["answer_rate"] = round(stats["answered"] / stats["evaluated"], 3) if stats["evaluated"] else 0.0
+        stats["threshold"] = self.threshold
+        return stats
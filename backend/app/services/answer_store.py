@@ -0,0 +1,306 @@
+"""
+Almacén de Respuestas Precalculadas
+----------------------------------
+Respuestas generadas fuera de línea (app/scripts/precompute_answers.py) para
+las preguntas más frecuentes, servidas por /ask sin búsqueda ni LLM.
+
+- query_log: frecuencia de cada pregunta normalizada (las consultas de /ask
+  se acumulan en memoria y se escriben por lotes)
+- precomputed_answers: tabla versionada; cada regeneración de un grupo de
+  preguntas crea una nueva versión y desactiva la anterior
+- answer_variants: preguntas casi idénticas que comparten la respuesta de su grupo
+
+Cada respuesta guarda la versión (updated_at) de los documentos que cita.
+Mientras la generación del corpus no cambie la respuesta es válida sin más
+consultas; si cambió, se comparan los documentos citados y la respuesta se
+desactiva si alguno se modificó o se eliminó.
+"""
+
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.corpus_generation import get_corpus_generation
+from app.models.legal_document import LegalDocument
+
+logger = logging.getLogger("ai_service")
+
+# Consultas acumuladas en memoria antes de escribir el registro
+QUERY_LOG_FLUSH_SIZE = 50
+
+# Segundos máximos entre escrituras del registro de consultas
+QUERY_LOG_FLUSH_INTERVAL = 30.0
+
+
+def normalize_question(query_text: str) -> str:
+    """Clave de una pregunta: minúsculas, sin tildes ni signos de puntuación"""
+    text = unicodedata.normalize("NFD", query_text.lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return " ".join(re.findall(r"[a-zñ0-9]+", text))
+
+
+def document_versions(db: Session, doc_ids: Sequence[Any]) -> Dict[str, str]:
+    """
+    Versión actual (updated_at) de los documentos indicados.
+
+    Args:
+        db: Sesión de base de datos
+        doc_ids: IDs de los documentos
+
+    Returns:
+        Diccionario {id: updated_at}; los documentos eliminados no aparecen
+    """
+    ids = [int(doc_id) for doc_id in doc_ids if str(doc_id).isdigit()]
+    if not ids:
+        return {}
+    rows = db.query(LegalDocument.id, LegalDocument.updated_at).filter(LegalDocument.id.in_(ids)).all()
+    return {str(doc_id): str(updated_at) for doc_id, updated_at in rows}
+
+
+class AnswerStore:
+    """Respuestas precalculadas y registro de frecuencia de preguntas en SQLite"""
+
+    def __init__(self, db_path: str, enabled: bool = True):
+        """
+        Inicializa el almacén
+
+        Args:
+            db_path: Ruta de la base de datos SQLite
+            enabled: Si es False, get() nunca devuelve respuestas (el registro sigue activo)
+        """
+        self.db_path = db_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending: Dict[str, Tuple[str, int, float]] = {}
+        self._last_flush = time.time()
+        self._stats = {"hits": 0, "misses": 0, "invalidated": 0, "logged": 0, "errors": 0}
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión SQLite del hilo actual; la base de datos se crea en el primer uso, no al importar"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._initialized:
+                    self._initialize_db()
+                    self._initialized = True
+        return conn
+
+    def _initialize_db(self) -> None:
+        try:
+            conn = self._connection()
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS query_log (
+                query_key TEXT PRIMARY KEY,
+                query_text TEXT NOT NULL,
+                hits INTEGER NOT NULL,
+                last_seen REAL NOT NULL
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS precomputed_answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cluster_key TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                query_text TEXT NOT NULL,
+                data TEXT NOT NULL,
+                doc_versions TEXT NOT NULL,
+                corpus_generation INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                active INTEGER NOT NULL DEFAULT 1,
+                UNIQUE (cluster_key, version)
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS answer_variants (
+                query_key TEXT PRIMARY KEY,
+                cluster_key TEXT NOT NULL
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_query_log_hits ON query_log(hits)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_precomputed_active ON precomputed_answers(cluster_key, active)')
+            conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Error al inicializar el almacén de respuestas: {str(e)}")
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += amount
+
+    def log_query(self, query_text: str) -> None:
+        """Registra una consulta para el cálculo de preguntas frecuentes (escritura por lotes)"""
+        query_key = normalize_question(query_text)
+        if not query_key:
+            return
+        now = time.time()
+        with self._lock:
+            _, hits, _ = self._pending.get(query_key, (query_text, 0, now))
+            self._pending[query_key] = (query_text, hits + 1, now)
+            self._stats["logged"] += 1
+            due = len(self._pending) >= QUERY_LOG_FLUSH_SIZE or now - self._last_flush >= QUERY_LOG_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Escribe en disco las consultas acumuladas en memoria"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.time()
+        if not pending:
+            return
+        try:
+            conn = self._connection()
+            conn.executemany('''
+            INSERT INTO query_log (query_key, query_text, hits, last_seen) VALUES (?, ?, ?, ?)
+            ON CONFLICT(query_key) DO UPDATE SET hits = hits + excluded.hits, last_seen = excluded.last_seen
+            ''', [(key, text, hits, seen) for key, (text, hits, seen) in pending.items()])
+            conn.commit()
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"❌ Error al escribir el registro de consultas: {str(e)}")
+
+    def top_questions(self, limit: int) -> List[Tuple[str, int]]:
+        """
+        Preguntas más frecuentes del registro.
+
+        Returns:
+            Lista [(texto de la pregunta, frecuencia)] de mayor a menor frecuencia
+        """
+        conn = self._connection()
+        rows = conn.execute(
+            'SELECT query_text, hits FROM query_log ORDER BY hits DESC, last_seen DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [(text, hits) for text, hits in rows]
+
+    def get(self, db: Session, query_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca la respuesta precalculada vigente de una pregunta.
+
+        Args:
+            db: Sesión de base de datos (para verificar los documentos citados)
+            query_text: Pregunta del usuario
+
+        Returns:
+            Datos de la respuesta (response, references, confidence_score,
+            needs_human_review, review_reason) o None si no hay una vigente
+        """
+        if not self.enabled:
+            return None
+        try:
+            conn = self._connection()
+            row = conn.execute('''
+            SELECT a.id, a.data, a.doc_versions, a.corpus_generation
+            FROM answer_variants v
+            JOIN precomputed_answers a ON a.cluster_key = v.cluster_key AND a.active = 1
+            WHERE v.query_key = ?
+            ''', (normalize_question(query_text),)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+
+            answer_id, data, doc_versions, generation = row
+            current_generation = get_corpus_generation(db)
+            if generation != current_generation:
+                # El corpus cambió: la respuesta sigue vigente sólo si sus documentos no cambiaron
+                cited_versions = json.loads(doc_versions)
+                if document_versions(db, list(cited_versions)) != cited_versions:
+                    conn.execute('UPDATE precomputed_answers SET active = 0 WHERE id = ?', (answer_id,))
+                    conn.commit()
+                    self._count("invalidated")
+                    self._count("misses")
+                    logger.info(f"♻️ Respuesta precalculada invalidada por cambios en sus documentos: {answer_id}")
+                    return None
+                conn.execute('UPDATE precomputed_answers SET corpus_generation = ? WHERE id = ?',
+                             (current_generation, answer_id))
+                conn.commit()
+
+            self._count("hits")
+            return json.loads(data)
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"❌ Error al leer el almacén de respuestas: {str(e)}")
+            return None
+
+    def save(self, db: Session, query_text: str, variants: Sequence[str],
+             data: Dict[str, Any], doc_ids: Sequence[Any]) -> int:
+        """
+        Guarda una nueva versión de la respuesta de un grupo de preguntas.
+
+        Args:
+            db: Sesión de base de datos (para registrar la versión de los documentos)
+            query_text: Pregunta representativa del grupo (con la que se generó la respuesta)
+            variants: Preguntas casi idénticas que comparten la respuesta
+            data: Datos de la respuesta
+            doc_ids: IDs de los documentos en los que se basa la respuesta
+
+        Returns:
+            Número de versión guardado
+        """
+        cluster_key = normalize_question(query_text)
+        doc_versions = document_versions(db, doc_ids)
+        generation = get_corpus_generation(db)
+        conn = self._connection()
+        with conn:
+            version = conn.execute(
+                'SELECT COALESCE(MAX(version), 0) + 1 FROM precomputed_answers WHERE cluster_key = ?', (cluster_key,)
+            ).fetchone()[0]
+            conn.execute('UPDATE precomputed_answers SET active = 0 WHERE cluster_key = ?', (cluster_key,))
+            conn.execute('''
+            INSERT INTO precomputed_answers
+                (cluster_key, version, query_text, data, doc_versions, corpus_generation, created_at, active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+            ''', (cluster_key, version, query_text, json.dumps(data, ensure_ascii=False),
+                  json.dumps(doc_versions), generation, time.time()))
+            keys = {normalize_question(variant) for variant in variants} | {cluster_key}
+            conn.executemany(
+                'INSERT OR REPLACE INTO answer_variants (query_key, cluster_key) VALUES (?, ?)',
+                [(key, cluster_key) for key in keys if key]
+            )
+        return version
+
+    def invalidate_stale(self, db: Session) -> int:
+        """
+        Desactiva las respuestas cuyos documentos citados cambiaron.
+
+        Returns:
+            Número de respuestas desactivadas
+        """
+        conn = self._connection()
+        rows = conn.execute('SELECT id, doc_versions FROM precomputed_answers WHERE active = 1').fetchall()
+        stale = [
+            answer_id for answer_id, doc_versions in rows
+            if document_versions(db, list(json.loads(doc_versions))) != json.loads(doc_versions)
+        ]
+        if stale:
+            with conn:
+                conn.executemany('UPDATE precomputed_answers SET active = 0 WHERE id = ?', [(i,) for i in stale])
+            self._count("invalidated", len(stale))
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores y el número de respuestas vigentes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending_log"] = len(self._pending)
+        try:
+            stats["active_answers"] = self._connection().execute(
+                'SELECT COUNT(*) FROM precomputed_answers WHERE active = 1'
+            ).fetchone()[0]
+        except Exception:
+            stats["active_answers"] = None
+        return stats
@@ -28,6 +28,8 @@ logger.info("Inicializando servicio de autenticación")
 
 # Configurar OAuth2PasswordBearer con la ruta correcta
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+# Variante para endpoints que también aceptan peticiones anónimas
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 logger.info("oauth2_scheme configurado con tokenUrl='api/auth/login'")
 
 class AuthService:
@@ -120,6 +122,20 @@ class AuthService:
             )
         return current_user
 
+    @staticmethod
+    def get_optional_user(
+        token: Optional[str] = Depends(oauth2_scheme_optional),
+        db: Session = Depends(get_db)
+    ) -> Optional[Usuario]:
+        """
+        Usuario del token para endpoints que también aceptan peticiones
+        anónimas: None sin token; un token inválido o de un usuario inactivo
+        se rechaza igual que en get_current_active_user.
+        """
+        if not token:
+            return None
+        return AuthService.get_current_active_user(AuthService.get_current_user(token=token, db=db))
+
     @staticmethod
     def get_current_admin_user(
         current_user: Usuario = Depends(get_current_active_user)
@@ -0,0 +1,353 @@
+"""
+Generación Masiva de Respuestas
+------------------------------
+Responde lotes de preguntas (formularios de ingreso, regeneración tras un
+cambio normativo) con el mismo flujo de generate_legal_response:
+- Las preguntas se leen de un archivo .txt (una por línea), .csv o .jsonl
+- La búsqueda BM25 se hace por lotes en un hilo aparte, con una sola sesión
+  de base de datos por lote, y va adelantándose a la generación
+- Las llamadas al LLM se hacen en paralelo con concurrencia acotada sobre el
+  cliente asíncrono (pasan por el limitador de tasa y el interruptor de circuito)
+- Cada respuesta se agrega al archivo JSONL de salida apenas termina. El
+  propio archivo es el punto de control: al reanudar se omiten las preguntas
+  que ya tienen respuesta y las que fallaron se vuelven a intentar
+
+Se usa desde app/scripts/bulk_generate.py y desde los endpoints de /bulk.
+"""
+
+import os
+import csv
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.schemas.legal_document import SearchQuery
+from app.services.ai_service import (
+    LEGAL_ERROR_MESSAGE, LEGAL_UNAVAILABLE_MESSAGE, NO_LEGAL_DOCUMENTS_MESSAGE, RETRIEVAL_ONLY_INTRO
+)
+
+logger = logging.getLogger(__name__)
+
+# Columnas reconocidas como texto de la pregunta en archivos .csv y .jsonl
+QUESTION_FIELDS = ("pregunta", "question", "query", "query_text", "consulta")
+
+# Archivos de un trabajo de /bulk dentro de su directorio
+QUESTIONS_FILE = "questions.jsonl"
+RESULTS_FILE = "results.jsonl"
+
+
+def read_questions(path: str) -> List[Dict[str, str]]:
+    """
+    Lee las preguntas de un archivo.
+
+    Args:
+        path: Archivo .txt (una pregunta por línea), .csv (columna pregunta,
+            question, query o consulta; si no, la primera) o .jsonl (mismos
+            campos). En .csv y .jsonl la columna "id" identifica la pregunta.
+
+    Returns:
+        Lista de {"id", "question"}; sin id se usa el número de la pregunta en el archivo
+    """
+    suffix = Path(path).suffix.lower()
+    rows: List[Dict[str, Any]] = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if suffix == ".csv":
+            reader = csv.reader(f)
+            header = next(reader, [])
+            fields = [name.strip().lower() for name in header]
+            column = next((fields.index(name) for name in QUESTION_FIELDS if name in fields), None)
+            if column is None:
+                # Sin encabezado reconocido: la primera columna es la pregunta
+                column, fields = 0, []
+                rows.append({"question": header[0]} if header else {})
+            id_column = fields.index("id") if "id" in fields else None
+            for values in reader:
+                if len(values) > column:
+                    row = {"question": values[column]}
+                    if id_column is not None and len(values) > id_column:
+                        row["id"] = values[id_column]
+                    rows.append(row)
+        elif suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    question = next((data[name] for name in QUESTION_FIELDS if data.get(name)), "")
+                    rows.append({"id": data.get("id"), "question": question})
+        else:
+            rows = [{"question": line} for line in f]
+
+    questions = []
+    for number, row in enumerate(rows, 1):
+        question = str(row.get("question") or "").strip()
+        if question:
+            question_id = row.get("id")
+            questions.append({"id": str(question_id) if question_id not in (None, "") else str(number),
+                              "question": question})
+    return questions
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """
+    IDs de las preguntas que ya tienen respuesta en el archivo de salida.
+    Una última línea incompleta (proceso interrumpido a mitad de escritura)
+    se descarta del archivo.
+    """
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    valid_bytes = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(line)
+    if valid_bytes < os.path.getsize(output_path):
+        logger.warning(f"Descartando línea incompleta al final de {output_path}")
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_bytes)
+    return done
+
+
+def _is_failure(response_text: str) -> bool:
+    """Respuesta que indica una falla del LLM (se reintenta al reanudar, no se guarda)"""
+    return response_text in (LEGAL_ERROR_MESSAGE, LEGAL_UNAVAILABLE_MESSAGE) or response_text.startswith(RETRIEVAL_ONLY_INTRO)
+
+
+class BulkGenerator:
+    """Genera respuestas para un lote de preguntas con concurrencia acotada"""
+
+    def __init__(self, search_service, ai_service, concurrency: int = 8, retrieval_batch_size: int = 25,
+                 session_factory: Optional[Callable[[], Session]] = None, user_id: str = "bulk_generation"):
+        """
+        Inicializa el generador
+
+        Args:
+            search_service: Servicio de búsqueda (search_documents)
+            ai_service: Servicio de IA (agenerate_legal_response)
+            concurrency: Llamadas simultáneas al LLM
+            retrieval_batch_size: Preguntas por lote de búsqueda
+            session_factory: Crea las sesiones de base de datos (por defecto SessionLocal)
+            user_id: Usuario con el que se reparte el límite de tasa hacia OpenAI
+        """
+        if session_factory is None:
+            from app.db.database import SessionLocal
+            session_factory = SessionLocal
+        self.search_service = search_service
+        self.ai_service = ai_service
+        self.concurrency = max(1, concurrency)
+        self.retrieval_batch_size = max(1, retrieval_batch_size)
+        self.session_factory = session_factory
+        self.user_id = user_id
+
+    def _retrieve(self, batch: List[Dict[str, str]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        Búsqueda BM25 de un lote de preguntas con una sola sesión. Una pregunta
+        inválida (p. ej. demasiado corta) o cuya búsqueda falla no afecta al
+        resto del lote: su resultado es None.
+        """
+        db = self.session_factory()
+        try:
+            results = []
+            for item in batch:
+                try:
+                    results.append(self.search_service.search_documents(db, SearchQuery(query=item["question"], limit=5)))
+                except Exception as e:
+                    logger.error(f"Error en la búsqueda de {item['id']}: {str(e)}")
+                    db.rollback()
+                    results.append(None)
+            return results
+        finally:
+            db.close()
+
+    async def _answer(self, item: Dict[str, str], search_results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Genera la respuesta de una pregunta; None si el LLM falló"""
+        start_time = time.time()
+        if search_results:
+            response_text, confidence_score, cited_documents, needs_review = await self.ai_service.agenerate_legal_response(
+                query_text=item["question"],
+                search_results=search_results,
+                user_id=self.user_id
+            )
+            if _is_failure(response_text):
+                return None
+        else:
+            response_text, confidence_score, cited_documents, needs_review = NO_LEGAL_DOCUMENTS_MESSAGE, 0.0, [], True
+
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "response": response_text,
+            "references": cited_documents,
+            "confidence_score": confidence_score,
+            "needs_human_review": needs_review,
+            "processing_time_ms": round((time.time() - start_time) * 1000, 2),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    async def run(self, questions: List[Dict[str, str]], output_path: str,
+                  progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Responde las preguntas que aún no están en el archivo de salida.
+
+        Args:
+            questions: Preguntas {"id", "question"} (ver read_questions)
+            output_path: Archivo JSONL de resultados (se agrega al final)
+            progress: Diccionario que se actualiza durante la ejecución (opcional)
+
+        Returns:
+            Resumen: total, ya respondidas, escritas, fallidas y segundos
+        """
+        started = time.time()
+        done = completed_ids(output_path)
+        pending = [item for item in questions if item["id"] not in done]
+        summary = progress if progress is not None else {}
+        summary.update({"total": len(questions), "skipped": len(questions) - len(pending),
+                        "written": 0, "failed": 0})
+        logger.info(f"Generación masiva: {len(pending)} preguntas pendientes de {len(questions)}")
+        if not pending:
+            summary["elapsed_seconds"] = 0.0
+            return summary
+
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        work: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def retrieve_all():
+            try:
+                for start in range(0, len(pending), self.retrieval_batch_size):
+                    batch = pending[start:start + self.retrieval_batch_size]
+                    try:
+                        results = await asyncio.to_thread(self._retrieve, batch)
+                    except Exception as e:
+                        logger.error(f"Error en la búsqueda de un lote: {str(e)}")
+                        summary["failed"] += len(batch)
+                        continue
+                    for item, search_results in zip(batch, results):
+                        if search_results is None:
+                            summary["failed"] += 1
+                            continue
+                        await work.put((item, search_results))
+            finally:
+                for _ in range(self.concurrency):
+                    await work.put(None)
+
+        with open(output_path, "a", encoding="utf-8") as output:
+            async def generate():
+                while True:
+                    entry = await work.get()
+                    if entry is None:
+                        return
+                    item, search_results = entry
+                    try:
+                        record = await self._answer(item, search_results)
+                    except Exception as e:
+                        logger.error(f"Error al generar la respuesta de {item['id']}: {str(e)}")
+                        record = None
+                    if record is None:
+                        summary["failed"] += 1
+                        continue
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+                    summary["written"] += 1
+
+            await asyncio.gather(retrieve_all(), *(generate() for _ in range(self.concurrency)))
+            os.fsync(output.fileno())
+
+        summary["elapsed_seconds"] = round(time.time() - started, 2)
+        logger.info(f"Generación masiva completada: {summary}")
+        return summary
+
+
+class BulkJobManager:
+    """Trabajos de generación masiva de /bulk: cada uno en su directorio bajo jobs_dir"""
+
+    def __init__(self, jobs_dir: str, generator_factory: Callable[[], BulkGenerator]):
+        """
+        Inicializa el administrador
+
+        Args:
+            jobs_dir: Directorio con un subdirectorio por trabajo (preguntas y resultados)
+            generator_factory: Crea el generador de cada ejecución
+        """
+        self.jobs_dir = jobs_dir
+        self.generator_factory = generator_factory
+        self._running: Dict[str, asyncio.Task] = {}
+        self._progress: Dict[str, Dict[str, Any]] = {}
+
+    def _job_dir(self, job_id: str) -> Path:
+        return Path(self.jobs_dir) / job_id
+
+    def exists(self, job_id: str) -> bool:
+        """Indica si el trabajo existe (también los de ejecuciones anteriores del proceso)"""
+        return (self._job_dir(job_id) / QUESTIONS_FILE).exists()
+
+    def results_path(self, job_id: str) -> str:
+        return str(self._job_dir(job_id) / RESULTS_FILE)
+
+    def create(self, questions: List[Dict[str, str]]) -> str:
+        """
+        Guarda las preguntas de un trabajo nuevo e inicia su ejecución.
+
+        Returns:
+            ID del trabajo
+        """
+        job_id = str(uuid.uuid4())
+        job_dir = self._job_dir(job_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        with open(job_dir / QUESTIONS_FILE, "w", encoding="utf-8") as f:
+            for item in questions:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        self.start(job_id)
+        return job_id
+
+    def start(self, job_id: str) -> bool:
+        """
+        Ejecuta (o reanuda) un trabajo en segundo plano.
+
+        Returns:
+            False si el trabajo ya está en ejecución
+        """
+        task = self._running.get(job_id)
+        if task is not None and not task.done():
+            return False
+        questions = read_questions(str(self._job_dir(job_id) / QUESTIONS_FILE))
+        progress = self._progress.setdefault(job_id, {})
+        progress.pop("error", None)
+        task = asyncio.create_task(self.generator_factory().run(questions, self.results_path(job_id), progress))
+        task.add_done_callback(lambda finished: self._finished(job_id, finished))
+        self._running[job_id] = task
+        return True
+
+    def _finished(self, job_id: str, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error en el trabajo de generación masiva {job_id}: {task.exception()}")
+            self._progress[job_id]["error"] = str(task.exception())
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        """Estado del trabajo: running, completed (todas respondidas) o incomplete (reanudable)"""
+        total = len(read_questions(str(self._job_dir(job_id) / QUESTIONS_FILE)))
+        progress = dict(self._progress.get(job_id, {}))
+        task = self._running.get(job_id)
+        if task is not None and not task.done():
+            state = "running"
+            answered = progress.get("skipped", 0) + progress.get("written", 0)
+        else:
+            answered = len(completed_ids(self.results_path(job_id)))
+            state = "completed" if answered >= total else "incomplete"
+        return {"job_id": job_id, "status": state, "total": total, "answered": answered, "last_run": progress}
+
+    async def stop(self) -> None:
+        """Cancela los trabajos en ejecución (se reanudan con start)"""
+        for task in self._running.values():
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        self._running = {}
@@ -0,0 +1,272 @@
+"""
+Empaquetado de Contexto por Tokens
+---------------------------------
+Selecciona qué fragmentos de los documentos recuperados entran en el prompt
+del LLM dentro de un presupuesto de tokens. Cada documento se divide en
+pasajes (oraciones o trozos de oraciones largas); el valor de un pasaje
+combina la relevancia BM25 del documento con la presencia de términos de la
+consulta. La selección es una mochila de elección múltiple: por documento se
+elige cuántos de sus mejores pasajes incluir (o ninguno), pagando una sola vez
+el costo de su encabezado (id, título, referencia).
+
+Los tokens se cuentan con tiktoken. La primera carga de una codificación
+descarga sus archivos BPE (y los guarda en TIKTOKEN_CACHE_DIR), por lo que se
+hace al arrancar, en un hilo, con load_encoders. Dentro del bucle de eventos
+nunca se carga una codificación: mientras no esté cargada, o si no se pudo
+descargar, se usa una aproximación conservadora.
+"""
+
+import re
+import math
+import asyncio
+import logging
+import unicodedata
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("ai_service")
+
+# Tokens máximos de un pasaje; las oraciones más largas se dividen por palabras
+MAX_PASSAGE_TOKENS = 120
+
+_encoders: Dict[str, Any] = {}
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def _get_encoder(model: Optional[str]):
+    """
+    Obtiene (una vez por modelo) la codificación de tiktoken, o None si no
+    está disponible. En el bucle de eventos sólo devuelve codificaciones ya
+    cargadas, porque la carga puede descargar archivos.
+    """
+    key = model or ""
+    if key not in _encoders:
+        if _in_event_loop():
+            return None
+        encoder = None
+        try:
+            import tiktoken
+            try:
+                encoder = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+            except KeyError:
+                encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            if not any(value is None for value in _encoders.values()):
+                logger.warning(f"⚠️ Codificación de tiktoken no disponible, se usará una aproximación: {type(e).__name__}")
+        _encoders[key] = encoder
+    return _encoders[key]
+
+
+def load_encoders(models: Sequence[Optional[str]]) -> Dict[str, bool]:
+    """
+    Carga las codificaciones de tiktoken de los modelos (puede descargar sus
+    archivos). Se ejecuta al arrancar, fuera del bucle de eventos.
+
+    Args:
+        models: Modelos a cargar (None = cl100k_base)
+
+    Returns:
+        Diccionario {modelo: si la codificación quedó disponible}
+    """
+    return {model or "cl100k_base": _get_encoder(model) is not None for model in dict.fromkeys(models)}
+
+
+def _approximate_tokens(text: str) -> int:
+    """Aproximación conservadora: ~3.5 caracteres por token en palabras, 1 por signo"""
+    tokens = 0
+    for piece in re.findall(r"\w+|[^\w\s]", text):
+        tokens += math.ceil(len(piece) / 3.5) if piece[0].isalnum() or piece[0] == "_" else 1
+    return tokens
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Cuenta los tokens de un texto.
+
+    Args:
+        text: Texto a contar
+        model: Modelo cuyo tokenizador se usa (por defecto cl100k_base)
+
+    Returns:
+        Número de tokens
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder(model)
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return _approximate_tokens(text)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.lower())
+    return "".join(c for c in text if unicodedata.category(c) != "Mn")
+
+
+def _query_terms(query_text: str) -> List[str]:
+    """Términos de la consulta reducidos a un prefijo de 5 letras (raíz aproximada)"""
+    words = re.findall(r"[a-zñ0-9]+", _normalize(query_text))
+    return sorted({word[:5] for word in words if len(word) > 3})
+
+
+def split_passages(text: str, token_counter: Callable[[str], int]) -> List[str]:
+    """
+    Divide un texto en pasajes por oraciones; las oraciones muy largas se
+    dividen en trozos de palabras completas. Los tokens de un trozo se
+    acumulan palabra por palabra (con su espacio inicial), sin volver a
+    contar el trozo completo, de modo que el costo es lineal en el texto.
+
+    Args:
+        text: Texto del documento
+        token_counter: Función para contar tokens
+
+    Returns:
+        Lista de pasajes en el orden del texto
+    """
+    passages = []
+    for sentence in re.split(r"(?<=[.!?;:])\s+|\n+", text or ""):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if token_counter(sentence) <= MAX_PASSAGE_TOKENS:
+            passages.append(sentence)
+            continue
+        chunk = []
+        chunk_tokens = 0
+        for word in sentence.split():
+            chunk_tokens += token_counter(" " + word if chunk else word)
+            chunk.append(word)
+            if chunk_tokens >= MAX_PASSAGE_TOKENS:
+                passages.append(" ".join(chunk))
+                chunk = []
+                chunk_tokens = 0
+        if chunk:
+            passages.append(" ".join(chunk))
+    return passages
+
+
+def pack_documents(
+    query_text: str,
+    documents: Sequence[Dict[str, Any]],
+    token_budget: int,
+    render: Callable[[List[Tuple[int, str]]], str],
+    model: Optional[str] = None
+) -> List[Tuple[int, str]]:
+    """
+    Elige el contenido de cada documento que maximiza el valor total sin
+    superar el presupuesto de tokens.
+
+    Args:
+        query_text: Consulta del usuario
+        documents: Documentos con "content" y "score" (relevancia BM25), en orden de ranking
+        token_budget: Tokens disponibles para el contexto renderizado (incluida su estructura)
+        render: Función que renderiza [(índice_documento, contenido)] como texto del prompt;
+            con una lista vacía debe devolver la estructura sin documentos
+        model: Modelo cuyo tokenizador se usa
+
+    Returns:
+        Lista [(índice_documento, contenido_seleccionado)] en el orden original
+    """
+    def counter(text: str) -> int:
+        return count_tokens(text, model)
+
+    base_tokens = counter(render([]))
+    budget = int(token_budget) - base_tokens
+    if budget <= 0 or not documents:
+        return []
+
+    terms = _query_terms(query_text)
+    max_score = max((float(doc.get("score") or 0) for doc in documents), default=0.0)
+    separator_tokens = counter(" ... ")
+
+    # Opciones por documento: (costo, valor, pasajes elegidos)
+    doc_options = []
+    doc_passages = []
+    for doc_index, doc in enumerate(documents):
+        passages = split_passages(doc.get("content", ""), counter)
+        doc_passages.append(passages)
+        if max_score > 0:
+            doc_weight = max(float(doc.get("score") or 0), 0.0) / max_score
+        else:
+            doc_weight = 1.0 / (doc_index + 1)
+        header_tokens = counter(render([(doc_index, "")])) - base_tokens
+
+        scored = []
+        for position, passage in enumerate(passages):
+            normalized = _normalize(passage)
+            coverage = sum(1 for term in terms if term in normalized) / len(terms) if terms else 0.0
+            value = doc_weight * (1.0 + coverage) * (1.1 if position == 0 else 1.0)
+            cost = counter(passage) + separator_tokens
+            scored.append((value / cost, value, cost, position))
+        scored.sort(key=lambda item: (-item[0], item[3]))
+
+        options = [(0, 0.0, ())]
+        cost, value, chosen = header_tokens, 0.0, []
+        for _, passage_value, passage_cost, position in scored:
+            cost += passage_cost
+            value += passage_value
+            chosen.append(position)
+            if cost > budget:
+                break
+            options.append((cost, value, tuple(sorted(chosen))))
+        doc_options.append(options)
+
+    # Mochila de elección múltiple sobre el presupuesto de tokens
+    best = np.full(budget + 1, -np.inf)
+    best[0] = 0.0
+    choices = []
+    for options in doc_options:
+        next_best = np.full(budget + 1, -np.inf)
+        choice = np.zeros(budget + 1, dtype=np.int32)
+        for option_index, (cost, value, _) in enumerate(options):
+            if cost > budget:
+                continue
+            candidate = np.full(budget + 1, -np.inf)
+            candidate[cost:] = best[:budget + 1 - cost] + value
+            improved = candidate > next_best
+            next_best[improved] = candidate[improved]
+            choice[improved] = option_index
+        choices.append(choice)
+        best = next_best
+
+    # Reconstruir la selección
+    remaining = int(np.argmax(best))
+    selected = {}
+    for doc_index in range(len(documents) - 1, -1, -1):
+        cost, _, positions = doc_options[doc_index][choices[doc_index][remaining]]
+        if positions:
+            selected[doc_index] = list(positions)
+        remaining -= cost
+
+    def build() -> List[Tuple[int, str]]:
+        packed = []
+        for doc_index in sorted(selected):
+            passages = doc_passages[doc_index]
+            parts = []
+            previous = None
+            for position in selected[doc_index]:
+                if previous is not None and position != previous + 1:
+                    parts.append("...")
+                parts.append(passages[position])
+                previous = position
+            packed.append((doc_index, " ".join(parts)))
+        return packed
+
+    # Contar por partes puede diferir del total renderizado; si se excede,
+    # quitar pasajes del documento con más contenido hasta cumplir el presupuesto
+    packed = build()
+    while packed and counter(render(packed)) > token_budget:
+        doc_index = max(selected, key=lambda i: (len(selected[i]), i))
+        selected[doc_index].pop()
+        if not selected[doc_index]:
+            del selected[doc_index]
+        packed = build()
+
+    return packed
@@ -0,0 +1,239 @@
+"""
+Enrutamiento de Modelos por Complejidad
+--------------------------------------
+Elige el modelo y el presupuesto de tokens de salida de cada consulta según
+su complejidad estimada, en lugar de enviar todas al mismo modelo con el
+mismo max_tokens. La complejidad (0-1) combina:
+- La longitud de la consulta
+- Cuántos documentos recuperados son relevantes (puntuación cercana al primero)
+- La entropía de las puntuaciones BM25: sin un documento dominante, la
+  respuesta debe combinar varias fuentes
+- El flujo de onboarding de la consulta (contrato realidad, indemnización y
+  análisis de documentos suelen ser casos de varios temas)
+
+Cada consulta enrutada registra su resultado (latencia, si agotó el
+presupuesto de tokens, confianza y revisión humana) por nivel, para ajustar
+los umbrales con datos reales.
+"""
+
+import math
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.schemas.onboarding import TipoFlujo
+from app.services.context_packer import count_tokens
+from app.services.onboarding_service import OnboardingService
+
+logger = logging.getLogger("ai_service")
+
+# Palabras a partir de las cuales la longitud de la consulta cuenta como máxima
+LONG_QUERY_WORDS = 40
+
+# Documentos considerados al medir la dispersión de las puntuaciones
+MAX_ROUTING_DOCUMENTS = 5
+
+# Fracción de la puntuación del primer documento para contar uno como relevante
+RELEVANT_SCORE_RATIO = 0.5
+
+# Flujos de onboarding que suelen requerir razonamiento sobre varios temas
+COMPLEX_FLOWS = {TipoFlujo.CONTRATO_REALIDAD, TipoFlujo.INDEMNIZACION, TipoFlujo.ANALISIS_DOCUMENTO}
+
+# Peso de cada señal en la complejidad
+WEIGHTS = {"length": 0.35, "documents": 0.15, "entropy": 0.25, "flow": 0.25}
+
+# Factor sobre el max_tokens base de cada nivel. Sólo se aplica si el nivel
+# tiene su propio modelo: con el mismo modelo, recortar el presupuesto corta el
+# formato de la respuesta (referencias y confianza) y ampliarlo sólo encarece
+# las respuestas largas
+TOKEN_FACTORS = {"simple": 0.7, "standard": 1.0, "complex": 1.5}
+
+# Una respuesta que usa esta fracción del presupuesto se considera cortada
+BUDGET_HIT_RATIO = 0.95
+
+# Decisiones recientes conservadas para ajustar los umbrales
+RECENT_DECISIONS = 500
+
+# Flujos de onboarding recordados por texto de consulta (analizar_necesidad
+# tarda ~13 µs; las consultas repetidas no lo vuelven a evaluar)
+FLOW_CACHE_SIZE = 1000
+
+
+def score_entropy(search_results: List[Dict[str, Any]]) -> float:
+    """Entropía normalizada (0-1) de las puntuaciones de los primeros documentos"""
+    scores = [float(doc.get("relevance_score") or 0) for doc in search_results[:MAX_ROUTING_DOCUMENTS]]
+    scores = [score for score in scores if score > 0]
+    if len(scores) < 2:
+        return 0.0
+    total = sum(scores)
+    entropy = -sum((score / total) * math.log(score / total) for score in scores)
+    return entropy / math.log(len(scores))
+
+
+class ModelRouter:
+    """Elige modelo y presupuesto de tokens según la complejidad de la consulta"""
+
+    def __init__(self, default_model: str, simple_model: Optional[str] = None,
+                 complex_model: Optional[str] = None, simple_threshold: float = 0.35,
+                 complex_threshold: float = 0.65, enabled: bool = True):
+        """
+        Inicializa el enrutador
+
+        Args:
+            default_model: Modelo del nivel estándar
+            simple_model: Modelo de las consultas simples (None = el estándar)
+            complex_model: Modelo de las consultas complejas (None = el estándar)
+            simple_threshold: Complejidad por debajo de la cual la consulta es simple
+            complex_threshold: Complejidad desde la cual la consulta es compleja
+            enabled: Si es False, todas las consultas usan el modelo y max_tokens pedidos
+        """
+        self.models = {
+            "simple": simple_model or default_model,
+            "standard": default_model,
+            "complex": complex_model or default_model
+        }
+        self.simple_threshold = simple_threshold
+        self.complex_threshold = complex_threshold
+        self.enabled = enabled
+        self.onboarding = OnboardingService()
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, Any]] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_DECISIONS)
+        self._flows: "OrderedDict[str, str]" = OrderedDict()
+
+    def flow(self, query_text: str) -> str:
+        """Flujo de onboarding recomendado para la consulta (recordado por texto)"""
+        with self._lock:
+            flow = self._flows.get(query_text)
+            if flow is not None:
+                self._flows.move_to_end(query_text)
+                return flow
+        flow = self.onboarding.analizar_necesidad(query_text).flujo_recomendado.value
+        with self._lock:
+            self._flows[query_text] = flow
+            while len(self._flows) > FLOW_CACHE_SIZE:
+                self._flows.popitem(last=False)
+        return flow
+
+    def features(self, query_text: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Señales de complejidad de la consulta"""
+        top_score = float(search_results[0].get("relevance_score") or 0) if search_results else 0.0
+        relevant = sum(
+            1 for doc in search_results[:MAX_ROUTING_DOCUMENTS]
+            if top_score > 0 and float(doc.get("relevance_score") or 0) >= RELEVANT_SCORE_RATIO * top_score
+        )
+        return {
+            "words": len(query_text.split()),
+            "relevant_documents": relevant,
+            "entropy": round(score_entropy(search_results), 3),
+            "flow": self.flow(query_text)
+        }
+
+    def complexity(self, features: Dict[str, Any]) -> float:
+        """Complejidad (0-1) a partir de las señales"""
+        return round(
+            WEIGHTS["length"] * min(1.0, features["words"] / LONG_QUERY_WORDS)
+            + WEIGHTS["documents"] * min(1.0, features["relevant_documents"] / MAX_ROUTING_DOCUMENTS)
+            + WEIGHTS["entropy"] * features["entropy"]
+            + WEIGHTS["flow"] * (TipoFlujo(features["flow"]) in COMPLEX_FLOWS),
+            3
+        )
+
+    def route(self, query_text: str, search_results: List[Dict[str, Any]], max_tokens: int) -> Dict[str, Any]:
+        """
+        Elige el nivel de la consulta.
+
+        Args:
+            query_text: Consulta del usuario
+            search_results: Documentos recuperados con BM25, en orden de ranking
+            max_tokens: Presupuesto de salida del flujo para el nivel estándar
+
+        Returns:
+            Diccionario con el nivel ("tier"), el modelo, el max_tokens, la
+            complejidad y las señales usadas
+        """
+        if not self.enabled:
+            return {"tier": "standard", "model": self.models["standard"], "max_tokens": max_tokens,
+                    "complexity": None, "features": {}}
+
+        features = self.features(query_text, search_results)
+        complexity = self.complexity(features)
+        if complexity < self.simple_threshold:
+            tier = "simple"
+        elif complexity >= self.complex_threshold:
+            tier = "complex"
+        else:
+            tier = "standard"
+        factor = TOKEN_FACTORS[tier] if self.models[tier] != self.models["standard"] else 1.0
+        logger.info(f"🧭 Consulta de complejidad {complexity} → nivel {tier} ({self.models[tier]})")
+        return {
+            "tier": tier,
+            "model": self.models[tier],
+            "max_tokens": max(1, int(max_tokens * factor)),
+            "complexity": complexity,
+            "features": features
+        }
+
+    def record_outcome(self, route: Dict[str, Any], latency: float, response_text: Optional[str],
+                       error: Optional[str], confidence: float, needs_review: bool) -> None:
+        """
+        Registra el resultado de una consulta enrutada.
+
+        Args:
+            route: Decisión devuelta por route()
+            latency: Segundos de la generación
+            response_text: Texto generado por el modelo (None si hubo error)
+            error: Error de la generación, si lo hubo
+            confidence: Confianza de la respuesta final
+            needs_review: Si la respuesta quedó para revisión humana
+        """
+        budget_hit = bool(response_text) and (
+            count_tokens(response_text, route["model"]) >= BUDGET_HIT_RATIO * route["max_tokens"]
+        )
+        with self._lock:
+            tier = self._tiers.setdefault(route["tier"], {
+                "requests": 0, "errors": 0, "budget_hits": 0, "reviews": 0,
+                "latency_seconds": 0.0, "confidence": 0.0, "complexity": 0.0
+            })
+            tier["requests"] += 1
+            tier["errors"] += bool(error)
+            tier["budget_hits"] += budget_hit
+            tier["reviews"] += bool(needs_review)
+            tier["latency_seconds"] += latency
+            tier["confidence"] += confidence
+            tier["complexity"] += route["complexity"] or 0.0
+            self._recent.append(dict(
+                route["features"],
+                tier=route["tier"],
+                complexity=route["complexity"],
+                latency_seconds=round(latency, 3),
+                budget_hit=budget_hit,
+                confidence=confidence,
+                needs_review=bool(needs_review),
+                error=bool(error)
+            ))
+
+    def recent(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Decisiones recientes con su resultado, la más reciente al final"""
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+    def stats(self) -> Dict[str, Any]:
+        """Resultados por nivel (latencia, presupuestos agotados, confianza, revisiones) y umbrales"""
+        with self._lock:
+            tiers = {name: dict(tier) for name, tier in self._tiers.items()}
+        for tier in tiers.values():
+            requests = tier["requests"]
+            tier["avg_latency_seconds"] = round(tier.pop("latency_seconds") / requests, 3)
+            tier["avg_confidence"] = round(tier.pop("confidence") / requests, 3)
+            tier["avg_complexity"] = round(tier.pop("complexity") / requests, 3)
+            tier["budget_hit_rate"] = round(tier["budget_hits"] / requests, 3)
+            tier["review_rate"] = round(tier["reviews"] / requests, 3)
+        return {
+            "enabled": self.enabled,
+            "models": dict(self.models),
+            "simple_threshold": self.simple_threshold,
+            "complex_threshold": self.complex_threshold,
+            "tiers": tiers
+        }
@@ -12,20 +12,33 @@ import time
 import os
 import sqlite3
 import hashlib
+import base64
 import logging
+import threading
 import numpy as np
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime, timedelta
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize, sent_tokenize
 from nltk.stem import SnowballStemmer
-from rank_bm25 import BM25Okapi
 from typing import List, Dict, Any, Tuple, Optional, Union
 from sqlalchemy.orm import Session
 from sqlalchemy import func, text
 
+import sys
+# Asegurar que backend/ esté en sys.path para poder importar el módulo config
+backend_dir = Path(__file__).resolve().parent.parent.parent
+if str(backend_dir) not in sys.path:
+    sys.path.append(str(backend_dir))
+
+from config import BM25_FRESHNESS_CHECK_INTERVAL, DOCUMENT_CACHE_SIZE, DOCUMENT_CACHE_MAX_BYTES
 from app.models.legal_document import LegalDocument, DocumentType
+from app.models.corpus_generation import (
+    ensure_corpus_generation_table, get_corpus_generation, local_generation
+)
 from app.schemas.legal_document import SearchQuery, LegalDocumentSearchResult
+from app.services.bm25_index import CompactIndexBuilder
 
 # Configurar logging
 logging.basicConfig(
@@ -43,6 +56,68 @@ except LookupError:
     nltk.download('stopwords')
 
 
+# Campos disponibles para facetas y navegación por facetas
+FACET_FIELDS = ("document_type", "category", "subcategory", "year")
+
+# Filas leídas por lote al construir el índice
+INDEX_BATCH_SIZE = 500
+
+
+def _facet_value(doc: Any, field: str) -> Optional[str]:
+    """Obtiene el valor de faceta de un documento (objeto o fila) como texto"""
+    if field == "year":
+        return str(doc.issue_date.year) if doc.issue_date else None
+    value = getattr(doc, field, None)
+    if isinstance(value, DocumentType):
+        return value.value
+    return value or None
+
+
+def _stream_index_rows(db: Session, batch_size: int = INDEX_BATCH_SIZE):
+    """
+    Recorre los documentos en lotes leyendo sólo las columnas necesarias para
+    indexar (id, contenido y facetas), sin cargar objetos ORM completos.
+    """
+    return db.query(
+        LegalDocument.id, LegalDocument.content, LegalDocument.document_type,
+        LegalDocument.category, LegalDocument.subcategory, LegalDocument.issue_date
+    ).yield_per(batch_size)
+
+
+def _query_filters(search_query: SearchQuery) -> Dict[str, str]:
+    """Obtiene los filtros de faceta presentes en la consulta"""
+    filters = {}
+    if search_query.document_type:
+        filters["document_type"] = search_query.document_type.value
+    if search_query.category:
+        filters["category"] = search_query.category
+    if search_query.subcategory:
+        filters["subcategory"] = search_query.subcategory
+    if search_query.year:
+        filters["year"] = str(search_query.year)
+    return filters
+
+
+class InvalidCursorError(ValueError):
+    """El cursor de paginación es inválido o pertenece a otra generación del índice"""
+
+
+def encode_cursor(generation: Optional[int], query_key: str, score: float, doc_id: int) -> str:
+    """Codifica la posición (puntuación, id) del último resultado de una página"""
+    payload = json.dumps({"g": generation, "q": query_key, "s": score, "i": doc_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decodifica un cursor generado por encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return {"g": payload["g"], "q": payload["q"], "s": float(payload["s"]), "i": int(payload["i"])}
+    except Exception:
+        raise InvalidCursorError("Cursor de paginación inválido")
+
+
 class OptimizedBM25Service:
     """Servicio optimizado para realizar búsquedas BM25 en documentos legales de la base de datos"""
 
@@ -51,7 +126,10 @@ class OptimizedBM25Service:
                  b: float = 0.75, 
                  use_cache: bool = True, 
                  cache_expire_time: int = 86400,
-                 force_rebuild: bool = False):
+                 force_rebuild: bool = False,
+                 freshness_check_interval: Optional[float] = None,
+                 document_cache_size: Optional[int] = None,
+                 document_cache_max_bytes: Optional[int] = None):
         """
         Inicializa el servicio de búsqueda optimizado
         
@@ -61,6 +139,12 @@ class OptimizedBM25Service:
             use_cache: Si se debe usar el sistema de caché
             cache_expire_time: Tiempo de expiración del caché en segundos
             force_rebuild: Forzar la reconstrucción del índice al iniciar
+            freshness_check_interval: Segundos entre consultas a la generación del corpus
+                (por defecto BM25_FRESHNESS_CHECK_INTERVAL)
+            document_cache_size: Documentos hidratados que se mantienen en memoria
+                (por defecto DOCUMENT_CACHE_SIZE; 0 lo desactiva)
+            document_cache_max_bytes: Tamaño aproximado máximo de esos documentos
+                (por defecto DOCUMENT_CACHE_MAX_BYTES)
         """
         self.stemmer = SnowballStemmer('spanish')
         self.stop_words = set(stopwords.words('spanish'))
@@ -92,11 +176,37 @@ class OptimizedBM25Service:
         # Estado del índice BM25
         self._bm25_index = None
         self._document_ids = None  # Almacenar IDs de documentos para mapear resultados
-        self._corpus = None
+        self._facet_bitmaps = {}  # {campo: {valor: bitmap}} alineados con _document_ids
+        self._document_ids_array = None  # IDs como arreglo para desempates y cursores
+        
+        # Puntuaciones recientes por consulta, para paginar sin volver a puntuar
+        self._score_cache = OrderedDict()
+        self._score_cache_size = 32
+        self._score_cache_lock = threading.Lock()
+        
+        # Documentos hidratados recientes (metadatos y oraciones del snippet),
+        # para no consultar la base de datos en cada búsqueda
+        self._document_cache = OrderedDict()
+        self._document_cache_size = DOCUMENT_CACHE_SIZE if document_cache_size is None else document_cache_size
+        self._document_cache_max_bytes = (
+            DOCUMENT_CACHE_MAX_BYTES if document_cache_max_bytes is None else document_cache_max_bytes
+        )
+        self._document_cache_bytes = 0
+        self._document_cache_lock = threading.Lock()
+        self._document_cache_hits = 0
+        self._document_cache_misses = 0
         self._last_index_update = None
         self._is_building_index = False
         self._force_rebuild = force_rebuild
         
+        # Control de frescura del índice mediante la generación del corpus
+        self.freshness_check_interval = (
+            BM25_FRESHNESS_CHECK_INTERVAL if freshness_check_interval is None else freshness_check_interval
+        )
+        self._index_generation = None  # Generación persistida al construir el índice
+        self._index_local_generation = None  # Generación local al construir el índice
+        self._last_freshness_check = 0.0
+        
         logger.info(f"Servicio BM25 optimizado inicializado - Parámetros: k1={k1}, b={b}")
         
     def _initialize_cache_db(self):
@@ -160,23 +270,49 @@ class OptimizedBM25Service:
         if not text or not query_tokens:
             return ""
             
-        # Dividir el texto en oraciones
-        sentences = sent_tokenize(text, language='spanish')
+        return self._snippet_from_sentences(self._split_sentences(text), query_tokens, text, max_length)
+        
+    def _split_sentences(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Divide el texto en oraciones y precalcula lo que necesita la puntuación
+        de snippets: (oración, número de palabras). Las oraciones se guardan una
+        sola vez; la versión en minúsculas se calcula al puntuar.
+        """
+        return [
+            (sentence, len(sentence.split()))
+            for sentence in sent_tokenize(text, language='spanish')
+        ]
         
+    def _snippet_from_sentences(self, sentences: List[Tuple[str, int]], query_tokens: List[str],
+                                text: str, max_length: int = 250) -> str:
+        """
+        Genera el snippet a partir de oraciones ya divididas.
+        
+        Args:
+            sentences: Oraciones precalculadas con _split_sentences
+            query_tokens: Tokens de la consulta preprocesados
+            text: Texto (o comienzo del texto) para el snippet por defecto
+            max_length: Longitud máxima del snippet
+            
+        Returns:
+            Snippet relevante del texto
+        """
         # Preparar tokens de consulta (sin stemming para buscar coincidencias exactas)
         raw_query_tokens = [token.lower() for token in ' '.join(query_tokens).split()]
         
         # Función para puntuar relevancia de una oración
-        def score_sentence(sentence):
-            sentence_lower = sentence.lower()
+        def score_sentence(sentence_lower, word_count):
             # Puntuación basada en presencia de tokens de consulta
             score = sum(1 for token in raw_query_tokens if token in sentence_lower)
             # Bonus para oraciones más cortas (más específicas)
-            score = score * (1 / (len(sentence.split()) + 1))
+            score = score * (1 / (word_count + 1))
             return score
         
         # Puntuar y ordenar oraciones
-        scored_sentences = [(sentence, score_sentence(sentence)) for sentence in sentences]
+        scored_sentences = [
+            (sentence, score_sentence(sentence.lower(), word_count))
+            for sentence, word_count in sentences
+        ]
         scored_sentences.sort(key=lambda x: x[1], reverse=True)
         
         # Seleccionar las mejores oraciones hasta alcanzar la longitud máxima
@@ -203,7 +339,7 @@ class OptimizedBM25Service:
             return True
             
         # Si no hay índice, se necesita crear
-        if self._bm25_index is None or self._corpus is None or self._document_ids is None:
+        if self._bm25_index is None or self._document_ids is None:
             logger.info("El índice BM25 no existe, creando nuevo índice")
             return True
             
@@ -212,23 +348,26 @@ class OptimizedBM25Service:
             logger.info("No hay fecha de última actualización del índice")
             return True
             
-        # Verificar si ha habido cambios en la base de datos desde la última indexación
-        try:
-            latest_update = db.query(func.max(LegalDocument.updated_at)).scalar()
+        # Cambios confirmados desde este mismo proceso: no requiere consultar la base de datos
+        if local_generation() != self._index_local_generation:
+            logger.info("Se detectaron cambios locales en el corpus de documentos")
+            return True
             
-            if latest_update and latest_update > self._last_index_update:
-                logger.info(f"Se detectaron cambios en la base de datos: {latest_update} > {self._last_index_update}")
-                return True
-                
-            # Verificar también el número de documentos
-            current_count = db.query(func.count(LegalDocument.id)).scalar()
-            if current_count != len(self._document_ids):
-                logger.info(f"Cambio en el número de documentos: {current_count} ≠ {len(self._document_ids)}")
+        # Consultar la generación persistida como máximo una vez por intervalo
+        now = time.monotonic()
+        if now - self._last_freshness_check < self.freshness_check_interval:
+            return False
+        self._last_freshness_check = now
+        
+        try:
+            current_generation = get_corpus_generation(db)
+            if current_generation != self._index_generation:
+                logger.info(f"Cambio en la generación del corpus: {current_generation} ≠ {self._index_generation}")
                 return True
-                
             return False
         except Exception as e:
-            logger.error(f"Error al verificar cambios en la base de datos: {str(e)}")
+            # Ante la duda, reconstruir: un índice desactualizado es peor que una reconstrucción de más
+            logger.error(f"Error al verificar la generación del corpus: {str(e)}")
             return True
         
     def _build_index(self, db: Session) -> bool:
@@ -245,39 +384,57 @@ class OptimizedBM25Service:
             start_time = time.time()
             logger.info("Construyendo índice BM25...")
             
-            # Obtener todos los documentos
-            documents = db.query(LegalDocument).all()
-            
-            if not documents:
-                logger.warning("No hay documentos en la base de datos para indexar")
-                self._is_building_index = False
-                return False
-                
-            # Almacenar IDs para mapear resultados
-            self._document_ids = [doc.id for doc in documents]
-            
-            # Preprocesar el corpus
-            logger.info(f"Preprocesando {len(documents)} documentos para BM25...")
-            self._corpus = []
-            for doc in documents:
-                tokens = self.preprocess_text(doc.content)
+            # Registrar la generación antes de leer los documentos para que las
+            # escrituras concurrentes provoquen una nueva reconstrucción
+            index_local_generation = local_generation()
+            try:
+                ensure_corpus_generation_table(db.get_bind())
+                index_generation = get_corpus_generation(db)
+            except Exception as e:
+                logger.warning(f"No se pudo leer la generación del corpus: {str(e)}")
+                index_generation = None
+            
+            # Recorrer los documentos por lotes, tokenizando a medida que se leen.
+            # Los tokens se internan en búferes planos y no se conservan.
+            logger.info("Preprocesando documentos para BM25...")
+            builder = CompactIndexBuilder()
+            document_ids = []
+            facet_values = {field: [] for field in FACET_FIELDS}
+            for row in _stream_index_rows(db):
+                tokens = self.preprocess_text(row.content)
                 if tokens:  # Ignorar documentos sin contenido válido
-                    self._corpus.append(tokens)
+                    builder.add(tokens)
+                    document_ids.append(row.id)
+                    for field in FACET_FIELDS:
+                        facet_values[field].append(_facet_value(row, field))
                 else:
-                    logger.warning(f"Documento ID={doc.id} no tiene tokens válidos")
+                    logger.warning(f"Documento ID={row.id} no tiene tokens válidos")
             
             # Verificar que hay documentos válidos
-            if not self._corpus:
+            if not document_ids:
                 logger.error("No hay documentos con contenido válido para indexar")
                 self._is_building_index = False
                 return False
                 
-            # Crear el índice BM25 con los parámetros optimizados
-            logger.info(f"Creando índice BM25 con {len(self._corpus)} documentos...")
-            self._bm25_index = BM25Okapi(self._corpus, k1=self.k1, b=self.b)
+            # Crear el índice BM25 compacto con los parámetros optimizados
+            logger.info(f"Creando índice BM25 con {len(document_ids)} documentos...")
+            self._bm25_index = builder.build(k1=self.k1, b=self.b)
+            self._document_ids = document_ids
+            self._document_ids_array = np.asarray(document_ids, dtype=np.int64)
+            
+            # Precalcular un bitmap por valor de faceta sobre las posiciones del índice
+            self._facet_bitmaps = self._build_facet_bitmaps(facet_values)
+            with self._score_cache_lock:
+                self._score_cache.clear()
+            with self._document_cache_lock:
+                self._document_cache.clear()
+                self._document_cache_bytes = 0
             
             # Actualizar la fecha de última indexación
             self._last_index_update = datetime.now()
+            self._index_generation = index_generation
+            self._index_local_generation = index_local_generation
+            self._last_freshness_check = time.monotonic()
             
             elapsed_time = time.time() - start_time
             logger.info(f"Índice BM25 construido correctamente en {elapsed_time:.2f} segundos")
@@ -288,20 +445,236 @@ class OptimizedBM25Service:
             # Reiniciar el estado del índice
             self._bm25_index = None
             self._document_ids = None
-            self._corpus = None
+            self._facet_bitmaps = {}
+            self._document_ids_array = None
             self._last_index_update = None
             return False
             
         finally:
             self._is_building_index = False
             
+    def _build_facet_bitmaps(self, facet_values: Dict[str, List[Optional[str]]]) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Construye los bitmaps de facetas: para cada campo y valor, un arreglo
+        booleano que indica qué posiciones del índice tienen ese valor.
+        
+        Args:
+            facet_values: Valores de cada faceta alineados con el índice
+            
+        Returns:
+            Diccionario {campo: {valor: bitmap}}
+        """
+        bitmaps = {}
+        for field, values in facet_values.items():
+            codes = {}
+            encoded = np.empty(len(values), dtype=np.int32)
+            for position, value in enumerate(values):
+                encoded[position] = codes.setdefault(value, len(codes)) if value is not None else -1
+            bitmaps[field] = {value: encoded == code for value, code in codes.items()}
+        return bitmaps
+        
+    def _filter_mask(self, search_query: SearchQuery, exclude_field: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        Combina los bitmaps de los filtros de la consulta.
+        
+        Args:
+            search_query: Consulta de búsqueda con filtros opcionales
+            exclude_field: Faceta cuyo filtro se ignora (conteos de navegación)
+            
+        Returns:
+            Máscara booleana sobre el índice, o None si no hay filtros
+        """
+        mask = None
+        for field, value in _query_filters(search_query).items():
+            if field == exclude_field:
+                continue
+            bitmap = self._facet_bitmaps.get(field, {}).get(value)
+            if bitmap is None:
+                return np.zeros(len(self._document_ids), dtype=bool)
+            mask = bitmap if mask is None else mask & bitmap
+        return mask
+        
+    def _facet_counts(self, search_query: SearchQuery, matches: np.ndarray) -> Dict[str, Dict[str, int]]:
+        """
+        Calcula los conteos de facetas sobre el conjunto de documentos que
+        coinciden con la consulta. Cada faceta aplica los filtros de las demás
+        pero no el suyo, de modo que la navegación muestre las alternativas.
+        
+        Args:
+            search_query: Consulta de búsqueda con filtros opcionales
+            matches: Máscara booleana de documentos con puntuación positiva
+            
+        Returns:
+            Diccionario {campo: {valor: conteo}} ordenado por conteo descendente
+        """
+        facets = {}
+        for field in FACET_FIELDS:
+            mask = self._filter_mask(search_query, exclude_field=field)
+            scope = matches if mask is None else matches & mask
+            counts = {}
+            for value, bitmap in self._facet_bitmaps.get(field, {}).items():
+                count = int(np.count_nonzero(bitmap & scope))
+                if count:
+                    counts[value] = count
+            facets[field] = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+        return facets
+            
+    def _get_scores(self, tokenized_query: List[str]) -> np.ndarray:
+        """Puntúa la consulta contra el índice reutilizando puntuaciones recientes"""
+        key = tuple(tokenized_query)
+        with self._score_cache_lock:
+            scores = self._score_cache.get(key)
+            if scores is not None:
+                self._score_cache.move_to_end(key)
+                return scores
+        
+        scores = np.asarray(self._bm25_index.get_scores(tokenized_query))
+        with self._score_cache_lock:
+            self._score_cache[key] = scores
+            while len(self._score_cache) > self._score_cache_size:
+                self._score_cache.popitem(last=False)
+        return scores
+        
+    def _top_k(self, scores: np.ndarray, candidates: np.ndarray, limit: int) -> np.ndarray:
+        """
+        Selecciona los `limit` mejores candidatos en orden (puntuación desc, id asc)
+        sin ordenar todo el conjunto de candidatos.
+        """
+        if candidates.size > limit:
+            candidate_scores = scores[candidates]
+            kth = np.partition(candidate_scores, candidates.size - limit)[candidates.size - limit]
+            candidates = candidates[candidate_scores >= kth]
+        order = np.lexsort((self._document_ids_array[candidates], -scores[candidates]))
+        return candidates[order][:limit]
+        
+    def _rank(self, tokenized_query: List[str], search_query: SearchQuery, limit: int,
+              after: Optional[Tuple[float, int]] = None) -> Tuple[List[Tuple[int, float]], Dict[str, Dict[str, int]], bool]:
+        """
+        Puntúa la consulta, calcula las facetas, aplica los filtros y selecciona
+        los mejores resultados en orden (puntuación desc, id asc).
+        
+        Args:
+            tokenized_query: Tokens preprocesados de la consulta
+            search_query: Consulta con filtros opcionales
+            limit: Número máximo de resultados
+            after: Última posición (puntuación, id) de la página anterior
+            
+        Returns:
+            Tupla con los pares (documento_id, puntuación), las facetas y un
+            indicador de si quedan más resultados después de esta página
+        """
+        scores = self._get_scores(tokenized_query)
+        matches = scores > 0
+        
+        # Conteos de facetas sobre los documentos que coinciden con la consulta
+        facets = self._facet_counts(search_query, matches)
+        
+        # Aplicar filtros con los bitmaps de facetas (sin consultar la base de datos)
+        filter_mask = self._filter_mask(search_query)
+        if filter_mask is not None:
+            matches = matches & filter_mask
+        
+        candidates = np.flatnonzero(matches)
+        
+        # Continuar después de la última posición (puntuación, id) de la página anterior
+        if after is not None and candidates.size:
+            candidate_scores = scores[candidates]
+            candidate_ids = self._document_ids_array[candidates]
+            candidates = candidates[
+                (candidate_scores < after[0]) | ((candidate_scores == after[0]) & (candidate_ids > after[1]))
+            ]
+        
+        # Seleccionar los mejores resultados sin ordenar todo el corpus
+        has_more = candidates.size > limit
+        candidates = self._top_k(scores, candidates, limit)
+        pairs = [(self._document_ids[idx], float(scores[idx])) for idx in candidates]
+        return pairs, facets, has_more
+        
+    def _hydrate_documents(self, db: Session, doc_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Obtiene los metadatos y las oraciones precalculadas de los documentos.
+        Las entradas del caché pertenecen a la generación del índice con la que
+        se leyeron; al cambiar la generación se vuelven a leer.
+        
+        Args:
+            db: Sesión de base de datos
+            doc_ids: IDs de los documentos a hidratar
+            
+        Returns:
+            Diccionario {documento_id: entrada}
+        """
+        generation = (self._index_generation, self._index_local_generation)
+        documents = {}
+        missing = []
+        with self._document_cache_lock:
+            for doc_id in doc_ids:
+                entry = self._document_cache.get(doc_id)
+                if entry is not None and entry["generation"] == generation:
+                    self._document_cache.move_to_end(doc_id)
+                    documents[doc_id] = entry
+                else:
+                    missing.append(doc_id)
+            self._document_cache_hits += len(doc_ids) - len(missing)
+            self._document_cache_misses += len(missing)
+        
+        if not missing:
+            return documents
+        
+        rows = db.query(
+            LegalDocument.id, LegalDocument.title, LegalDocument.reference_number,
+            LegalDocument.document_type, LegalDocument.content
+        ).filter(LegalDocument.id.in_(missing)).all()
+        for row in rows:
+            content = row.content or ""
+            sentences = self._split_sentences(content) if content else []
+            documents[row.id] = {
+                "generation": generation,
+                "title": row.title,
+                "reference_number": row.reference_number,
+                "document_type": row.document_type,
+                "sentences": sentences,
+                "head": content[:250],  # Snippet por defecto si no hay oraciones
+                # Tamaño aproximado: el texto de las oraciones domina la entrada
+                "size": sum(len(sentence) for sentence, _ in sentences) + 250 + 64 * len(sentences),
+            }
+        
+        if self._document_cache_size > 0:
+            with self._document_cache_lock:
+                for row in rows:
+                    previous = self._document_cache.pop(row.id, None)
+                    if previous is not None:
+                        self._document_cache_bytes -= previous["size"]
+                    self._document_cache[row.id] = documents[row.id]
+                    self._document_cache_bytes += documents[row.id]["size"]
+                # Limitar por número de documentos y por tamaño aproximado
+                while self._document_cache and (
+                    len(self._document_cache) > self._document_cache_size
+                    or self._document_cache_bytes > self._document_cache_max_bytes
+                ):
+                    _, evicted = self._document_cache.popitem(last=False)
+                    self._document_cache_bytes -= evicted["size"]
+        return documents
+        
+    def _pagination_key(self, search_query: SearchQuery) -> str:
+        """Identifica la consulta y sus filtros (sin límite ni cursor) para validar cursores"""
+        query_dict = {"query": search_query.query, **_query_filters(search_query)}
+        query_str = json.dumps(query_dict, sort_keys=True)
+        return hashlib.md5(query_str.encode()).hexdigest()[:12]
+        
     def _generate_query_hash(self, search_query: SearchQuery) -> str:
-        """Genera un hash único para la consulta"""
+        """
+        Genera un hash único para la consulta. Incluye la generación del índice:
+        las entradas de una generación anterior (con su next_cursor) no se
+        reutilizan después de reconstruirlo.
+        """
         # Convertir la consulta a un string serializable
         query_dict = {
+            "generation": self._index_generation,
             "query": search_query.query,
             "document_type": search_query.document_type.value if search_query.document_type else None,
             "category": search_query.category,
+            "subcategory": search_query.subcategory,
+            "year": search_query.year,
             "limit": search_query.limit
         }
         
@@ -309,8 +682,8 @@ class OptimizedBM25Service:
         query_str = json.dumps(query_dict, sort_keys=True)
         return hashlib.md5(query_str.encode()).hexdigest()
         
-    def _get_from_cache(self, search_query: SearchQuery) -> Optional[List[Dict[str, Any]]]:
-        """Obtiene resultados en caché para una consulta"""
+    def _get_from_cache(self, search_query: SearchQuery) -> Optional[Dict[str, Any]]:
+        """Obtiene resultados y facetas en caché para una consulta"""
         if not self.use_cache:
             return None
             
@@ -335,8 +708,11 @@ class OptimizedBM25Service:
                 
                 # Verificar si el caché ha expirado
                 if (datetime.now() - created_at).total_seconds() < self.cache_expire_time:
-                    logger.info(f"Resultados obtenidos de caché: {search_query.query}")
-                    return json.loads(results_json)
+                    cached = json.loads(results_json)
+                    # Las entradas antiguas (sólo lista de resultados) no incluyen facetas
+                    if isinstance(cached, dict):
+                        logger.info(f"Resultados obtenidos de caché: {search_query.query}")
+                        return cached
                 else:
                     logger.info(f"Caché expirado para: {search_query.query}")
         except Exception as e:
@@ -344,15 +720,16 @@ class OptimizedBM25Service:
                 
         return None
         
-    def _save_to_cache(self, search_query: SearchQuery, results: List[Dict[str, Any]]) -> None:
-        """Almacena resultados en caché"""
+    def _save_to_cache(self, search_query: SearchQuery, results: List[Dict[str, Any]],
+                       facets: Dict[str, Dict[str, int]], next_cursor: Optional[str] = None) -> None:
+        """Almacena resultados y facetas en caché"""
         if not self.use_cache:
             return
             
         try:
             query_hash = self._generate_query_hash(search_query)
             query_text = search_query.query
-            results_json = json.dumps(results)
+            results_json = json.dumps({"results": results, "facets": facets, "next_cursor": next_cursor})
             
             conn = sqlite3.connect(self.cache_db_path)
             cursor = conn.cursor()
@@ -380,112 +757,105 @@ class OptimizedBM25Service:
         Returns:
             Lista de documentos relevantes con puntuación y snippet
         """
+        return self.search_documents_with_facets(db, search_query)["results"]
+        
+    def search_documents_with_facets(self, db: Session, search_query: SearchQuery) -> Dict[str, Any]:
+        """
+        Busca documentos relevantes utilizando BM25 y calcula los conteos de
+        facetas (tipo de documento, categoría, subcategoría y año) a partir de
+        los bitmaps precalculados del índice.
+        
+        Args:
+            db: Sesión de base de datos
+            search_query: Consulta de búsqueda
+            
+        Returns:
+            Diccionario con "results" (documentos con puntuación y snippet),
+            "facets" ({campo: {valor: conteo}}) y "next_cursor" (cursor opaco de
+            la página siguiente, o None si no hay más resultados)
+            
+        Raises:
+            InvalidCursorError: Si el cursor es inválido o el índice cambió
+        """
         start_time = time.time()
+        empty = {"results": [], "facets": {}, "next_cursor": None}
         
         # Validar la consulta
         if not search_query.query or len(search_query.query.strip()) < 3:
             logger.warning("Consulta demasiado corta")
-            return []
+            return empty
         
-        # Intentar obtener resultados desde caché
-        cached_results = self._get_from_cache(search_query)
-        if cached_results:
-            # Agregar flag para indicar que es un resultado cacheado
-            for result in cached_results:
-                result["cached"] = True
-            return cached_results
+        # Validar el cursor antes de cualquier otro trabajo
+        cursor_state = decode_cursor(search_query.cursor) if search_query.cursor else None
         
-        # Verificar e inicializar BM25 si es necesario
+        # Verificar e inicializar BM25 si es necesario (antes del caché, cuya
+        # clave depende de la generación del índice)
         if self._need_reindex(db):
             if not self._build_index(db):
                 logger.error("Error al construir índice BM25, no se puede realizar la búsqueda")
-                return []
+                return empty
+        
+        # Intentar obtener resultados desde caché (sólo la primera página se cachea)
+        cached = self._get_from_cache(search_query) if cursor_state is None else None
+        if cached and cached.get("results"):
+            cached.setdefault("next_cursor", None)
+            # Agregar flag para indicar que es un resultado cacheado
+            for result in cached["results"]:
+                result["cached"] = True
+            return cached
         
         # Preprocesar la consulta
         tokenized_query = self.preprocess_text(search_query.query)
         if not tokenized_query:
             logger.warning(f"La consulta no tiene tokens válidos: {search_query.query}")
-            return []
+            return empty
+        
+        # Un cursor sólo es válido para la misma consulta y generación del índice
+        pagination_key = self._pagination_key(search_query)
+        if cursor_state is not None:
+            if cursor_state["q"] != pagination_key:
+                raise InvalidCursorError("El cursor no corresponde a esta consulta")
+            if cursor_state["g"] != self._index_generation:
+                raise InvalidCursorError("El índice cambió desde que se generó el cursor; repita la búsqueda")
         
         # Lista para almacenar resultados finales
         final_results = []
+        facets = {}
+        next_cursor = None
         
         try:
-            # Aplicar filtros
-            if search_query.document_type or search_query.category:
-                # Buscar IDs de documentos que cumplen los filtros
-                query = db.query(LegalDocument.id)
-                
-                if search_query.document_type:
-                    query = query.filter(LegalDocument.document_type == search_query.document_type)
-                if search_query.category:
-                    query = query.filter(LegalDocument.category == search_query.category)
-                
-                filtered_ids = set(row[0] for row in query.all())
-                
-                if not filtered_ids:
-                    logger.info("No hay documentos que cumplan los filtros")
-                    return []
-                
-                # Obtener índices y puntuaciones filtradas
-                filtered_indices = []
-                for idx, doc_id in enumerate(self._document_ids):
-                    if doc_id in filtered_ids:
-                        filtered_indices.append(idx)
-                
-                # Si no hay documentos que cumplan los filtros
-                if not filtered_indices:
-                    logger.info("No hay documentos indexados que cumplan los filtros")
-                    return []
-                
-                # Obtener puntuaciones solo para documentos filtrados
-                scores = self._bm25_index.get_scores(tokenized_query)
-                
-                # Aplicar filtro a puntuaciones
-                doc_score_pairs = []
-                for idx in filtered_indices:
-                    try:
-                        doc_score_pairs.append((self._document_ids[idx], scores[idx]))
-                    except IndexError:
-                        logger.error(f"Error de índice: idx={idx}, len(scores)={len(scores)}, len(doc_ids)={len(self._document_ids)}")
-            else:
-                # Sin filtros, buscar en todos los documentos
-                scores = self._bm25_index.get_scores(tokenized_query)
-                
-                # Crear pares (documento_id, puntuación)
-                doc_score_pairs = [(doc_id, score) for doc_id, score in zip(self._document_ids, scores)]
-            
-            # Ordenar por puntuación descendente
-            doc_score_pairs.sort(key=lambda x: x[1], reverse=True)
-            
-            # Limitar los resultados
+            # Puntuar, filtrar y seleccionar la página de resultados
             limit = search_query.limit or 10
-            top_pairs = doc_score_pairs[:limit]
-            
-            # Filtrar resultados sin relevancia
-            relevant_pairs = [(doc_id, score) for doc_id, score in top_pairs if score > 0]
+            after = (cursor_state["s"], cursor_state["i"]) if cursor_state is not None else None
+            relevant_pairs, facets, has_more = self._rank(tokenized_query, search_query, limit, after)
             
             if not relevant_pairs:
                 logger.info("No se encontraron documentos relevantes")
-                return []
+                return {"results": [], "facets": facets, "next_cursor": None}
+            
+            if has_more:
+                last_id, last_score = relevant_pairs[-1]
+                next_cursor = encode_cursor(self._index_generation, pagination_key, last_score, last_id)
             
-            # Obtener documentos completos de la base de datos (en una sola consulta)
+            # Obtener los documentos desde el caché en memoria o, si faltan, de la
+            # base de datos (en una sola consulta)
             doc_ids = [doc_id for doc_id, _ in relevant_pairs]
-            documents = {
-                doc.id: doc for doc in db.query(LegalDocument).filter(LegalDocument.id.in_(doc_ids)).all()
-            }
+            documents = self._hydrate_documents(db, doc_ids)
             
             # Formatear resultados
             for doc_id, score in relevant_pairs:
                 if doc_id in documents:
                     doc = documents[doc_id]
-                    snippet = self.generate_snippet(doc.content, tokenized_query)
+                    snippet = (
+                        self._snippet_from_sentences(doc["sentences"], tokenized_query, doc["head"])
+                        if doc["head"] else ""
+                    )
                     
                     result = {
-                        "document_id": doc.id,
-                        "title": doc.title,
-                        "reference_number": doc.reference_number,
-                        "document_type": doc.document_type,
+                        "document_id": doc_id,
+                        "title": doc["title"],
+                        "reference_number": doc["reference_number"],
+                        "document_type": doc["document_type"],
                         "relevance_score": round(score, 3),
                         "snippet": snippet,
                         "cached": False
@@ -493,9 +863,9 @@ class OptimizedBM25Service:
                     
                     final_results.append(result)
             
-            # Almacenar en caché si está habilitado
-            if self.use_cache and final_results:
-                self._save_to_cache(search_query, final_results)
+            # Almacenar en caché si está habilitado (sólo la primera página)
+            if self.use_cache and final_results and cursor_state is None:
+                self._save_to_cache(search_query, final_results, facets, next_cursor)
             
         except Exception as e:
             logger.error(f"Error en búsqueda BM25: {str(e)}")
@@ -504,7 +874,70 @@ class OptimizedBM25Service:
         processing_time = time.time() - start_time
         logger.info(f"Búsqueda completada en {processing_time:.2f}s - {len(final_results)} resultados para: {search_query.query}")
         
-        return final_results
+        return {"results": final_results, "facets": facets, "next_cursor": next_cursor}
+        
+    def _recent_cached_queries(self, limit: int) -> List[str]:
+        """Obtiene los textos de las consultas más recientes registradas en el caché"""
+        if not self.use_cache:
+            return []
+            
+        try:
+            conn = sqlite3.connect(self.cache_db_path)
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT query_text FROM bm25_query_cache
+            GROUP BY query_text
+            ORDER BY MAX(created_at) DESC
+            LIMIT ?
+            ''', (limit,))
+            queries = [row[0] for row in cursor.fetchall()]
+            conn.close()
+            return queries
+        except Exception as e:
+            logger.error(f"Error al leer consultas recientes del caché: {str(e)}")
+            return []
+    
+    def warmup(self, db: Session, max_queries: int = 50) -> Dict[str, Any]:
+        """
+        Prepara el servicio para atender búsquedas sin arranque en frío:
+        carga los datos de NLTK, construye el índice BM25 y recalcula las
+        consultas recientes cuya entrada de caché ya no es válida.
+        
+        Args:
+            db: Sesión de base de datos
+            max_queries: Número máximo de consultas recientes a recalcular
+            
+        Returns:
+            Resumen del calentamiento
+        """
+        start_time = time.time()
+        
+        # Cargar tokenizadores de NLTK (punkt se carga de forma perezosa)
+        self.generate_snippet("Calentamiento del servicio. Carga de datos.", self.preprocess_text("calentamiento"))
+        
+        index_ready = True
+        if self._need_reindex(db):
+            index_ready = self._build_index(db)
+        
+        warmed_queries = 0
+        if index_ready:
+            for query_text in self._recent_cached_queries(max_queries):
+                try:
+                    search_query = SearchQuery(query=query_text)
+                except Exception:
+                    continue
+                if self._get_from_cache(search_query) is None:
+                    self.search_documents(db, search_query)
+                    warmed_queries += 1
+        
+        summary = {
+            "index_ready": index_ready,
+            "document_count": len(self._document_ids) if self._document_ids else 0,
+            "warmed_queries": warmed_queries,
+            "elapsed_seconds": round(time.time() - start_time, 2)
+        }
+        logger.info(f"Calentamiento del servicio BM25 completado: {summary}")
+        return summary
         
     def index_status(self) -> Dict[str, Any]:
         """Devuelve información sobre el estado del índice BM25"""
@@ -513,7 +946,18 @@ class OptimizedBM25Service:
             "document_count": len(self._document_ids) if self._document_ids else 0,
             "last_update": self._last_index_update.isoformat() if self._last_index_update else None,
             "building_index": self._is_building_index,
+            "corpus_generation": self._index_generation,
+            "index_memory_bytes": self._bm25_index.memory_bytes() if hasattr(self._bm25_index, "memory_bytes") else None,
+            "freshness_check_interval": self.freshness_check_interval,
             "cache_enabled": self.use_cache,
+            "document_cache": {
+                "size": len(self._document_cache),
+                "max_size": self._document_cache_size,
+                "approx_bytes": self._document_cache_bytes,
+                "max_bytes": self._document_cache_max_bytes,
+                "hits": self._document_cache_hits,
+                "misses": self._document_cache_misses
+            },
             "bm25_params": {
                 "k1": self.k1,
                 "b": self.b
@@ -0,0 +1,93 @@
+"""
+Eventos de Consultas en Segundo Plano
+------------------------------------
+Publica en Redis la finalización de las consultas de /queries, en un canal
+por usuario (query_events:{user_id}). El servidor WebSocket
+(app/websocket/main.py) reenvía cada evento a las conexiones de ese usuario
+en /ws/queries (autenticado con el JWT del usuario), de modo que el cliente no necesita consultar
+GET /queries/{id} repetidamente.
+
+Si Redis no está disponible los eventos se descartan (el estado sigue
+disponible en GET /queries/{id}) y se reintenta la conexión más tarde.
+"""
+
+import json
+import time
+import logging
+from typing import Any, Dict, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de los canales por usuario
+QUERY_EVENTS_CHANNEL_PREFIX = "query_events:"
+
+# Segundos sin intentar publicar tras un error de Redis
+REDIS_RETRY_INTERVAL = 30.0
+
+
+def query_events_channel(user_id: str) -> str:
+    """Canal de Redis con los eventos de consultas de un usuario"""
+    return f"{QUERY_EVENTS_CHANNEL_PREFIX}{user_id}"
+
+
+class QueryEventPublisher:
+    """Publica eventos de finalización de consultas en Redis"""
+
+    def __init__(self, redis_url: str, enabled: bool = True):
+        """
+        Inicializa el publicador
+
+        Args:
+            redis_url: URL de Redis (la misma que usa el servidor WebSocket)
+            enabled: Si es False no se publica nada
+        """
+        self.redis_url = redis_url
+        self.enabled = enabled
+        self._redis: Optional[redis.Redis] = None
+        self._retry_at = 0.0
+        self._stats = {"published": 0, "delivered": 0, "dropped": 0, "errors": 0}
+
+    def _client(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.from_url(self.redis_url, socket_connect_timeout=2, socket_timeout=2)
+        return self._redis
+
+    async def publish(self, user_id: Optional[str], event: Dict[str, Any]) -> bool:
+        """
+        Publica un evento en el canal del usuario.
+
+        Args:
+            user_id: Usuario dueño de la consulta (sin usuario no hay canal)
+            event: Datos del evento (serializables a JSON)
+
+        Returns:
+            True si el evento se publicó
+        """
+        if not self.enabled or not user_id:
+            return False
+        if time.monotonic() < self._retry_at:
+            self._stats["dropped"] += 1
+            return False
+        try:
+            message = json.dumps({"user_id": str(user_id), "message": event}, ensure_ascii=False, default=str)
+            receivers = await self._client().publish(query_events_channel(str(user_id)), message)
+            self._stats["published"] += 1
+            self._stats["delivered"] += receivers or 0
+            return True
+        except Exception as e:
+            self._stats["errors"] += 1
+            self._retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+            logger.warning(f"No se pudo publicar el evento de la consulta en Redis: {str(e)}")
+            return False
+
+    async def close(self) -> None:
+        """Cierra la conexión con Redis"""
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de eventos"""
+        return dict(self._stats)
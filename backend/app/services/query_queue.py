@@ -0,0 +1,281 @@
+"""
+Cola Persistente de Consultas
+----------------------------
+Operaciones sobre la tabla query_jobs para los workers de /queries:
+- enqueue: registra una consulta pendiente
+- lease: reserva la siguiente consulta disponible con un arriendo con
+  vencimiento (FOR UPDATE SKIP LOCKED en PostgreSQL; en SQLite la reserva es
+  una actualización condicional, que sólo gana un worker)
+- extend: renueva el arriendo mientras la consulta se procesa
+- complete / fail: guardan el resultado o programan un reintento con espera
+  exponencial; sólo el dueño vigente del arriendo puede hacerlo
+
+Una consulta cuyo arriendo venció (worker caído) vuelve a reservarse hasta
+agotar los intentos.
+"""
+
+import json
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session
+
+from app.models.query_job import QueryJob, ensure_query_jobs_table
+from app.schemas.query import QueryStatus
+
+logger = logging.getLogger(__name__)
+
+# Candidatos a revisar en una reserva cuando otro worker gana la carrera
+LEASE_CANDIDATES = 3
+
+
+class TransientQueryError(Exception):
+    """Falla temporal (sin cupo hacia el LLM o servicio de IA no disponible): reintentar más tarde"""
+
+    def __init__(self, message: str, result: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        # Resultado degradado que se guarda si ya no quedan reintentos
+        self.result = result
+
+
+class QueryJobQueue:
+    """Cola de consultas respaldada por la base de datos"""
+
+    def __init__(self, lease_seconds: float = 120.0, max_attempts: int = 3, retry_delay: float = 5.0):
+        """
+        Inicializa la cola
+
+        Args:
+            lease_seconds: Duración del arriendo de una consulta reservada
+            max_attempts: Intentos máximos por consulta
+            retry_delay: Espera base en segundos antes de un reintento (se duplica en cada intento)
+        """
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._table_ready = False
+
+    def _ensure_table(self, db: Session) -> None:
+        """Crea la tabla de la cola la primera vez que se usa (bases sin migrar)"""
+        if not self._table_ready:
+            ensure_query_jobs_table(db.get_bind())
+            self._table_ready = True
+
+    def enqueue(self, db: Session, query_text: str, user_id: Optional[str] = None, source: str = "web") -> QueryJob:
+        """
+        Registra una consulta pendiente.
+
+        Returns:
+            Consulta creada
+        """
+        self._ensure_table(db)
+        now = datetime.now()
+        job = QueryJob(
+            id=str(uuid.uuid4()),
+            query_text=query_text,
+            user_id=user_id,
+            source=source,
+            status=QueryStatus.PENDING.value,
+            attempts=0,
+            available_at=now,
+            needs_human_review=False,
+            created_at=now
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def get(self, db: Session, job_id: str) -> Optional[QueryJob]:
+        """Obtiene una consulta por su ID"""
+        self._ensure_table(db)
+        return db.get(QueryJob, job_id)
+
+    def _available(self, now: datetime):
+        """Condición de las consultas que se pueden reservar"""
+        return or_(
+            and_(QueryJob.status == QueryStatus.PENDING.value, QueryJob.available_at <= now),
+            and_(
+                QueryJob.status == QueryStatus.PROCESSING.value,
+                QueryJob.lease_expires_at < now,
+                QueryJob.attempts < self.max_attempts
+            )
+        )
+
+    def _expire_abandoned(self, db: Session, now: datetime) -> None:
+        """Marca como error las consultas abandonadas que agotaron sus intentos"""
+        result = db.execute(
+            update(QueryJob)
+            .where(
+                QueryJob.status == QueryStatus.PROCESSING.value,
+                QueryJob.lease_expires_at < now,
+                QueryJob.attempts >= self.max_attempts
+            )
+            .values(
+                status=QueryStatus.ERROR.value,
+                lease_owner=None,
+                needs_human_review=True,
+                review_reason="El procesamiento de la consulta se interrumpió repetidamente",
+                processed_at=now
+            )
+        )
+        if result.rowcount:
+            logger.warning(f"{result.rowcount} consultas abandonadas marcadas con error")
+        db.commit()
+
+    def lease(self, db: Session, worker_id: str) -> Optional[QueryJob]:
+        """
+        Reserva la consulta disponible más antigua.
+
+        Args:
+            db: Sesión de base de datos
+            worker_id: Identificador del worker que la procesará
+
+        Returns:
+            Consulta reservada o None si no hay ninguna disponible
+        """
+        self._ensure_table(db)
+        now = datetime.now()
+        self._expire_abandoned(db, now)
+
+        candidates = (
+            db.query(QueryJob.id)
+            .filter(self._available(now))
+            .order_by(QueryJob.available_at)
+            .limit(LEASE_CANDIDATES)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for (job_id,) in candidates:
+            result = db.execute(
+                update(QueryJob)
+                .where(QueryJob.id == job_id, self._available(now))
+                .values(
+                    status=QueryStatus.PROCESSING.value,
+                    lease_owner=worker_id,
+                    lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                    attempts=QueryJob.attempts + 1
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            if result.rowcount == 1:
+                return db.get(QueryJob, job_id, populate_existing=True)
+        db.commit()
+        return None
+
+    def _owned(self, job_id: str, worker_id: str):
+        return and_(
+            QueryJob.id == job_id,
+            QueryJob.lease_owner == worker_id,
+            QueryJob.status == QueryStatus.PROCESSING.value
+        )
+
+    def extend(self, db: Session, job_id: str, worker_id: str) -> bool:
+        """Renueva el arriendo; devuelve False si el worker ya no es su dueño"""
+        result = db.execute(
+            update(QueryJob)
+            .where(self._owned(job_id, worker_id))
+            .values(lease_expires_at=datetime.now() + timedelta(seconds=self.lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def complete(self, db: Session, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """
+        Guarda el resultado de una consulta.
+
+        Args:
+            db: Sesión de base de datos
+            job_id: ID de la consulta
+            worker_id: Worker dueño del arriendo
+            result: response_text, sources, confidence_score, needs_human_review y review_reason
+
+        Returns:
+            False si el arriendo ya no pertenecía al worker (el resultado se descarta)
+        """
+        updated = db.execute(
+            update(QueryJob)
+            .where(self._owned(job_id, worker_id))
+            .values(
+                status=(QueryStatus.NEEDS_HUMAN if result["needs_human_review"] else QueryStatus.COMPLETED).value,
+                response_text=result["response_text"],
+                sources=json.dumps(result["sources"], ensure_ascii=False),
+                confidence_score=result["confidence_score"],
+                needs_human_review=result["needs_human_review"],
+                review_reason=result["review_reason"],
+                lease_owner=None,
+                lease_expires_at=None,
+                last_error=None,
+                processed_at=datetime.now()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return updated.rowcount == 1
+
+    def fail(self, db: Session, job_id: str, worker_id: str, error: Exception) -> Optional[str]:
+        """
+        Registra una falla: programa un reintento con espera exponencial o, si
+        se agotaron los intentos, marca la consulta con error (o guarda el
+        resultado degradado de una falla temporal).
+
+        Returns:
+            Nuevo estado de la consulta, o None si el arriendo ya no pertenecía al worker
+        """
+        job = db.get(QueryJob, job_id, populate_existing=True)
+        if job is None or job.lease_owner != worker_id or job.status != QueryStatus.PROCESSING.value:
+            return None
+
+        if job.attempts < self.max_attempts:
+            delay = self.retry_delay * (2 ** (job.attempts - 1))
+            db.execute(
+                update(QueryJob)
+                .where(self._owned(job_id, worker_id))
+                .values(
+                    status=QueryStatus.PENDING.value,
+                    available_at=datetime.now() + timedelta(seconds=delay),
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    last_error=str(error)
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            logger.warning(f"Consulta {job_id} reintentará en {delay:.0f} segundos: {str(error)}")
+            return QueryStatus.PENDING.value
+
+        degraded = getattr(error, "result", None)
+        if degraded is not None:
+            self.complete(db, job_id, worker_id, degraded)
+            return (QueryStatus.NEEDS_HUMAN if degraded["needs_human_review"] else QueryStatus.COMPLETED).value
+
+        db.execute(
+            update(QueryJob)
+            .where(self._owned(job_id, worker_id))
+            .values(
+                status=QueryStatus.ERROR.value,
+                response_text="Lo siento, ocurrió un error al procesar tu consulta.",
+                sources=json.dumps([]),
+                confidence_score=0.0,
+                needs_human_review=True,
+                review_reason=f"Error al procesar la consulta: {str(error)}",
+                lease_owner=None,
+                lease_expires_at=None,
+                last_error=str(error),
+                processed_at=datetime.now()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        logger.error(f"Consulta {job_id} falló tras {job.attempts} intentos: {str(error)}")
+        return QueryStatus.ERROR.value
+
+    def stats(self, db: Session) -> Dict[str, int]:
+        """Consultas por estado"""
+        rows = db.query(QueryJob.status, func.count(QueryJob.id)).group_by(QueryJob.status).all()
+        return {status: count for status, count in rows}
@@ -0,0 +1,238 @@
+"""
+Workers de Consultas en Segundo Plano
+------------------------------------
+Pool de workers asíncronos que toman consultas de la cola persistente
+(QueryJobQueue) y ejecutan la búsqueda BM25 y la generación de la respuesta.
+Cada operación sobre la cola usa su propia sesión de base de datos, la
+concurrencia está acotada por el número de workers y el arriendo se renueva
+mientras el LLM responde. Al terminar una consulta se publica un evento en el
+canal del usuario (app/services/query_events.py) para avisar por WebSocket.
+
+El pool puede ejecutarse dentro de la API (QUERY_WORKERS_EMBEDDED) o como
+proceso aparte con app/scripts/query_worker.py.
+"""
+
+import os
+import socket
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.registry import registry
+from app.schemas.legal_document import SearchQuery
+from app.schemas.query import QueryStatus
+from app.services.query_events import QueryEventPublisher
+from app.services.query_queue import QueryJobQueue, TransientQueryError
+
+logger = logging.getLogger(__name__)
+
+
+def shared_services():
+    """Servicios de búsqueda y de IA compartidos (los mismos que usan los endpoints)"""
+    from app.services.ai_service import AIService
+    from app.services.search_service import SearchService
+
+    search_service = registry.get_service("search_service")
+    if search_service is None:
+        search_service = SearchService()
+        registry.register_service("search_service", search_service)
+    ai_service = registry.get_service("ai_service")
+    if ai_service is None:
+        ai_service = AIService()
+        registry.register_service("ai_service", ai_service)
+    return search_service, ai_service
+
+
+async def process_query_job(db: Session, query_text: str, user_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Busca documentos relevantes y genera la respuesta de una consulta.
+
+    Args:
+        db: Sesión de base de datos propia del worker
+        query_text: Texto de la consulta
+        user_id: Usuario que hizo la consulta
+
+    Returns:
+        Resultado para QueryJobQueue.complete
+
+    Raises:
+        TransientQueryError: Si la respuesta no se pudo generar por falta de
+            cupo o porque el servicio de IA no está disponible
+    """
+    from app.services.ai_service import RATE_LIMIT_MESSAGE, RETRIEVAL_ONLY_REASON
+
+    search_service, ai_service = shared_services()
+    search_results = await asyncio.to_thread(search_service.search_documents, db, SearchQuery(query=query_text, limit=5))
+    if not search_results:
+        return {
+            "response_text": "No se encontraron documentos relevantes para tu consulta.",
+            "sources": [],
+            "confidence_score": 0.0,
+            "needs_human_review": True,
+            "review_reason": "No se encontraron documentos relevantes"
+        }
+
+    response_text, confidence_score, needs_human_review, review_reason = await ai_service.agenerate_response(
+        query_text=query_text,
+        search_results=search_results,
+        threshold=0.7,  # Umbral de confianza para requerir revisión humana
+        user_id=user_id
+    )
+    formatted_response = ai_service.format_response_with_sources(response_text, search_results)
+    result = {
+        "response_text": formatted_response["response_text"],
+        "sources": formatted_response["sources"],
+        "confidence_score": confidence_score,
+        "needs_human_review": needs_human_review,
+        "review_reason": review_reason
+    }
+    if review_reason and (RATE_LIMIT_MESSAGE in review_reason or review_reason == RETRIEVAL_ONLY_REASON):
+        raise TransientQueryError(review_reason, result)
+    return result
+
+
+class QueryWorkerPool:
+    """Pool acotado de workers que procesan la cola de consultas"""
+
+    def __init__(self, queue: QueryJobQueue, concurrency: int = 4, poll_interval: float = 1.0,
+                 session_factory: Optional[Callable[[], Session]] = None,
+                 processor: Callable[..., Any] = process_query_job,
+                 events: Optional[QueryEventPublisher] = None):
+        """
+        Inicializa el pool
+
+        Args:
+            queue: Cola de consultas
+            concurrency: Workers (consultas procesadas a la vez)
+            poll_interval: Segundos de espera cuando la cola está vacía
+            session_factory: Crea las sesiones de base de datos (por defecto SessionLocal)
+            processor: Corrutina (db, query_text, user_id) -> resultado
+            events: Publicador de eventos de finalización (None = sin avisos)
+        """
+        if session_factory is None:
+            from app.db.database import SessionLocal
+            session_factory = SessionLocal
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self.processor = processor
+        self.events = events
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping: Optional[asyncio.Event] = None
+        self._stats = {"processed": 0, "failed": 0, "retried": 0, "lost_leases": 0, "busy": 0}
+
+    def _with_session(self, operation: Callable[[Session], Any]) -> Any:
+        """Ejecuta una operación de la cola con una sesión propia (en un hilo)"""
+        db = self.session_factory()
+        try:
+            return operation(db)
+        finally:
+            db.close()
+
+    async def start(self) -> None:
+        """Inicia los workers"""
+        self._stopping = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._run(f"{self.worker_prefix}:{index}")) for index in range(self.concurrency)
+        ]
+        logger.info(f"🧵 {self.concurrency} workers de consultas iniciados")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Detiene los workers; las consultas en curso se cancelan y su arriendo vence"""
+        if self._stopping is None:
+            return
+        self._stopping.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout) if self._tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+
+    async def _run(self, worker_id: str) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await asyncio.to_thread(
+                    self._with_session,
+                    lambda db: self._lease_data(db, worker_id)
+                )
+            except Exception as e:
+                logger.error(f"Error al reservar una consulta: {str(e)}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._handle(worker_id, job)
+
+    def _lease_data(self, db: Session, worker_id: str) -> Optional[Dict[str, Any]]:
+        job = self.queue.lease(db, worker_id)
+        if job is None:
+            return None
+        return {"id": job.id, "query_text": job.query_text, "user_id": job.user_id, "attempts": job.attempts}
+
+    async def _heartbeat(self, job_id: str, worker_id: str) -> None:
+        """Renueva el arriendo periódicamente mientras la consulta se procesa"""
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            owned = await asyncio.to_thread(
+                self._with_session, lambda db: self.queue.extend(db, job_id, worker_id)
+            )
+            if not owned:
+                return
+
+    async def _handle(self, worker_id: str, job: Dict[str, Any]) -> None:
+        """Procesa una consulta reservada y guarda su resultado"""
+        job_id = job["id"]
+        self._count("busy")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, worker_id))
+        db = self.session_factory()
+        try:
+            result = await self.processor(db, job["query_text"], job["user_id"])
+        except Exception as e:
+            heartbeat.cancel()
+            status = await asyncio.to_thread(
+                self._with_session, lambda session: self.queue.fail(session, job_id, worker_id, e)
+            )
+            self._count("retried" if status == QueryStatus.PENDING.value else "failed")
+            await self._on_finished(job, status)
+            return
+        finally:
+            heartbeat.cancel()
+            db.close()
+            self._count("busy", -1)
+
+        owned = await asyncio.to_thread(
+            self._with_session, lambda session: self.queue.complete(session, job_id, worker_id, result)
+        )
+        if not owned:
+            self._count("lost_leases")
+            logger.warning(f"Arriendo de la consulta {job_id} perdido; resultado descartado")
+            return
+        self._count("processed")
+        status = QueryStatus.NEEDS_HUMAN if result["needs_human_review"] else QueryStatus.COMPLETED
+        await self._on_finished(job, status.value, result)
+
+    async def _on_finished(self, job: Dict[str, Any], status: Optional[str],
+                           result: Optional[Dict[str, Any]] = None) -> None:
+        """Avisa al usuario cuando la consulta llegó a un estado final (no en los reintentos)"""
+        logger.info(f"Consulta {job['id']} procesada: {status}")
+        if self.events is None or status in (None, QueryStatus.PENDING.value):
+            return
+        event = {"type": "query_completed", "query_id": job["id"], "status": status}
+        if result is not None:
+            event.update(result)
+        await self.events.publish(job["user_id"], event)
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        self._stats[key] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores del pool"""
+        stats = dict(self._stats)
+        stats["workers"] = len(self._tasks)
+        return stats
@@ -0,0 +1,257 @@
+"""
+Caché de Respuestas de IA
+------------------------
+Caché de dos niveles para las respuestas generadas por el LLM:
+1. Memoria: LRU acotado por número de entradas, por proceso
+2. Disco: base de datos SQLite compartida por todos los workers (modo WAL)
+
+Ambos niveles respetan un TTL; el nivel de disco se limita además por número
+de entradas, eliminando primero las expiradas y luego las menos usadas. La
+fecha de último acceso de los aciertos en disco se acumula en memoria y se
+escribe junto con la siguiente escritura o depuración, de modo que una lectura
+nunca hace commit. Las
+fallas nunca se almacenan, de modo que una respuesta guardada después por
+otro worker se encuentra en la siguiente consulta.
+"""
+
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("ai_service")
+
+# Cada cuántas escrituras se aplica la política de expulsión en disco
+EVICTION_INTERVAL = 100
+
+
+class ResponseCache:
+    """Caché de respuestas con nivel en memoria y nivel persistente en SQLite"""
+
+    def __init__(self, db_path: str, ttl_seconds: int = 604800,
+                 memory_size: int = 500, max_entries: int = 10000):
+        """
+        Inicializa el caché
+
+        Args:
+            db_path: Ruta de la base de datos SQLite
+            ttl_seconds: Tiempo de vida de cada respuesta
+            memory_size: Entradas máximas en memoria (0 desactiva el nivel en memoria)
+            max_entries: Entradas máximas en disco
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+
+        self._memory = OrderedDict()  # {hash: (expira, datos)}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_eviction = 0
+        self._pending_access = {}  # {hash: último acceso aún no escrito en disco}
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión SQLite del hilo actual; la base de datos se crea en el primer uso, no al importar"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._initialized:
+                    self._initialize_db()
+                    self._initialized = True
+        return conn
+
+    def _initialize_db(self) -> None:
+        try:
+            conn = self._connection()
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS ai_response_cache (
+                query_hash TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ai_response_expires ON ai_response_cache(expires_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ai_response_accessed ON ai_response_cache(accessed_at)')
+            conn.commit()
+        except Exception as e:
+            logger.error(f"❌ Error al inicializar el caché de respuestas: {str(e)}")
+
+    def _remember(self, query_hash: str, expires_at: float, data: Dict[str, Any]) -> None:
+        """Guarda una entrada en el nivel en memoria"""
+        if self.memory_size <= 0:
+            return
+        with self._lock:
+            self._memory[query_hash] = (expires_at, data)
+            self._memory.move_to_end(query_hash)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _flush_access(self, conn: sqlite3.Connection) -> None:
+        """Escribe las fechas de acceso acumuladas (el commit lo hace quien llama)"""
+        with self._lock:
+            pending, self._pending_access = self._pending_access, {}
+        if pending:
+            conn.executemany(
+                'UPDATE ai_response_cache SET accessed_at = ? WHERE query_hash = ?',
+                [(accessed_at, query_hash) for query_hash, accessed_at in pending.items()]
+            )
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += amount
+
+    def get(self, query_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Recupera una respuesta del caché
+
+        Args:
+            query_hash: Hash de la consulta
+
+        Returns:
+            Datos de respuesta cacheados o None si no existen o expiraron
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(query_hash)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(query_hash)
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[query_hash]
+
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT data, expires_at FROM ai_response_cache WHERE query_hash = ? AND expires_at > ?',
+                (query_hash, now)
+            ).fetchone()
+            if row is not None:
+                data = json.loads(row[0])
+                self._remember(query_hash, row[1], data)
+                with self._lock:
+                    self._pending_access[query_hash] = now
+                    self._stats["disk_hits"] += 1
+                logger.info(f"✅ Respuesta recuperada de caché: {query_hash}")
+                return data
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"❌ Error al leer caché: {str(e)}")
+
+        self._count("misses")
+        return None
+
+    def set(self, query_hash: str, data: Dict[str, Any]) -> bool:
+        """
+        Guarda una respuesta en ambos niveles del caché
+
+        Args:
+            query_hash: Hash de la consulta
+            data: Datos a guardar (serializables como JSON)
+
+        Returns:
+            True si se guardó correctamente en disco, False en caso contrario
+        """
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._remember(query_hash, expires_at, data)
+        with self._lock:
+            self._pending_access.pop(query_hash, None)
+
+        try:
+            conn = self._connection()
+            conn.execute(
+                '''
+                INSERT OR REPLACE INTO ai_response_cache (query_hash, data, created_at, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                ''',
+                (query_hash, json.dumps(data, ensure_ascii=False), now, expires_at, now)
+            )
+            self._flush_access(conn)
+            conn.commit()
+            logger.info(f"✅ Respuesta guardada en caché: {query_hash}")
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"❌ Error al guardar en caché: {str(e)}")
+            return False
+
+        with self._lock:
+            self._stats["writes"] += 1
+            self._writes_since_eviction += 1
+            evict = self._writes_since_eviction >= EVICTION_INTERVAL
+            if evict:
+                self._writes_since_eviction = 0
+        if evict:
+            self.evict()
+        return True
+
+    def invalidate(self, query_hash: str) -> None:
+        """Elimina una respuesta de ambos niveles"""
+        with self._lock:
+            self._memory.pop(query_hash, None)
+        try:
+            conn = self._connection()
+            conn.execute('DELETE FROM ai_response_cache WHERE query_hash = ?', (query_hash,))
+            conn.commit()
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"❌ Error al invalidar caché: {str(e)}")
+
+    def evict(self) -> int:
+        """
+        Elimina las entradas expiradas y, si se supera el máximo, las menos
+        usadas recientemente.
+
+        Returns:
+            Número de entradas eliminadas del disco
+        """
+        try:
+            conn = self._connection()
+            self._flush_access(conn)
+            removed = conn.execute('DELETE FROM ai_response_cache WHERE expires_at <= ?', (time.time(),)).rowcount
+            excess = conn.execute('SELECT COUNT(*) FROM ai_response_cache').fetchone()[0] - self.max_entries
+            if excess > 0:
+                removed += conn.execute(
+                    '''
+                    DELETE FROM ai_response_cache WHERE query_hash IN (
+                        SELECT query_hash FROM ai_response_cache ORDER BY accessed_at ASC LIMIT ?
+                    )
+                    ''',
+                    (excess,)
+                ).rowcount
+            conn.commit()
+            if removed:
+                self._count("evictions", removed)
+                logger.info(f"🧹 {removed} respuestas eliminadas del caché")
+            return removed
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"❌ Error al depurar caché: {str(e)}")
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve las métricas del caché"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        try:
+            stats["disk_entries"] = self._connection().execute('SELECT COUNT(*) FROM ai_response_cache').fetchone()[0]
+        except Exception:
+            stats["disk_entries"] = None
+        return stats
@@ -24,6 +24,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, text
 
 from app.models.legal_document import LegalDocument, DocumentType
+from app.services.optimized_bm25_service import INDEX_BATCH_SIZE
 from app.schemas.legal_document import SearchQuery, LegalDocumentSearchResult, LegalDocumentResponse
 
 
@@ -195,8 +196,7 @@ class SearchService:
             
         # Mantener el índice BM25 en memoria
         self._bm25_index = None
-        self._corpus = None
-        self._corpus_documents = None
+        self._document_ids = None  # IDs de los documentos, alineados con el índice
         self._last_index_update = None
         
     def preprocess_text(self, text: str) -> List[str]:
@@ -270,7 +270,7 @@ class SearchService:
     def _need_reindex(self, db: Session) -> bool:
         """Verifica si es necesario reconstruir el índice BM25"""
         # Si no hay índice, se necesita crear
-        if self._bm25_index is None or self._corpus is None or self._corpus_documents is None:
+        if self._bm25_index is None or self._document_ids is None:
             return True
             
         # Si no hay fecha de última actualización, se necesita reconstruir
@@ -286,15 +286,21 @@ class SearchService:
         return False
         
     def _build_index(self, db: Session) -> None:
-        """Construye o reconstruye el índice BM25"""
-        # Obtener todos los documentos
-        self._corpus_documents = db.query(LegalDocument).all()
-        
-        # Preprocesar el corpus
-        self._corpus = [self.preprocess_text(doc.content) for doc in self._corpus_documents]
+        """
+        Construye o reconstruye el índice BM25 leyendo los documentos por lotes
+        (sólo id y contenido). En memoria sólo se conservan los IDs; los
+        documentos de cada página de resultados se leen al buscar.
+        """
+        document_ids = []
+        corpus = []
+        rows = db.query(LegalDocument.id, LegalDocument.content).yield_per(INDEX_BATCH_SIZE)
+        for row in rows:
+            document_ids.append(row.id)
+            corpus.append(self.preprocess_text(row.content))
         
         # Crear el índice BM25 con los parámetros optimizados
-        self._bm25_index = BM25Okapi(self._corpus, k1=self.k1, b=self.b)
+        self._bm25_index = BM25Okapi(corpus, k1=self.k1, b=self.b)
+        self._document_ids = document_ids
         
         # Actualizar la fecha de última indexación
         self._last_index_update = datetime.now()
@@ -356,17 +362,24 @@ class SearchService:
             if self._need_reindex(db):
                 self._build_index(db)
                 
-            # Usar documentos e índice en memoria
-            documents = self._corpus_documents
-            
-            if not documents:
+            if not self._document_ids:
                 return []
                 
             # Preprocesar la consulta
             tokenized_query = self.preprocess_text(search_query.query)
             
             # Obtener puntuaciones usando el índice en memoria
-            scores = self._bm25_index.get_scores(tokenized_query)
+            all_scores = self._bm25_index.get_scores(tokenized_query)
+            
+            # Leer de la base de datos sólo los documentos de la página de resultados
+            top_pairs = sorted(zip(self._document_ids, all_scores), key=lambda x: x[1], reverse=True)
+            top_pairs = [(doc_id, score) for doc_id, score in top_pairs[:search_query.limit or 10] if score > 0]
+            loaded = {
+                doc.id: doc for doc in
+                db.query(LegalDocument).filter(LegalDocument.id.in_([doc_id for doc_id, _ in top_pairs])).all()
+            }
+            documents = [loaded[doc_id] for doc_id, _ in top_pairs if doc_id in loaded]
+            scores = [score for doc_id, score in top_pairs if doc_id in loaded]
         
         # Crear pares (documento, puntuación) y ordenar por puntuación descendente
         doc_score_pairs = [(doc, score) for doc, score in zip(documents, scores)]
@@ -404,4 +417,28 @@ class SearchService:
         # Calcular tiempo de procesamiento para optimización
         processing_time = time.time() - start_time
                 
-        return formatted_results
\ No newline at end of file
+        return formatted_results
+
+    def warmup(self, db: Session) -> Dict[str, Any]:
+        """
+        Prepara el servicio para atender búsquedas sin arranque en frío:
+        carga los datos de NLTK y construye el índice BM25 en memoria.
+        
+        Args:
+            db: Sesión de base de datos
+            
+        Returns:
+            Resumen del calentamiento
+        """
+        start_time = time.time()
+        
+        # Cargar tokenizadores de NLTK (punkt se carga de forma perezosa)
+        self.generate_snippet("Calentamiento del servicio. Carga de datos.", self.preprocess_text("calentamiento"))
+        
+        if self._need_reindex(db):
+            self._build_index(db)
+            
+        return {
+            "document_count": len(self._document_ids) if self._document_ids else 0,
+            "elapsed_seconds": round(time.time() - start_time, 2)
+        }
@@ -0,0 +1,215 @@
+"""
+Caché Semántico de Respuestas
+----------------------------
+Reutiliza respuestas de consultas parecidas (paráfrasis) que el caché exacto
+por hash no detecta. Cada consulta se normaliza y se proyecta con un
+vectorizador por hashing (raíces de palabras y trigramas de caracteres) sobre
+un índice vectorial pequeño en memoria. Una respuesta sólo se reutiliza si la
+similitud supera el umbral, las dos consultas tienen las mismas palabras de
+polaridad ("sin"/"con", "no", "ni"...: cambian el sentido jurídico aunque el
+resto coincida) y los documentos recuperados coinciden lo suficiente con los
+de la consulta original; las citas [DocN] se renumeran según el orden de los
+documentos de la nueva consulta.
+"""
+
+import re
+import time
+import zlib
+import logging
+import threading
+import unicodedata
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from nltk.corpus import stopwords
+from nltk.stem import SnowballStemmer
+
+logger = logging.getLogger("ai_service")
+
+# Dimensión del vectorizador por hashing
+EMBEDDING_DIM = 4096
+
+# Citas de documentos en respuestas crudas ([Doc1]) y formateadas ([📄 Doc1])
+_CITATION_PATTERN = re.compile(r'\[(📄 )?Doc(\d+)\]')
+
+# Palabras de negación y polaridad (sin acentos): son stopwords o palabras
+# cortas, pero invierten el sentido de la consulta
+POLARITY_WORDS = frozenset({
+    "no", "ni", "sin", "con", "nunca", "jamas", "tampoco", "nadie", "nada",
+    "ningun", "ninguna", "ninguno", "excepto", "salvo"
+})
+
+# Peso de cada palabra de polaridad en el vector (el de una raíz es 1)
+POLARITY_WEIGHT = 2.0
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def _words(query_text: str) -> List[str]:
+    return re.findall(r"[a-zñ0-9]+", _strip_accents(query_text.lower()))
+
+
+def polarity_terms(query_text: str) -> frozenset:
+    """Palabras de polaridad de la consulta; dos consultas con conjuntos distintos no son equivalentes"""
+    return frozenset(word for word in _words(query_text) if word in POLARITY_WORDS)
+
+
+class SemanticAnswerCache:
+    """Índice en memoria de consultas respondidas y sus respuestas"""
+
+    def __init__(self, threshold: float = 0.85, min_overlap: float = 0.5,
+                 max_entries: int = 1000, ttl_seconds: int = 604800):
+        """
+        Inicializa el caché semántico
+
+        Args:
+            threshold: Similitud coseno mínima entre consultas
+            min_overlap: Coincidencia mínima (Jaccard) entre los documentos recuperados
+            max_entries: Consultas máximas en el índice (se reemplazan las más antiguas)
+            ttl_seconds: Tiempo de vida de cada respuesta
+        """
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.stemmer = SnowballStemmer('spanish')
+        self.stop_words = {_strip_accents(word) for word in stopwords.words('spanish')} - POLARITY_WORDS
+
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_entries, EMBEDDING_DIM), dtype=np.float32)
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self._next_slot = 0
+        self._stats = {"hits": 0, "misses": 0, "rejected_overlap": 0,
+                       "rejected_polarity": 0, "stores": 0}
+
+    def embed(self, query_text: str) -> np.ndarray:
+        """
+        Proyecta la consulta normalizada en un vector unitario.
+
+        Args:
+            query_text: Texto de la consulta
+
+        Returns:
+            Vector de dimensión EMBEDDING_DIM (ceros si no hay términos)
+        """
+        words = [
+            w for w in _words(query_text)
+            if w in POLARITY_WORDS or (w not in self.stop_words and len(w) > 2)
+        ]
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for word in words:
+            if word in POLARITY_WORDS:
+                # Término propio, sin trigramas: "sin" y "con" no deben parecerse
+                vector[zlib.crc32(f"p:{word}".encode()) % EMBEDDING_DIM] += POLARITY_WEIGHT
+                continue
+            stem = self.stemmer.stem(word)
+            vector[zlib.crc32(f"w:{stem}".encode()) % EMBEDDING_DIM] += 1.0
+            padded = f"#{stem}#"
+            for i in range(len(padded) - 2):
+                vector[zlib.crc32(f"c:{padded[i:i + 3]}".encode()) % EMBEDDING_DIM] += 0.5
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, query_text: str, doc_ids: Sequence[Any]) -> Optional[Tuple[str, float, bool, Optional[str]]]:
+        """
+        Busca una respuesta de una consulta parecida con documentos coincidentes.
+
+        Args:
+            query_text: Texto de la consulta
+            doc_ids: IDs de los documentos del contexto, en orden
+
+        Returns:
+            Tupla de respuesta (texto, confianza, revisión, razón) o None
+        """
+        vector = self.embed(query_text)
+        if not vector.any() or not doc_ids:
+            return None
+
+        polarity = polarity_terms(query_text)
+        now = time.time()
+        with self._lock:
+            similarities = self._vectors @ vector
+            for slot in np.argsort(-similarities)[:5]:
+                entry = self._entries[slot]
+                if similarities[slot] < self.threshold:
+                    break
+                if entry is None or entry["expires_at"] <= now:
+                    continue
+                if entry["polarity"] != polarity:
+                    self._stats["rejected_polarity"] += 1
+                    continue
+                if self._overlap(entry["doc_ids"], doc_ids) < self.min_overlap:
+                    self._stats["rejected_overlap"] += 1
+                    continue
+                response_text = self._remap_citations(entry["response"][0], entry["doc_ids"], doc_ids)
+                if response_text is None:
+                    self._stats["rejected_overlap"] += 1
+                    continue
+                self._stats["hits"] += 1
+                logger.info(
+                    f"✅ Respuesta semántica reutilizada (similitud {similarities[slot]:.2f}): "
+                    f"'{entry['query']}' → '{query_text}'"
+                )
+                return (response_text,) + tuple(entry["response"][1:])
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, query_text: str, doc_ids: Sequence[Any], response: Tuple[str, float, bool, Optional[str]]) -> None:
+        """
+        Registra la respuesta de una consulta.
+
+        Args:
+            query_text: Texto de la consulta
+            doc_ids: IDs de los documentos del contexto, en orden
+            response: Tupla de respuesta (texto, confianza, revisión, razón)
+        """
+        vector = self.embed(query_text)
+        if not vector.any() or not doc_ids:
+            return
+        with self._lock:
+            slot = self._next_slot
+            self._vectors[slot] = vector
+            self._entries[slot] = {
+                "query": query_text,
+                "polarity": polarity_terms(query_text),
+                "doc_ids": list(doc_ids),
+                "response": tuple(response),
+                "expires_at": time.time() + self.ttl_seconds
+            }
+            self._next_slot = (slot + 1) % self.max_entries
+            self._stats["stores"] += 1
+
+    @staticmethod
+    def _overlap(old_ids: Sequence[Any], new_ids: Sequence[Any]) -> float:
+        old, new = set(old_ids), set(new_ids)
+        return len(old & new) / len(old | new) if old | new else 0.0
+
+    @staticmethod
+    def _remap_citations(response_text: str, old_ids: Sequence[Any], new_ids: Sequence[Any]) -> Optional[str]:
+        """
+        Renumera las citas [DocN] según la posición de cada documento en el
+        nuevo contexto. Devuelve None si se cita un documento que no está.
+        """
+        positions = {doc_id: index for index, doc_id in enumerate(new_ids, 1)}
+        missing = False
+
+        def replace(match):
+            nonlocal missing
+            old_index = int(match.group(2))
+            doc_id = old_ids[old_index - 1] if 0 < old_index <= len(old_ids) else None
+            if doc_id not in positions:
+                missing = True
+                return match.group(0)
+            return f"[{match.group(1) or ''}Doc{positions[doc_id]}]"
+
+        remapped = _CITATION_PATTERN.sub(replace, response_text)
+        return None if missing else remapped
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve las métricas del caché semántico"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = sum(1 for entry in self._entries if entry is not None)
+        return stats
@@ -0,0 +1,406 @@
+"""
+Servicio BM25 Particionado
+-------------------------
+Este módulo reparte el índice BM25 entre varios procesos de trabajo. Cada
+proceso (shard) tokeniza e indexa una parte del corpus; el coordinador reúne
+las estadísticas globales (frecuencia de documentos, número de documentos y
+longitud media) para que las puntuaciones sean idénticas a las de un índice
+único, difunde cada consulta a todos los shards y combina sus top-k parciales.
+"""
+
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+import numpy as np
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Any, Tuple, Optional
+from sqlalchemy.orm import Session
+
+from app.models.corpus_generation import (
+    ensure_corpus_generation_table, get_corpus_generation, local_generation
+)
+from app.schemas.legal_document import SearchQuery
+from app.services.bm25_index import CompactIndexBuilder, bm25_idf
+from app.services.optimized_bm25_service import (
+    OptimizedBM25Service, FACET_FIELDS, INDEX_BATCH_SIZE, _facet_value, _query_filters, _stream_index_rows
+)
+
+logger = logging.getLogger("bm25_service")
+
+
+class ShardError(RuntimeError):
+    """Un proceso de shard falló o dejó de responder"""
+
+
+class _ShardIndex:
+    """Índice invertido de una partición del corpus (vive en el proceso del shard)"""
+
+    def __init__(self, k1: float, b: float):
+        self.k1 = k1
+        self.b = b
+        # El tokenizador es el mismo que el del coordinador (sin caché de consultas)
+        self._tokenizer = OptimizedBM25Service(k1=k1, b=b, use_cache=False)
+        self.reset()
+
+    def reset(self):
+        """Descarta el contenido del shard"""
+        self._builder = CompactIndexBuilder()
+        self._ids = []
+        self._facets = []  # Valores de faceta por documento
+        self._error = None
+        self.index = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.facet_codes = {}  # {campo: códigos por posición (-1 = sin valor)}
+        self.facet_values = {}  # {campo: [valor por código]}
+
+    def add(self, documents: List[Tuple[int, str, Tuple[Optional[str], ...]]]):
+        """Tokeniza un lote de documentos (id, contenido, valores de faceta)"""
+        try:
+            for doc_id, content, facets in documents:
+                tokens = self._tokenizer.preprocess_text(content)
+                if tokens:
+                    self._builder.add(tokens)
+                    self._ids.append(doc_id)
+                    self._facets.append(facets)
+        except Exception as e:
+            self._error = str(e)
+
+    def finalize(self) -> Dict[str, Any]:
+        """
+        Construye el índice compacto del shard y devuelve las estadísticas
+        locales que el coordinador combina en las estadísticas globales.
+        """
+        if self._error:
+            raise RuntimeError(self._error)
+
+        self.index = self._builder.build(k1=self.k1, b=self.b)
+        self.ids = np.asarray(self._ids, dtype=np.int64)
+        for field_index, field in enumerate(FACET_FIELDS):
+            codes = {}
+            encoded = np.empty(len(self._facets), dtype=np.int32)
+            for position, facets in enumerate(self._facets):
+                value = facets[field_index]
+                encoded[position] = codes.setdefault(value, len(codes)) if value is not None else -1
+            self.facet_codes[field] = encoded
+            self.facet_values[field] = list(codes)
+
+        self._ids = []
+        self._facets = []
+        return {
+            "document_ids": self.ids.tolist(),
+            "total_length": float(self.index.total_length),
+            "df": self.index.document_frequencies(),
+        }
+
+    def _filter_mask(self, filters: Dict[str, str], exclude_field: Optional[str] = None) -> Optional[np.ndarray]:
+        mask = None
+        for field, value in filters.items():
+            if field == exclude_field:
+                continue
+            try:
+                code = self.facet_values[field].index(value)
+            except ValueError:
+                return np.zeros(self.ids.size, dtype=bool)
+            bitmap = self.facet_codes[field] == code
+            mask = bitmap if mask is None else mask & bitmap
+        return mask
+
+    def search(self, terms: List[Tuple[str, float]], avgdl: float, limit: int,
+               filters: Dict[str, str], after: Optional[Tuple[float, int]]) -> Dict[str, Any]:
+        """
+        Puntúa la consulta con las estadísticas globales y devuelve el top-k
+        local, el número de candidatos y los conteos de facetas del shard.
+        """
+        if self.index is None or self.index.corpus_size == 0:
+            return {"pairs": [], "candidate_count": 0, "facets": {}}
+        scores = self.index.score_terms(terms, avgdl)
+        matches = scores > 0
+
+        facets = {}
+        for field in FACET_FIELDS:
+            mask = self._filter_mask(filters, exclude_field=field)
+            scope = matches if mask is None else matches & mask
+            codes = self.facet_codes[field][scope]
+            counts = np.bincount(codes[codes >= 0], minlength=len(self.facet_values[field]))
+            facets[field] = {
+                self.facet_values[field][code]: int(count) for code, count in enumerate(counts) if count
+            }
+
+        filter_mask = self._filter_mask(filters)
+        if filter_mask is not None:
+            matches = matches & filter_mask
+        candidates = np.flatnonzero(matches)
+        if after is not None and candidates.size:
+            candidate_scores = scores[candidates]
+            candidate_ids = self.ids[candidates]
+            candidates = candidates[
+                (candidate_scores < after[0]) | ((candidate_scores == after[0]) & (candidate_ids > after[1]))
+            ]
+
+        candidate_count = int(candidates.size)
+        if candidates.size > limit:
+            candidate_scores = scores[candidates]
+            kth = np.partition(candidate_scores, candidates.size - limit)[candidates.size - limit]
+            candidates = candidates[candidate_scores >= kth]
+        order = np.lexsort((self.ids[candidates], -scores[candidates]))
+        candidates = candidates[order][:limit]
+        return {
+            "pairs": [(int(self.ids[idx]), float(scores[idx])) for idx in candidates],
+            "candidate_count": candidate_count,
+            "facets": facets,
+        }
+
+
+def _shard_worker(conn, k1: float, b: float) -> None:
+    """Bucle principal de un proceso de shard: ejecuta los comandos del coordinador"""
+    index = _ShardIndex(k1, b)
+    while True:
+        try:
+            command, payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if command == "close":
+            break
+        if command == "add":
+            # Sin respuesta: los errores se reportan en "finalize"
+            index.add(payload)
+            continue
+        try:
+            result = getattr(index, command)(**payload)
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", str(e)))
+    conn.close()
+
+
+class _Shard:
+    """Conexión del coordinador con un proceso de shard"""
+
+    def __init__(self, number: int, k1: float, b: float):
+        context = multiprocessing.get_context("spawn")
+        self.number = number
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_shard_worker, args=(child_conn, k1, b),
+            name=f"bm25-shard-{number}", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def send(self, command: str, payload: Any = None) -> None:
+        try:
+            self.conn.send((command, payload if payload is not None else {}))
+        except (OSError, EOFError) as e:
+            raise ShardError(f"Shard {self.number} no disponible: {str(e)}")
+
+    def receive(self) -> Any:
+        try:
+            status, result = self.conn.recv()
+        except (OSError, EOFError) as e:
+            raise ShardError(f"Shard {self.number} no responde: {str(e)}")
+        if status != "ok":
+            raise ShardError(f"Error en shard {self.number}: {result}")
+        return result
+
+    @property
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def close(self) -> None:
+        try:
+            self.conn.send(("close", {}))
+        except Exception:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class ShardedBM25Service(OptimizedBM25Service):
+    """
+    Coordinador de búsqueda BM25 sobre varios procesos de shard.
+    Conserva la interfaz de OptimizedBM25Service (caché, facetas, cursores e
+    hidratación de resultados); sólo cambian la construcción del índice y la
+    puntuación, que se realizan en los shards.
+    """
+
+    def __init__(self, num_shards: int = 2, **kwargs):
+        """
+        Inicializa el coordinador
+
+        Args:
+            num_shards: Número de procesos de shard
+            **kwargs: Parámetros de OptimizedBM25Service
+        """
+        super().__init__(**kwargs)
+        self.num_shards = max(1, num_shards)
+        self._shards: List[_Shard] = []
+        self._shard_lock = threading.Lock()
+        self._idf: Dict[str, float] = {}
+        self._avgdl = 0.0
+        atexit.register(self.close)
+        logger.info(f"Servicio BM25 particionado inicializado con {self.num_shards} shards")
+
+    def _ensure_shards(self) -> None:
+        """Arranca los procesos de shard que no estén en ejecución"""
+        if len(self._shards) == self.num_shards and all(shard.is_alive for shard in self._shards):
+            return
+        self._close_shards()
+        self._shards = [_Shard(number, self.k1, self.b) for number in range(self.num_shards)]
+
+    def _close_shards(self) -> None:
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+
+    def close(self) -> None:
+        """Detiene los procesos de shard"""
+        with self._shard_lock:
+            self._close_shards()
+            self._bm25_index = None
+
+    def _reset_index(self) -> None:
+        self._bm25_index = None
+        self._document_ids = None
+        self._document_ids_array = None
+        self._idf = {}
+        self._last_index_update = None
+
+    def _global_idf(self, df: Counter, corpus_size: int) -> Dict[str, float]:
+        """Calcula el idf global con la misma fórmula que BM25Okapi"""
+        terms = list(df)
+        return dict(zip(terms, bm25_idf([df[term] for term in terms], corpus_size).tolist()))
+
+    def _build_index(self, db: Session) -> bool:
+        """
+        Reparte el corpus entre los shards y combina sus estadísticas.
+        Retorna True si el índice se construyó correctamente, False en caso contrario.
+        """
+        if self._is_building_index:
+            logger.warning("Ya se está construyendo el índice BM25")
+            return False
+
+        self._is_building_index = True
+        start_time = time.time()
+        try:
+            with self._shard_lock:
+                logger.info(f"Construyendo índice BM25 particionado en {self.num_shards} shards...")
+                index_local_generation = local_generation()
+                try:
+                    ensure_corpus_generation_table(db.get_bind())
+                    index_generation = get_corpus_generation(db)
+                except Exception as e:
+                    logger.warning(f"No se pudo leer la generación del corpus: {str(e)}")
+                    index_generation = None
+
+                self._ensure_shards()
+                for shard in self._shards:
+                    shard.send("reset")
+                    shard.receive()
+
+                # Enviar lotes a los shards por turnos mientras se leen los documentos
+                batch = []
+                batch_number = 0
+                for row in _stream_index_rows(db):
+                    facets = tuple(_facet_value(row, field) for field in FACET_FIELDS)
+                    batch.append((row.id, row.content, facets))
+                    if len(batch) == INDEX_BATCH_SIZE:
+                        self._shards[batch_number % self.num_shards].send("add", batch)
+                        batch_number += 1
+                        batch = []
+                if batch:
+                    self._shards[batch_number % self.num_shards].send("add", batch)
+
+                # Reunir las estadísticas locales y calcular las globales
+                for shard in self._shards:
+                    shard.send("finalize")
+                document_ids = []
+                total_length = 0.0
+                df = Counter()
+                for shard in self._shards:
+                    stats = shard.receive()
+                    document_ids.extend(stats["document_ids"])
+                    total_length += stats["total_length"]
+                    df.update(stats["df"])
+
+                if not document_ids:
+                    logger.warning("No hay documentos con contenido válido para indexar")
+                    self._reset_index()
+                    return False
+
+                self._document_ids = document_ids
+                self._document_ids_array = np.asarray(document_ids, dtype=np.int64)
+                self._idf = self._global_idf(df, len(document_ids))
+                self._avgdl = total_length / len(document_ids)
+                self._bm25_index = self._shards
+
+                self._last_index_update = datetime.now()
+                self._index_generation = index_generation
+                self._index_local_generation = index_local_generation
+                self._last_freshness_check = time.monotonic()
+
+            elapsed_time = time.time() - start_time
+            logger.info(f"Índice BM25 particionado construido con {len(document_ids)} documentos en {elapsed_time:.2f} segundos")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error al construir índice BM25 particionado: {str(e)}")
+            with self._shard_lock:
+                self._close_shards()
+                self._reset_index()
+            return False
+
+        finally:
+            self._is_building_index = False
+
+    def _rank(self, tokenized_query: List[str], search_query: SearchQuery, limit: int,
+              after: Optional[Tuple[float, int]] = None) -> Tuple[List[Tuple[int, float]], Dict[str, Dict[str, int]], bool]:
+        """
+        Difunde la consulta a todos los shards y combina sus top-k parciales
+        en orden (puntuación desc, id asc).
+        """
+        payload = {
+            "terms": [(term, self._idf.get(term, 0.0)) for term in tokenized_query],
+            "avgdl": self._avgdl,
+            "limit": limit,
+            "filters": _query_filters(search_query),
+            "after": after,
+        }
+        with self._shard_lock:
+            try:
+                for shard in self._shards:
+                    shard.send("search", payload)
+                partials = [shard.receive() for shard in self._shards]
+            except ShardError:
+                # Forzar la reconstrucción (y el rearranque de los shards) en la siguiente búsqueda
+                self._close_shards()
+                self._reset_index()
+                raise
+
+        pairs = sorted(
+            (pair for partial in partials for pair in partial["pairs"]),
+            key=lambda pair: (-pair[1], pair[0])
+        )
+        candidate_count = sum(partial["candidate_count"] for partial in partials)
+
+        facets = {}
+        for field in FACET_FIELDS:
+            counts = Counter()
+            for partial in partials:
+                counts.update(partial["facets"].get(field, {}))
+            facets[field] = dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+        return pairs[:limit], facets, candidate_count > limit
+
+    def index_status(self) -> Dict[str, Any]:
+        """Devuelve información sobre el estado del índice y de los shards"""
+        status = super().index_status()
+        status["shards"] = {
+            "count": self.num_shards,
+            "alive": sum(1 for shard in self._shards if shard.is_alive),
+        }
+        return status
@@ -0,0 +1,60 @@
+from app.services.answer_router import ExtractiveAnswerRouter
+
+VACACIONES = {
+    "title": "Código Sustantivo del Trabajo",
+    "relevance_score": 9.0,
+    "snippet": "Los trabajadores que hubieren prestado sus servicios durante un año tienen derecho a "
+               "quince (15) días hábiles consecutivos de vacaciones remuneradas. El empleador fijará la fecha."
+}
+CESANTIAS = {"title": "Ley 50 de 1990", "relevance_score": 3.0, "snippet": "Reglas sobre el auxilio de cesantías."}
+
+def test_pregunta_frecuente_se_responde_con_el_pasaje():
+    router = ExtractiveAnswerRouter(threshold=0.75)
+    route = router.route("¿Cuántos días de vacaciones tiene un trabajador?", [VACACIONES, CESANTIAS])
+
+    assert route is not None
+    assert route["question_type"] == "cantidad"
+    assert "quince (15) días hábiles" in route["passage"]
+    assert router.stats()["answered"] == 1
+
+def test_margen_bajo_entre_documentos_pasa_al_llm():
+    router = ExtractiveAnswerRouter(threshold=0.75)
+    cercano = dict(CESANTIAS, relevance_score=8.5)
+
+    assert router.route("¿Cuántos días de vacaciones tiene un trabajador?", [VACACIONES, cercano]) is None
+    assert router.stats()["rejected_score"] == 1
+
+def test_consultas_personales_o_sin_respuesta_directa_pasan_al_llm():
+    router = ExtractiveAnswerRouter(threshold=0.5)
+
+    assert router.route("Me despidieron sin justa causa, ¿cuántos días me pagan?", [VACACIONES]) is None
+    assert router.route("¿Qué es la prima de servicios?", [VACACIONES]) is None
+
+    stats = router.stats()
+    assert stats["evaluated"] == 2 and stats["answered"] == 0 and stats["answer_rate"] == 0.0
+
+def test_un_solo_documento_no_aporta_margen():
+    router = ExtractiveAnswerRouter(threshold=0.75)
+
+    assert router.route("¿Cuántos días de vacaciones tiene un trabajador?", [VACACIONES]) is None
+    assert router.stats()["rejected_score"] == 1
+
+PRIMA = {
+    "title": "Código Sustantivo del Trabajo",
+    "relevance_score": 9.0,
+    "snippet": "La prima de servicios es una prestación social a cargo del empleador. "
+               "Se paga en dos cuotas al año."
+}
+
+def test_definicion_requiere_que_el_pasaje_defina_el_termino():
+    router = ExtractiveAnswerRouter(threshold=0.75)
+
+    route = router.route("¿Qué es la prima de servicios?", [PRIMA, CESANTIAS])
+    assert route is not None
+    assert route["question_type"] == "definicion"
+    assert route["passage"].startswith("La prima de servicios es una prestación")
+
+    # Un pasaje que sólo contiene "es" o "son" no es una definición del término
+    sin_definicion = dict(PRIMA, snippet="El pago de la prima de servicios es obligatorio y son dos cuotas.")
+    assert router.route("¿Qué es la prima de servicios?", [sin_definicion, CESANTIAS]) is None
+    assert router.stats()["rejected_pattern"] == 1
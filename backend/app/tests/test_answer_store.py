@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.corpus_generation import CorpusGeneration
+from app.models.legal_document import LegalDocument
+from app.services.answer_store import AnswerStore
+
+RESPUESTA = {
+    "response": "Son quince días hábiles [📄 Doc1].",
+    "references": [{"id": 1, "title": "CST Artículo 186", "reference": "Art. 186", "relevance": 9.0}],
+    "confidence_score": 0.9,
+    "needs_human_review": False,
+    "review_reason": None
+}
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (LegalDocument, CorpusGeneration):
+        model.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(LegalDocument(id=1, title="CST Artículo 186", document_type="ley", reference_number="Art. 186",
+                         content="Quince días hábiles de vacaciones.", updated_at=datetime(2026, 1, 1)))
+    db.commit()
+    yield db
+    db.close()
+
+def test_variantes_comparten_la_respuesta_vigente(tmp_path, session):
+    store = AnswerStore(str(tmp_path / "answers.db"))
+    version = store.save(session, "¿Cuántos días de vacaciones tengo?", ["cuantos dias de vacaciones tengo"],
+                         RESPUESTA, [1])
+
+    assert version == 1
+    assert store.get(session, "Cuántos días de vacaciones tengo") == RESPUESTA
+    assert store.get(session, "¿Qué es la prima?") is None
+    assert store.save(session, "¿Cuántos días de vacaciones tengo?", [], RESPUESTA, [1]) == 2
+    assert store.stats()["active_answers"] == 1
+
+def test_cambio_en_documento_citado_invalida_la_respuesta(tmp_path, session):
+    store = AnswerStore(str(tmp_path / "answers.db"))
+    store.save(session, "¿Cuántos días de vacaciones tengo?", [], RESPUESTA, [1])
+
+    document = session.get(LegalDocument, 1)
+    document.content = "Dieciocho días hábiles de vacaciones."
+    document.updated_at = datetime(2026, 6, 1)
+    session.commit()
+
+    assert store.get(session, "¿Cuántos días de vacaciones tengo?") is None
+    assert store.stats()["invalidated"] == 1
+
+def test_registro_de_consultas_por_lotes(tmp_path):
+    store = AnswerStore(str(tmp_path / "answers.db"))
+    for query_text in ["¿Qué es la prima?", "que es la prima", "¿Cuánto es el salario mínimo?"]:
+        store.log_query(query_text)
+
+    assert store.top_questions(10) == []
+    store.flush()
+    assert store.top_questions(10)[0][1] == 2
@@ -0,0 +1,33 @@
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from app.services.bm25_index import CompactIndexBuilder
+
+CORPUS = [
+    ["despid", "indemniz", "contrat", "despid"],
+    ["salari", "minim", "jorn"],
+    ["vacacion", "salari", "contrat", "prim", "prim"],
+    ["licenci", "matern", "contrat"],
+    ["despid", "justa", "caus"],
+]
+
+def _build():
+    builder = CompactIndexBuilder()
+    for tokens in CORPUS:
+        builder.add(tokens)
+    return builder.build(k1=1.5, b=0.75)
+
+def test_puntuaciones_iguales_a_bm25okapi():
+    index = _build()
+    okapi = BM25Okapi(CORPUS, k1=1.5, b=0.75)
+
+    # "contrat" aparece en más de la mitad del corpus (idf negativo reemplazado)
+    for query in (["despid"], ["salari", "prim"], ["contrat", "contrat", "inexistent"]):
+        assert np.array_equal(index.get_scores(query), okapi.get_scores(query))
+
+def test_frecuencias_de_documento():
+    index = _build()
+    assert index.doc_freqs.dtype == np.int32
+    assert index.document_frequencies()["despid"] == 2
+    assert index.document_frequencies()["contrat"] == 3
+    assert index.avgdl == sum(len(tokens) for tokens in CORPUS) / len(CORPUS)
@@ -0,0 +1,76 @@
+import json
+import asyncio
+
+from app.services.ai_service import LEGAL_ERROR_MESSAGE
+from app.services.bulk_generation import BulkGenerator, completed_ids, read_questions
+
+class SesionFalsa:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class BusquedaFalsa:
+    def search_documents(self, db, search_query):
+        if "sin documentos" in search_query.query:
+            return []
+        return [{"document_id": 1, "title": "CST Artículo 186", "relevance_score": 9.0}]
+
+class IAFalsa:
+    def __init__(self, fallar=()):
+        self.fallar = set(fallar)
+        self.activas = 0
+        self.max_activas = 0
+
+    async def agenerate_legal_response(self, query_text, search_results, user_id=None):
+        self.activas += 1
+        self.max_activas = max(self.max_activas, self.activas)
+        await asyncio.sleep(0.01)
+        self.activas -= 1
+        if query_text in self.fallar:
+            return LEGAL_ERROR_MESSAGE, 0.0, [], True
+        return f"Respuesta: {query_text}", 0.9, [{"id": 1}], False
+
+def generador(ia):
+    return BulkGenerator(BusquedaFalsa(), ia, concurrency=3, retrieval_batch_size=4, session_factory=SesionFalsa)
+
+def test_lee_preguntas_de_txt_csv_y_jsonl(tmp_path):
+    (tmp_path / "p.txt").write_text("¿Qué es la prima?\n\n¿Cuántos días de vacaciones?\n", encoding="utf-8")
+    (tmp_path / "p.csv").write_text("id,pregunta\nA1,¿Qué es la prima?\nA2,\"¿Vacaciones, cuántas?\"\n", encoding="utf-8")
+    (tmp_path / "p.jsonl").write_text('{"id": 7, "question": "¿Qué es la prima?"}\n', encoding="utf-8")
+
+    assert [q["id"] for q in read_questions(str(tmp_path / "p.txt"))] == ["1", "3"]
+    assert read_questions(str(tmp_path / "p.csv"))[1] == {"id": "A2", "question": "¿Vacaciones, cuántas?"}
+    assert read_questions(str(tmp_path / "p.jsonl")) == [{"id": "7", "question": "¿Qué es la prima?"}]
+
+def test_concurrencia_acotada_y_reanudacion(tmp_path):
+    output = str(tmp_path / "salida.jsonl")
+    preguntas = [{"id": str(i), "question": f"pregunta {i}"} for i in range(10)]
+    preguntas.append({"id": "10", "question": "pregunta sin documentos"})
+
+    ia = IAFalsa(fallar={"pregunta 4"})
+    resumen = asyncio.run(generador(ia).run(preguntas, output))
+    assert resumen["written"] == 10 and resumen["failed"] == 1
+    assert ia.max_activas == 3
+    assert "4" not in completed_ids(output)
+
+    # Proceso interrumpido a mitad de una línea: se descarta y se reintentan las faltantes
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "4", "quest')
+    resumen = asyncio.run(generador(IAFalsa()).run(preguntas, output))
+    assert resumen["skipped"] == 10 and resumen["written"] == 1
+
+    registros = [json.loads(line) for line in open(output, encoding="utf-8")]
+    assert sorted(r["id"] for r in registros) == sorted(q["id"] for q in preguntas)
+    assert next(r for r in registros if r["id"] == "10")["needs_human_review"]
+
+def test_pregunta_invalida_no_afecta_al_lote(tmp_path):
+    output = str(tmp_path / "salida.jsonl")
+    # "¿?" no cumple la longitud mínima de SearchQuery
+    preguntas = [{"id": "1", "question": "pregunta 1"}, {"id": "2", "question": "¿?"},
+                 {"id": "3", "question": "pregunta 3"}]
+
+    resumen = asyncio.run(generador(IAFalsa()).run(preguntas, output))
+    assert resumen["written"] == 2 and resumen["failed"] == 1
+    assert completed_ids(output) == {"1", "3"}
@@ -0,0 +1,70 @@
+import json
+
+from app.services.context_packer import MAX_PASSAGE_TOKENS, count_tokens, pack_documents, split_passages
+
+CONSULTA = "¿Cómo se calcula la indemnización por despido sin justa causa?"
+
+DOCUMENTOS = [
+    {
+        "score": 8.0,
+        "content": "El trabajador tiene derecho a vacaciones remuneradas de quince días hábiles. "
+                   "La indemnización por despido sin justa causa depende del tiempo de servicio. "
+                   "Las cesantías se consignan cada año en el fondo elegido por el trabajador."
+    },
+    {"score": 2.0, "content": "Las dotaciones de calzado y vestido se entregan tres veces al año."},
+]
+
+def render(selection):
+    return json.dumps(
+        {"consulta": CONSULTA, "documentos": [{"id": f"[Doc{i + 1}]", "contenido": c} for i, c in selection]},
+        ensure_ascii=False
+    )
+
+def test_respeta_presupuesto_y_prioriza_pasajes_relevantes():
+    relevante = "La indemnización por despido sin justa causa depende del tiempo de servicio."
+    budget = count_tokens(render([(0, relevante)])) + 5
+    packed = pack_documents(CONSULTA, DOCUMENTOS, budget, render)
+
+    assert count_tokens(render(packed)) <= budget
+    assert packed == [(0, relevante)]
+    json.loads(render(packed))
+
+def test_presupuesto_amplio_incluye_todo_en_orden():
+    packed = pack_documents(CONSULTA, DOCUMENTOS, 2000, render)
+
+    assert [index for index, _ in packed] == [0, 1]
+    assert packed[0][1] == DOCUMENTOS[0]["content"]
+
+def test_presupuesto_insuficiente_no_incluye_documentos():
+    assert pack_documents(CONSULTA, DOCUMENTOS, count_tokens(render([])), render) == []
+
+def test_el_bucle_de_eventos_no_carga_codificaciones():
+    import asyncio
+    from app.services import context_packer
+
+    context_packer._encoders.pop("modelo-sin-cargar", None)
+
+    async def contar():
+        return count_tokens("Indemnización por despido", "modelo-sin-cargar")
+
+    # Sin cargar la codificación se usa la aproximación y no se registra nada
+    assert asyncio.run(contar()) == context_packer._approximate_tokens("Indemnización por despido")
+    assert "modelo-sin-cargar" not in context_packer._encoders
+
+    # Fuera del bucle (al arrancar, en un hilo) sí se carga
+    assert list(context_packer.load_encoders(["modelo-sin-cargar"])) == ["modelo-sin-cargar"]
+    assert "modelo-sin-cargar" in context_packer._encoders
+
+def test_oracion_larga_se_cuenta_una_vez_por_palabra():
+    llamadas = []
+    def contador(texto):
+        llamadas.append(texto)
+        return len(texto.split())
+
+    oracion = " ".join(f"palabra{i}" for i in range(1000))
+    pasajes = split_passages(oracion, contador)
+
+    assert [len(p.split()) for p in pasajes] == [MAX_PASSAGE_TOKENS] * 8 + [40]
+    assert " ".join(pasajes) == oracion
+    # La oración completa se cuenta una vez y después cada palabra una vez
+    assert len(llamadas) == 1 + 1000
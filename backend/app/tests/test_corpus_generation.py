@@ -0,0 +1,44 @@
+from datetime import date
+
+from sqlalchemy import create_engine, delete, text, update
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.models.corpus_generation import get_corpus_generation, local_generation
+from app.models.legal_document import LegalDocument
+
+def sesiones(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'corpus.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+def test_escrituras_masivas_y_sql_textual_incrementan_la_generacion(tmp_path):
+    Session = sesiones(tmp_path)
+    db = Session()
+    db.add(LegalDocument(title="Artículo 64", document_type="codigo", reference_number="64",
+                         issue_date=date(1950, 8, 5), source="CST", content="Indemnización"))
+    db.commit()
+    generacion = get_corpus_generation(db)
+    assert generacion >= 1
+
+    escrituras = [
+        lambda: db.query(LegalDocument).filter(LegalDocument.id == 1).update({"title": "Art. 64"}),
+        lambda: db.execute(update(LegalDocument).values(category="laboral")),
+        lambda: db.execute(text("UPDATE legal_documents SET subcategory = 'despido'")),
+        lambda: db.execute(delete(LegalDocument).where(LegalDocument.id == 1)),
+    ]
+    for escribir in escrituras:
+        local = local_generation()
+        escribir()
+        db.commit()
+        assert get_corpus_generation(db) == generacion + 1
+        assert local_generation() == local + 1
+        generacion += 1
+
+    # Lecturas y escrituras revertidas no cambian la generación
+    db.execute(text("SELECT COUNT(*) FROM legal_documents"))
+    db.commit()
+    db.execute(text("DELETE FROM legal_documents"))
+    db.rollback()
+    assert get_corpus_generation(db) == generacion
+    db.close()
@@ -0,0 +1,23 @@
+from app.schemas.legal_document import SearchQuery
+from app.services.optimized_bm25_service import OptimizedBM25Service
+from app.tests.test_search_pagination import corpus
+
+def test_cache_de_documentos_limitado_por_tamano(tmp_path, monkeypatch):
+    db = corpus(tmp_path, monkeypatch)
+    consulta = SearchQuery(query="despido indemnización", limit=12)
+
+    sin_limite = OptimizedBM25Service(use_cache=False)
+    esperado = sin_limite.search_documents(db, consulta)
+    cache = sin_limite.index_status()["document_cache"]
+    assert cache["size"] == 12
+    # Cada oración se guarda una sola vez (sin la copia en minúsculas)
+    assert all(len(oracion) == 2 for entrada in sin_limite._document_cache.values() for oracion in entrada["sentences"])
+
+    # Con un tamaño máximo pequeño se expulsan los documentos menos recientes
+    limitado = OptimizedBM25Service(use_cache=False, document_cache_max_bytes=cache["approx_bytes"] // 3)
+    assert limitado.search_documents(db, consulta) == esperado
+    cache = limitado.index_status()["document_cache"]
+    assert 0 < cache["size"] < 12
+    assert cache["approx_bytes"] <= cache["max_bytes"]
+    assert cache["approx_bytes"] == sum(entrada["size"] for entrada in limitado._document_cache.values())
+    db.close()
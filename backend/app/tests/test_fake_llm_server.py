@@ -0,0 +1,58 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.scripts.fake_llm_server import FakeLLMSettings, app, fake_llm
+
+MENSAJES = [{"role": "system", "content": "Asistente legal"}, {"role": "user", "content": "¿Qué es el despido?"}]
+
+@pytest.fixture
+def fake_client():
+    fake_llm.configure(FakeLLMSettings(latency="fixed", latency_median=0.0, tokens_per_second=0, output_tokens=20))
+    return TestClient(app)
+
+def test_respuesta_determinista_con_uso(fake_client):
+    first = fake_client.post("/v1/chat/completions", json={"model": "m", "messages": MENSAJES}).json()
+    second = fake_client.post("/v1/chat/completions", json={"model": "m", "messages": MENSAJES}).json()
+
+    content = first["choices"][0]["message"]["content"]
+    assert content == second["choices"][0]["message"]["content"]
+    assert "[Doc1]" in content and content.endswith("CONFIANZA: 0.8")
+    assert first["usage"]["completion_tokens"] == 20
+
+def test_streaming_termina_con_done(fake_client):
+    response = fake_client.post("/v1/chat/completions", json={"model": "m", "messages": MENSAJES, "stream": True})
+
+    events = [line for line in response.text.splitlines() if line.startswith("data: ")]
+    assert len(events) > 2 and events[-1] == "data: [DONE]"
+
+def test_errores_inyectados(fake_client):
+    rate_limited = fake_client.post("/v1/chat/completions", json={"model": "m", "messages": MENSAJES},
+                                    headers={"x-fake-llm-error": "429"})
+    assert rate_limited.status_code == 429 and rate_limited.headers["retry-after"] == "1"
+
+    too_long = fake_client.post("/v1/chat/completions", json={"model": "m", "messages": MENSAJES, "max_tokens": 20000})
+    assert too_long.status_code == 400
+    assert "maximum context length" in too_long.json()["error"]["message"]
+
+def test_limite_por_minuto_del_servidor(fake_client):
+    fake_llm.configure(FakeLLMSettings(latency="fixed", latency_median=0.0, tokens_per_second=0, requests_per_minute=2))
+    statuses = [
+        fake_client.post("/v1/chat/completions", json={"model": "m", "messages": MENSAJES}).status_code
+        for _ in range(3)
+    ]
+
+    assert statuses == [200, 200, 429]
+    assert fake_client.get("/_stats").json()["429"] == 1
+
+def test_cache_de_prefijos(fake_client):
+    fake_llm.configure(FakeLLMSettings(latency="fixed", latency_median=0.0, tokens_per_second=0, prefix_cache_min_tokens=64))
+    documentos = "Artículo 64 del Código Sustantivo del Trabajo, indemnización por despido sin justa causa. " * 20
+
+    def uso(consulta):
+        mensajes = [{"role": "system", "content": "Asistente legal"}, {"role": "user", "content": documentos + consulta}]
+        return fake_client.post("/v1/chat/completions", json={"model": "m", "messages": mensajes}).json()["usage"]
+
+    assert uso("¿Cuánto me deben pagar?")["prompt_tokens_details"]["cached_tokens"] == 0
+    # Mismo prefijo con otra consulta al final: se reutilizan los bloques completos del prefijo
+    segundo = uso("¿Y si renuncié?")
+    assert 64 <= segundo["prompt_tokens_details"]["cached_tokens"] < segundo["prompt_tokens"]
@@ -0,0 +1,57 @@
+from app.core.llm_telemetry import LLMTelemetry
+
+def test_costo_con_tokens_en_cache_y_precio_por_prefijo():
+    telemetria = LLMTelemetry(prices={"modelo-x": (1.0, 2.0)})
+
+    assert telemetria.price_for("gpt-4o-mini-2024-07-18") == (0.15, 0.60)
+    assert telemetria.price_for("modelo-desconocido") == (0.0, 0.0)
+    # 1M de entrada (la mitad en caché, a mitad de precio) y 1M de salida
+    assert telemetria.estimate_cost("modelo-x", 1_000_000, 1_000_000, cached_tokens=500_000) == 0.5 + 0.25 + 2.0
+
+def test_agregados_por_modelo_usuario_y_nivel():
+    telemetria = LLMTelemetry(prices={"modelo-x": (1.0, 2.0)}, max_users=2)
+    telemetria.record_call("modelo-x", "response", "1", latency=0.5, prompt_tokens=1000, completion_tokens=100, attempts=2)
+    telemetria.record_call("modelo-x", "legal", "2", latency=1.5, prompt_tokens=3000, completion_tokens=300, cached_tokens=1000)
+    telemetria.record_call("modelo-x", "legal", "3", attempts=3, outcome="error")
+    telemetria.record_cache_hit("response_cache")
+    telemetria.record_cache_hit("extractive")
+
+    snapshot = telemetria.snapshot()
+    totales = snapshot["totals"]
+    assert (totales["calls"], totales["errors"], totales["retries"]) == (3, 1, 3)
+    assert totales["prompt_tokens"] == 4000 and totales["cached_tokens"] == 1000
+    assert totales["avg_latency_seconds"] == 1.0
+    assert snapshot["by_model"]["modelo-x"]["p95_latency_seconds"] == 1.5
+    assert snapshot["by_operation"]["legal"]["calls"] == 2
+    # Usuarios acotados: el tercero se agrupa en "otros"
+    assert set(snapshot["top_users"]) == {"1", "2", "otros"}
+    assert next(iter(snapshot["top_users"])) == "2"
+    assert snapshot["answered_by"] == {"llm": 2, "response_cache": 1, "extractive": 1}
+    assert snapshot["llm_avoided_rate"] == 0.5
+    assert snapshot["by_minute"][-1]["calls"] == 3
+
+    metricas = telemetria.render_prometheus()
+    assert 'llm_requests_total{model="modelo-x",outcome="error"} 1' in metricas
+    assert 'llm_tokens_total{model="modelo-x",type="cached"} 1000' in metricas
+    assert 'llm_latency_seconds_count{model="modelo-x"} 2' in metricas
+    assert 'llm_answers_total{tier="extractive"} 1' in metricas
+    assert "user" not in metricas
+
+def test_metricas_requieren_token_y_healthz_solo_muestra_el_circuito(monkeypatch):
+    import config
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    monkeypatch.setattr(config, "METRICS_TOKEN", "")
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(config, "METRICS_TOKEN", "secreto")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer otro"}).status_code == 401
+    respuesta = client.get("/metrics", headers={"Authorization": "Bearer secreto"})
+    assert respuesta.status_code == 200 and "llm_requests_total" in respuesta.text
+    assert "llm_circuit_open 0" in respuesta.text
+
+    # /healthz sólo expone el estado del circuito, no las métricas internas
+    assert client.get("/healthz").json()["llm"] == {"circuit_state": "closed"}
@@ -0,0 +1,63 @@
+from app.services.model_router import ModelRouter, score_entropy
+
+CONSULTA_COMPLEJA = (
+    "Trabajé tres años con contrato de prestación de servicios, cumplía horario y tenía jefe; "
+    "me despidieron sin justa causa y no me pagaron cesantías, prima ni vacaciones. "
+    "¿Puedo reclamar el contrato realidad y la indemnización al mismo tiempo?"
+)
+
+def documentos(*puntuaciones):
+    return [{"document_id": i, "relevance_score": p} for i, p in enumerate(puntuaciones)]
+
+def enrutador():
+    return ModelRouter("modelo-base", simple_model="modelo-rapido", complex_model="modelo-grande")
+
+def test_entropia_de_puntuaciones():
+    assert score_entropy(documentos(10.0)) == 0.0
+    assert round(score_entropy(documentos(5.0, 5.0, 5.0)), 3) == 1.0
+    assert score_entropy(documentos(9.0, 0.5, 0.5)) < 0.5
+
+def test_consulta_simple_y_compleja():
+    router = enrutador()
+
+    simple = router.route("¿Qué es el salario mínimo?", documentos(9.0, 1.0), max_tokens=150)
+    assert (simple["tier"], simple["model"], simple["max_tokens"]) == ("simple", "modelo-rapido", 105)
+
+    compleja = router.route(CONSULTA_COMPLEJA, documentos(6.0, 5.8, 5.5, 5.0, 4.9), max_tokens=150)
+    assert (compleja["tier"], compleja["model"], compleja["max_tokens"]) == ("complex", "modelo-grande", 225)
+    assert compleja["features"]["flow"] in ("contrato_realidad", "indemnizacion")
+
+def test_registra_resultados_por_nivel():
+    router = enrutador()
+    route = router.route("¿Qué es el salario mínimo?", documentos(9.0), max_tokens=10)
+    router.record_outcome(route, 0.4, "palabra " * 20, None, 0.9, False)
+    router.record_outcome(route, 0.6, None, "Error inesperado", 0.0, True)
+
+    tier = router.stats()["tiers"]["simple"]
+    assert (tier["requests"], tier["errors"], tier["budget_hits"], tier["reviews"]) == (2, 1, 1, 1)
+    assert tier["avg_latency_seconds"] == 0.5
+    assert router.recent(1)[0]["error"] is True
+
+def test_desactivado_respeta_modelo_y_tokens():
+    router = ModelRouter("modelo-base", simple_model="modelo-rapido", enabled=False)
+    route = router.route("¿Qué es el salario mínimo?", documentos(9.0), max_tokens=150)
+    assert (route["model"], route["max_tokens"]) == ("modelo-base", 150)
+
+def test_configuracion_por_defecto_conserva_el_presupuesto_del_flujo():
+    # Sin modelos propios por nivel, ningún nivel recorta ni amplía el presupuesto
+    router = ModelRouter("modelo-base")
+    simple = router.route("¿Qué es el salario mínimo?", documentos(9.0, 1.0), max_tokens=150)
+    assert (simple["tier"], simple["model"], simple["max_tokens"]) == ("simple", "modelo-base", 150)
+
+    compleja = router.route(CONSULTA_COMPLEJA, documentos(6.0, 5.8, 5.5, 5.0, 4.9), max_tokens=150)
+    assert (compleja["tier"], compleja["model"], compleja["max_tokens"]) == ("complex", "modelo-base", 150)
+
+def test_flujo_se_evalua_una_vez_por_consulta(monkeypatch):
+    router = ModelRouter("modelo-base")
+    llamadas = []
+    original = router.onboarding.analizar_necesidad
+    monkeypatch.setattr(router.onboarding, "analizar_necesidad", lambda texto: llamadas.append(texto) or original(texto))
+
+    for _ in range(3):
+        router.route(CONSULTA_COMPLEJA, documentos(6.0, 5.8), max_tokens=150)
+    assert llamadas == [CONSULTA_COMPLEJA]
@@ -0,0 +1,19 @@
+from app.scripts.precompute_answers import cluster_questions
+
+def test_agrupa_parafrasis_pero_no_preguntas_de_polaridad_distinta():
+    grupos = cluster_questions([
+        ("cuanto me pagan si me despiden sin justa causa", 10),
+        ("¿Cuánto me deben pagar si me despiden sin justa causa?", 4),
+        ("cuanto me pagan si me despiden con justa causa", 3),
+        ("el empleador no puede despedir a una embarazada", 2),
+        ("el empleador puede despedir a una embarazada", 1),
+    ], threshold=0.5)
+
+    variantes = [sorted(grupo["variants"]) for grupo in grupos]
+    assert variantes[0] == sorted([
+        "cuanto me pagan si me despiden sin justa causa",
+        "¿Cuánto me deben pagar si me despiden sin justa causa?"
+    ])
+    assert grupos[0]["hits"] == 14
+    # Cada pregunta con otra polaridad queda en su propio grupo
+    assert len(grupos) == 4
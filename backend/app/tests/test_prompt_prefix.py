@@ -0,0 +1,31 @@
+from app.services.ai_service import AIService, LEGAL_SYSTEM_PROMPT, RESPONSE_SYSTEM_PROMPT
+
+DOCUMENTOS = [
+    {"document_id": 1, "title": "Código Sustantivo del Trabajo", "document_type": "codigo", "reference_number": "64",
+     "content": "En caso de terminación unilateral del contrato sin justa causa, el empleador deberá pagar una indemnización.",
+     "relevance_score": 8.0},
+    {"document_id": 2, "title": "Código Sustantivo del Trabajo", "document_type": "codigo", "reference_number": "186",
+     "content": "Los trabajadores que hubieren prestado sus servicios durante un año tienen derecho a quince días hábiles de vacaciones.",
+     "relevance_score": 4.0},
+]
+
+def test_prompts_sin_indentacion_y_consulta_al_final():
+    ai = AIService()
+    for consulta in ("¿Cuánto es la indemnización por despido?", "¿Me deben pagar indemnización si me despiden?"):
+        system_prompt, user_prompt = ai._build_response_prompts(consulta, DOCUMENTOS)
+        assert system_prompt == RESPONSE_SYSTEM_PROMPT
+        assert user_prompt.endswith(f"CONSULTA: {consulta}")
+        assert not any(line.startswith(" ") or line.endswith(" ") for line in system_prompt.splitlines())
+
+def test_prefijo_legal_estable_entre_llamadas():
+    ai = AIService()
+    consulta = "¿Cuánto es la indemnización por despido sin justa causa?"
+    primero = ai._build_legal_prompts(consulta, DOCUMENTOS, 5, None)
+    segundo = ai._build_legal_prompts(consulta, DOCUMENTOS, 5, None)
+
+    assert primero[0] == segundo[0] == LEGAL_SYSTEM_PROMPT
+    # Sólo la fecha, en la última línea, puede cambiar entre llamadas
+    prefijo = primero[1].rsplit("\n", 1)[0]
+    assert segundo[1].startswith(prefijo)
+    assert primero[1].index("## DOCUMENTOS LEGALES") < primero[1].index("## CONSULTA LEGAL")
+    assert primero[1].splitlines()[-1].startswith("Fecha de la consulta: ")
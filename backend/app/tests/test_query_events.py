@@ -0,0 +1,96 @@
+import json
+import asyncio
+
+from app.services.query_events import QueryEventPublisher, query_events_channel
+from app.services.query_queue import QueryJobQueue
+from app.services.query_worker import QueryWorkerPool
+from app.websocket.main import ConnectionManager
+
+class RedisFalso:
+    def __init__(self, fallar=False):
+        self.fallar = fallar
+        self.publicados = []
+
+    async def publish(self, channel, message):
+        if self.fallar:
+            raise ConnectionError("Redis no disponible")
+        self.publicados.append((channel, json.loads(message)))
+        return 1
+
+class WebSocketFalso:
+    def __init__(self):
+        self.enviados = []
+
+    async def send_text(self, message):
+        self.enviados.append(json.loads(message))
+
+def test_publica_en_el_canal_del_usuario():
+    events = QueryEventPublisher("redis://localhost:6379")
+    events._redis = RedisFalso()
+
+    assert asyncio.run(events.publish("u1", {"query_id": "q1", "status": "completed"}))
+    assert not asyncio.run(events.publish(None, {"query_id": "q2"}))
+    assert events._redis.publicados == [
+        ("query_events:u1", {"user_id": "u1", "message": {"query_id": "q1", "status": "completed"}})
+    ]
+
+def test_redis_caido_no_interrumpe_y_espera_antes_de_reintentar():
+    events = QueryEventPublisher("redis://localhost:6379")
+    events._redis = RedisFalso(fallar=True)
+
+    assert not asyncio.run(events.publish("u1", {"query_id": "q1"}))
+    assert not asyncio.run(events.publish("u1", {"query_id": "q2"}))
+    assert events.stats()["errors"] == 1 and events.stats()["dropped"] == 1
+
+def test_pool_avisa_solo_estados_finales():
+    events = QueryEventPublisher("redis://localhost:6379")
+    events._redis = RedisFalso()
+    pool = QueryWorkerPool(QueryJobQueue(), session_factory=lambda: None, events=events)
+    job = {"id": "q1", "user_id": "u1"}
+
+    asyncio.run(pool._on_finished(job, "pending"))
+    asyncio.run(pool._on_finished(job, "completed", {"response_text": "Quince días.", "sources": []}))
+
+    [(channel, data)] = events._redis.publicados
+    assert channel == query_events_channel("u1")
+    assert data["message"]["type"] == "query_completed" and data["message"]["response_text"] == "Quince días."
+
+def test_evento_llega_a_las_conexiones_del_usuario():
+    manager = ConnectionManager()
+    propio, ajeno = WebSocketFalso(), WebSocketFalso()
+    manager.user_connections = {"u1": [propio], "u2": [ajeno]}
+
+    asyncio.run(manager.send_to_user(json.dumps({"query_id": "q1"}), "u1"))
+    assert propio.enviados == [{"query_id": "q1"}] and ajeno.enviados == []
+
+def test_websocket_de_consultas_requiere_token_y_usa_el_usuario_del_token(tmp_path, monkeypatch):
+    import pytest
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from starlette.websockets import WebSocketDisconnect
+    from app.db.base import Base
+    from app.models.usuario import Usuario
+    from app.services.auth_service import AuthService
+    from app.websocket import main as websocket_main
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'usuarios.db'}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    usuario = Usuario(nombre="Ana", email="ana@example.com", password_hash="x", activo=True)
+    db.add(usuario)
+    db.commit()
+    monkeypatch.setattr(websocket_main, "SessionLocal", Session)
+    client = TestClient(websocket_main.app)
+
+    for url in ("/ws/queries", "/ws/queries?token=no-es-un-jwt"):
+        with pytest.raises(WebSocketDisconnect) as error:
+            with client.websocket_connect(url) as websocket:
+                websocket.receive_text()
+        assert error.value.code == 1008
+
+    token = AuthService.create_access_token({"sub": str(usuario.id)})
+    with client.websocket_connect(f"/ws/queries?token={token}"):
+        assert list(websocket_main.manager.user_connections) == [str(usuario.id)]
+    db.close()
@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.query_job import QueryJob
+from app.services.query_queue import QueryJobQueue, TransientQueryError
+from app.services.query_worker import QueryWorkerPool
+
+RESULTADO = {
+    "response_text": "Son quince días hábiles.",
+    "sources": [{"id": 1, "title": "CST Artículo 186"}],
+    "confidence_score": 0.9,
+    "needs_human_review": False,
+    "review_reason": None
+}
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    return sessionmaker(bind=engine)
+
+def test_reserva_y_completa_una_consulta(session_factory):
+    queue = QueryJobQueue()
+    db = session_factory()
+    job = queue.enqueue(db, "¿Cuántos días de vacaciones tengo?", user_id="u1")
+
+    leased = queue.lease(db, "w1")
+    assert leased.id == job.id and leased.status == "processing" and leased.attempts == 1
+    assert queue.lease(db, "w2") is None
+
+    assert not queue.complete(db, job.id, "w2", RESULTADO)
+    assert queue.complete(db, job.id, "w1", RESULTADO)
+    job = queue.get(db, job.id)
+    db.refresh(job)
+    assert job.status == "completed" and job.lease_owner is None
+
+def test_arriendo_vencido_se_recupera(session_factory):
+    queue = QueryJobQueue(max_attempts=2)
+    db = session_factory()
+    job = queue.enqueue(db, "¿Qué es la prima de servicios?")
+    queue.lease(db, "w1")
+
+    # El worker murió: su arriendo vence y otro worker toma la consulta
+    db.query(QueryJob).update({"lease_expires_at": datetime.now() - timedelta(seconds=1)})
+    db.commit()
+    assert queue.lease(db, "w2").lease_owner == "w2"
+    assert not queue.extend(db, job.id, "w1")
+
+    # Sin intentos restantes la consulta abandonada queda con error
+    db.query(QueryJob).update({"lease_expires_at": datetime.now() - timedelta(seconds=1)})
+    db.commit()
+    assert queue.lease(db, "w3") is None
+    db.refresh(job)
+    assert job.status == "error" and job.needs_human_review
+
+def test_falla_reintenta_y_luego_guarda_resultado_degradado(session_factory):
+    queue = QueryJobQueue(max_attempts=2, retry_delay=0)
+    db = session_factory()
+    job = queue.enqueue(db, "¿Cuánto es la indemnización?")
+
+    queue.lease(db, "w1")
+    assert queue.fail(db, job.id, "w1", RuntimeError("timeout")) == "pending"
+    queue.lease(db, "w1")
+    degradado = dict(RESULTADO, needs_human_review=True, review_reason="Sin cupo")
+    assert queue.fail(db, job.id, "w1", TransientQueryError("Sin cupo", degradado)) == "needs_human"
+    db.refresh(job)
+    assert job.attempts == 2 and job.review_reason == "Sin cupo"
+
+def test_pool_procesa_la_cola(tmp_path):
+    # Base en archivo: cada worker usa su propia conexión
+    engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}", connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(bind=engine)
+
+    async def processor(db, query_text, user_id):
+        return dict(RESULTADO, response_text=query_text.upper())
+
+    async def run():
+        queue = QueryJobQueue()
+        db = session_factory()
+        ids = [queue.enqueue(db, f"consulta {i}").id for i in range(5)]
+        pool = QueryWorkerPool(queue, concurrency=2, poll_interval=0.01,
+                               session_factory=session_factory, processor=processor)
+        await pool.start()
+        for _ in range(200):
+            if pool.stats()["processed"] == len(ids):
+                break
+            await asyncio.sleep(0.01)
+        await pool.stop()
+        return db, ids, pool.stats()
+
+    db, ids, stats = asyncio.run(run())
+    assert stats["processed"] == 5 and stats["busy"] == 0
+    assert {job.response_text for job in db.query(QueryJob).all()} == {f"CONSULTA {i}" for i in range(5)}
+
+def test_crear_consulta_usa_el_usuario_del_token_y_no_el_del_cuerpo(session_factory):
+    from fastapi.testclient import TestClient
+    from app.db import database, session as db_session
+    from app.db.base import Base
+    from app.main import app
+    from app.models.usuario import Usuario
+    from app.services.auth_service import AuthService
+
+    db = session_factory()
+    Base.metadata.create_all(bind=db.get_bind())
+    usuario = Usuario(nombre="Ana", email="ana@example.com", password_hash="x", activo=True)
+    db.add(usuario)
+    db.commit()
+
+    def override_get_db():
+        yield db
+
+    app.dependency_overrides[database.get_db] = override_get_db
+    app.dependency_overrides[db_session.get_db] = override_get_db
+    try:
+        client = TestClient(app)
+        anonima = client.post("/api/v1/queries/", json={"query_text": "¿Cuántos días de vacaciones?", "user_id": "999"})
+        assert anonima.status_code == 200
+        assert db.get(QueryJob, anonima.json()["query_id"]).user_id is None
+
+        token = AuthService.create_access_token({"sub": str(usuario.id)})
+        autenticada = client.post("/api/v1/queries/", json={"query_text": "¿Cuántos días de vacaciones?", "user_id": "999"},
+                                  headers={"Authorization": f"Bearer {token}"})
+        assert db.get(QueryJob, autenticada.json()["query_id"]).user_id == str(usuario.id)
+
+        invalida = client.post("/api/v1/queries/", json={"query_text": "¿Cuántos días de vacaciones?"},
+                               headers={"Authorization": "Bearer no-es-un-jwt"})
+        assert invalida.status_code == 401
+    finally:
+        app.dependency_overrides.pop(database.get_db, None)
+        app.dependency_overrides.pop(db_session.get_db, None)
+        db.close()
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app.core.rate_limiter import LLMRateLimiter, RateLimitTimeout, parse_reset
+
+def test_turno_rotativo_entre_usuarios():
+    limiter = LLMRateLimiter(requests_per_minute=1200, tokens_per_minute=10**6)
+    # La API indica que no queda cupo: las solicitudes deben hacer cola
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "0"})
+    order = []
+
+    async def request(user_id, name):
+        await limiter.aacquire(user_id, 10)
+        order.append(name)
+
+    async def main():
+        await asyncio.gather(
+            request("ana", "ana-1"), request("ana", "ana-2"), request("ana", "ana-3"), request("luis", "luis-1")
+        )
+
+    asyncio.run(main())
+    assert order == ["ana-1", "luis-1", "ana-2", "ana-3"]
+    assert limiter.stats()["granted"] == 4
+
+def test_429_pausa_solicitudes_hasta_agotar_espera():
+    limiter = LLMRateLimiter(requests_per_minute=100, tokens_per_minute=10**6, max_wait=0.2)
+    limiter.penalize(5)
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("ana", 10)
+    stats = limiter.stats()
+    assert stats["throttled"] == 1 and stats["timeouts"] == 1 and stats["queued"] == 0
+
+def test_adopta_limites_de_las_cabeceras():
+    limiter = LLMRateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "3500", "x-ratelimit-limit-tokens": "90000"})
+
+    stats = limiter.stats()
+    assert stats["requests_per_minute"] == 3500 and stats["tokens_per_minute"] == 90000
+    assert parse_reset("6m0s") == 360 and parse_reset("20ms") == 0.02 and parse_reset("1.5s") == 1.5
+
+def test_estado_compartido_entre_procesos(tmp_path):
+    state_file = str(tmp_path / "llm_rate_limit.json")
+    worker_1 = LLMRateLimiter(requests_per_minute=2, tokens_per_minute=10**6, max_wait=0.1, state_path=state_file)
+    worker_2 = LLMRateLimiter(requests_per_minute=2, tokens_per_minute=10**6, max_wait=0.1, state_path=state_file)
+
+    worker_1.acquire("ana", 10)
+    worker_2.acquire("luis", 10)
+    # El cupo del minuto ya lo consumieron entre los dos
+    with pytest.raises(RateLimitTimeout):
+        worker_1.acquire("ana", 10)
+
+def test_sondeo_asincrono_no_bloquea_el_bucle_con_el_archivo_bloqueado(tmp_path):
+    import fcntl
+    import threading
+
+    state_file = str(tmp_path / "llm_rate_limit.json")
+    limiter = LLMRateLimiter(requests_per_minute=100, tokens_per_minute=10**6, state_path=state_file)
+
+    # Otro proceso tiene el archivo bloqueado durante 0.3 segundos
+    otro_proceso = open(state_file, "a+")
+    fcntl.flock(otro_proceso, fcntl.LOCK_EX)
+    threading.Timer(0.3, lambda: fcntl.flock(otro_proceso, fcntl.LOCK_UN)).start()
+    ticks = []
+
+    async def reloj():
+        while True:
+            ticks.append(True)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        tarea = asyncio.create_task(reloj())
+        await limiter.aacquire("ana", 10)
+        tarea.cancel()
+
+    asyncio.run(main())
+    otro_proceso.close()
+    assert len(ticks) >= 10
+    assert limiter.stats()["granted"] == 1
@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import time
+
+from app.core.resilience import CircuitBreaker, RequestHedger
+
+def test_circuito_se_abre_y_se_recupera_con_una_prueba():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.1)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.15)
+    # Semiabierto: una sola solicitud de prueba
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+
+    stats = breaker.stats()
+    assert stats["state"] == CircuitBreaker.CLOSED
+    assert stats["trips"] == 1 and stats["rejected"] == 2
+
+def test_prueba_fallida_vuelve_a_abrir_el_circuito():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.1)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+def _hedger_con_historial():
+    hedger = RequestHedger(min_delay=0.05, min_samples=5)
+    for _ in range(5):
+        hedger.record(0.01)
+    return hedger
+
+def test_respaldo_responde_cuando_la_primera_solicitud_se_demora():
+    hedger = _hedger_con_historial()
+    calls = itertools.count()
+
+    def request():
+        if next(calls) == 0:
+            time.sleep(1)
+            return "lenta"
+        return "respaldo"
+
+    start = time.time()
+    assert hedger.run(request) == "respaldo"
+    assert time.time() - start < 0.5
+    assert hedger.stats()["hedge_wins"] == 1
+
+def test_respaldo_asincrono_cancela_la_solicitud_perdedora():
+    hedger = _hedger_con_historial()
+    calls = itertools.count()
+    cancelled = []
+
+    async def request():
+        if next(calls) == 0:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "lenta"
+        return "respaldo"
+
+    async def main():
+        result = await hedger.arun(request)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == "respaldo"
+    assert cancelled == [True]
+    assert hedger.stats()["hedged"] == 1
+
+def test_cupo_del_respaldo_no_cuenta_como_latencia():
+    hedger = _hedger_con_historial()
+    calls = itertools.count()
+    cupos = []
+
+    def acquire():
+        cupos.append(True)
+        time.sleep(0.2)
+
+    def request():
+        if next(calls) == 0:
+            time.sleep(1)
+            return "lenta"
+        return "respaldo"
+
+    assert hedger.run(request, hedge_acquire=acquire) == "respaldo"
+    assert cupos == [True]
+    # La latencia registrada del respaldo es la de la solicitud, sin la espera por cupo
+    assert hedger._latencies[-1] < 0.1
@@ -0,0 +1,64 @@
+import time
+import sqlite3
+
+from app.services.response_cache import ResponseCache
+
+def _cache(tmp_path, **kwargs):
+    return ResponseCache(db_path=str(tmp_path / "ai_responses.db"), **kwargs)
+
+def test_fallo_no_se_cachea(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.get("abc") is None
+
+    # Otro worker guarda la respuesta después del fallo
+    _cache(tmp_path).set("abc", {"response": "ok"})
+    assert cache.get("abc") == {"response": "ok"}
+
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["disk_hits"] == 1
+    assert cache.get("abc") == {"response": "ok"}
+    assert cache.stats()["memory_hits"] == 1
+
+def test_respuestas_expiradas(tmp_path):
+    cache = _cache(tmp_path, ttl_seconds=0.05)
+    cache.set("abc", {"response": "ok"})
+    time.sleep(0.1)
+    assert cache.get("abc") is None
+    assert cache.evict() == 1
+
+def test_expulsion_por_tamano(tmp_path):
+    cache = _cache(tmp_path, memory_size=2, max_entries=3)
+    for i in range(5):
+        cache.set(f"q{i}", {"response": i})
+    cache.get("q0")  # q0 es la más usada recientemente
+
+    assert cache.evict() == 2
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.stats()["disk_entries"] == 3
+    assert cache.get("q1") is None
+    assert cache.get("q0") == {"response": 0}
+
+def test_lectura_no_escribe_en_disco(tmp_path):
+    _cache(tmp_path).set("abc", {"response": "ok"})
+    db = sqlite3.connect(str(tmp_path / "ai_responses.db"))
+    def accessed_at():
+        return db.execute("SELECT accessed_at FROM ai_response_cache WHERE query_hash = 'abc'").fetchone()[0]
+    before = accessed_at()
+
+    cache = _cache(tmp_path)
+    time.sleep(0.01)
+    assert cache.get("abc") == {"response": "ok"}
+    assert accessed_at() == before
+
+    # El acceso acumulado se escribe con la siguiente depuración
+    cache.evict()
+    assert accessed_at() > before
+
+def test_base_de_datos_se_crea_en_el_primer_uso(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "cache" / "ai_responses.db"))
+    assert not (tmp_path / "cache").exists()
+
+    cache.set("abc", {"response": "ok"})
+    assert (tmp_path / "cache" / "ai_responses.db").exists()
+    assert _cache(tmp_path / "cache").get("abc") == {"response": "ok"}
@@ -0,0 +1,64 @@
+from collections import Counter
+
+from app.schemas.legal_document import SearchQuery
+from app.services.optimized_bm25_service import OptimizedBM25Service
+from app.tests.test_search_pagination import corpus
+
+# Atributos de los documentos 1-12 de corpus(), los que contienen los términos de la consulta
+def tipo(numero):
+    return "ley" if numero % 2 else "sentencia"
+
+def categoria(numero):
+    return "laboral" if numero % 3 else "civil"
+
+def anio(numero):
+    return str(2010 + numero % 3)
+
+def conteos(numeros, campo):
+    return dict(Counter(campo(numero) for numero in numeros))
+
+def test_facetas_sin_filtros(tmp_path, monkeypatch):
+    db = corpus(tmp_path, monkeypatch)
+    servicio = OptimizedBM25Service(use_cache=False)
+    respuesta = servicio.search_documents_with_facets(db, SearchQuery(query="despido indemnización"))
+    numeros = range(1, 13)
+
+    assert respuesta["facets"]["document_type"] == conteos(numeros, tipo)
+    assert respuesta["facets"]["category"] == conteos(numeros, categoria)
+    assert respuesta["facets"]["year"] == conteos(numeros, anio)
+    assert respuesta["facets"]["subcategory"] == {"despido": 12}
+    # Los documentos sin coincidencias (decretos) no aparecen en las facetas
+    assert "decreto" not in respuesta["facets"]["document_type"]
+    db.close()
+
+def test_facetas_con_filtros_excluyen_su_propio_filtro(tmp_path, monkeypatch):
+    db = corpus(tmp_path, monkeypatch)
+    servicio = OptimizedBM25Service(use_cache=False)
+    respuesta = servicio.search_documents_with_facets(
+        db, SearchQuery(query="despido indemnización", category="laboral", document_type="ley", limit=100))
+    facetas = respuesta["facets"]
+
+    # Cada faceta aplica los filtros de las demás, pero no el suyo
+    leyes = [n for n in range(1, 13) if tipo(n) == "ley"]
+    laborales = [n for n in range(1, 13) if categoria(n) == "laboral"]
+    ambos = [n for n in leyes if n in laborales]
+    assert facetas["category"] == conteos(leyes, categoria)
+    assert facetas["document_type"] == conteos(laborales, tipo)
+    assert facetas["year"] == conteos(ambos, anio)
+
+    # Los resultados cumplen todos los filtros
+    assert sorted(resultado["document_id"] for resultado in respuesta["results"]) == ambos
+    db.close()
+
+def test_filtro_con_valor_inexistente(tmp_path, monkeypatch):
+    db = corpus(tmp_path, monkeypatch)
+    servicio = OptimizedBM25Service(use_cache=False)
+    respuesta = servicio.search_documents_with_facets(
+        db, SearchQuery(query="despido indemnización", category="penal"))
+
+    assert respuesta["results"] == []
+    assert respuesta["next_cursor"] is None
+    # La faceta de categoría sigue mostrando las alternativas
+    assert respuesta["facets"]["category"] == conteos(range(1, 13), categoria)
+    assert respuesta["facets"]["document_type"] == {}
+    db.close()
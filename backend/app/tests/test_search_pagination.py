@@ -0,0 +1,107 @@
+import pytest
+
+from app.services.optimized_bm25_service import (
+    encode_cursor,
+    decode_cursor,
+    InvalidCursorError
+)
+
+def test_cursor_roundtrip():
+    cursor = encode_cursor(7, "abc123", 2.631478, 178)
+
+    # El cursor es opaco y seguro para URLs
+    assert "=" not in cursor
+    assert "/" not in cursor and "+" not in cursor
+
+    state = decode_cursor(cursor)
+    assert state == {"g": 7, "q": "abc123", "s": 2.631478, "i": 178}
+
+def test_cursor_sin_generacion():
+    state = decode_cursor(encode_cursor(None, "abc123", 1.5, 3))
+    assert state["g"] is None
+
+def test_cursor_invalido():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("no-es-un-cursor")
+
+def corpus(tmp_path, monkeypatch):
+    """Sesión sobre una base de datos con documentos de prueba (el caché BM25 queda en tmp_path)"""
+    from datetime import date
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.db.base import Base
+    from app.models.legal_document import LegalDocument
+
+    monkeypatch.chdir(tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path / 'corpus.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    for numero in range(1, 13):
+        # Contenidos repetidos para forzar empates de puntuación
+        repeticiones = numero % 4 + 1
+        db.add(LegalDocument(
+            title=f"Documento {numero}", document_type="ley" if numero % 2 else "sentencia",
+            reference_number=str(numero), issue_date=date(2010 + numero % 3, 1, 1),
+            category="laboral" if numero % 3 else "civil", subcategory="despido",
+            content=" ".join(["El despido sin justa causa genera indemnización."] * repeticiones)
+        ))
+    for numero in range(13, 33):
+        # Documentos sin los términos de la consulta, para que su IDF sea positivo
+        db.add(LegalDocument(
+            title=f"Documento {numero}", document_type="decreto", reference_number=str(numero),
+            content="El contrato de arrendamiento de vivienda urbana se renueva automáticamente."
+        ))
+    db.commit()
+    return db
+
+def paginar(servicio, db, **filtros):
+    from app.schemas.legal_document import SearchQuery
+
+    ids, cursor = [], None
+    while True:
+        pagina = servicio.search_documents_with_facets(
+            db, SearchQuery(query="despido indemnización", limit=5, cursor=cursor, **filtros))
+        ids += [resultado["document_id"] for resultado in pagina["results"]]
+        cursor = pagina["next_cursor"]
+        if cursor is None:
+            return ids
+
+def test_paginar_recorre_todos_los_resultados_en_orden(tmp_path, monkeypatch):
+    from app.schemas.legal_document import SearchQuery
+    from app.services.optimized_bm25_service import OptimizedBM25Service
+
+    db = corpus(tmp_path, monkeypatch)
+    servicio = OptimizedBM25Service(use_cache=False)
+    completos = servicio.search_documents_with_facets(db, SearchQuery(query="despido indemnización", limit=100))
+    esperados = [resultado["document_id"] for resultado in completos["results"]]
+    assert len(esperados) == 12
+
+    # Las páginas no repiten ni omiten documentos, incluso con empates
+    assert paginar(servicio, db) == esperados
+
+    # Paginación con filtros: sólo los documentos del filtro, en el mismo orden
+    filtrados = paginar(servicio, db, category="laboral", year=2011)
+    assert filtrados == [doc_id for doc_id in esperados if doc_id % 3 and doc_id % 3 == 1]
+    db.close()
+
+def test_cache_de_primera_pagina_no_reutiliza_cursores_de_otra_generacion(tmp_path, monkeypatch):
+    from app.models.legal_document import LegalDocument
+    from app.schemas.legal_document import SearchQuery
+    from app.services.optimized_bm25_service import OptimizedBM25Service
+
+    db = corpus(tmp_path, monkeypatch)
+    servicio = OptimizedBM25Service(use_cache=True, freshness_check_interval=0)
+    consulta = SearchQuery(query="despido indemnización", limit=5)
+    primera = servicio.search_documents_with_facets(db, consulta)
+    assert servicio.search_documents_with_facets(db, consulta)["results"][0]["cached"]
+
+    # Tras una escritura, la primera página se recalcula con un cursor válido
+    db.query(LegalDocument).filter(LegalDocument.id == 1).update({"category": "civil"})
+    db.commit()
+    nueva = servicio.search_documents_with_facets(db, consulta)
+    assert not nueva["results"][0]["cached"]
+    assert nueva["next_cursor"] != primera["next_cursor"]
+    segunda = servicio.search_documents_with_facets(
+        db, SearchQuery(query="despido indemnización", limit=5, cursor=nueva["next_cursor"]))
+    assert segunda["results"]
+    db.close()
@@ -0,0 +1,32 @@
+from app.services.semantic_cache import SemanticAnswerCache
+
+RESPUESTA = ("Procede la indemnización [📄 Doc2] según [📄 Doc1]", 0.8, False, None)
+
+def test_parafrasis_reutiliza_respuesta_y_renumera_citas():
+    cache = SemanticAnswerCache(threshold=0.8, min_overlap=0.5)
+    cache.set("cuanto me pagan si me despiden sin justa causa", [5, 7], RESPUESTA)
+
+    response = cache.get("¿Cuánto me deben pagar si me despiden sin justa causa?", [7, 5])
+    assert response == ("Procede la indemnización [📄 Doc1] según [📄 Doc2]", 0.8, False, None)
+
+def test_documentos_distintos_no_reutilizan_respuesta():
+    cache = SemanticAnswerCache(threshold=0.8, min_overlap=0.5)
+    cache.set("cuanto me pagan si me despiden sin justa causa", [5, 7], RESPUESTA)
+
+    assert cache.get("cuanto me pagan si me despiden sin justa causa", [8, 9]) is None
+    # Un documento citado ya no está en el contexto
+    assert cache.get("cuanto me pagan si me despiden sin justa causa", [7, 9]) is None
+    assert cache.get("vacaciones anuales remuneradas", [5, 7]) is None
+    assert cache.stats()["hits"] == 0
+
+def test_polaridad_distinta_no_reutiliza_respuesta():
+    cache = SemanticAnswerCache(threshold=0.8, min_overlap=0.5)
+    cache.set("cuanto me pagan si me despiden sin justa causa", [5, 7], RESPUESTA)
+    cache.set("el empleador puede despedir a una embarazada", [5, 7], RESPUESTA)
+
+    # Las palabras de polaridad forman parte del vector y, además, deben coincidir
+    sin, con = cache.embed("cuanto me pagan si me despiden sin justa causa"), cache.embed("cuanto me pagan si me despiden con justa causa")
+    assert sin @ con < 0.8
+    assert cache.get("cuanto me pagan si me despiden con justa causa", [5, 7]) is None
+    assert cache.get("el empleador no puede despedir a una embarazada", [5, 7]) is None
+    assert cache.stats()["hits"] == 0
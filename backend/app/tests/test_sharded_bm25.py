@@ -0,0 +1,33 @@
+from app.schemas.legal_document import SearchQuery
+from app.services import sharded_bm25_service
+from app.services.optimized_bm25_service import OptimizedBM25Service
+from app.services.sharded_bm25_service import ShardedBM25Service
+from app.tests.test_search_pagination import corpus, paginar
+
+CONSULTAS = [
+    {},
+    {"category": "laboral"},
+    {"document_type": "sentencia", "year": 2011},
+]
+
+def test_resultados_identicos_a_un_indice_unico(tmp_path, monkeypatch):
+    db = corpus(tmp_path, monkeypatch)
+    # Lotes pequeños para que el corpus de prueba se reparta entre los shards
+    monkeypatch.setattr(sharded_bm25_service, "INDEX_BATCH_SIZE", 5)
+    unico = OptimizedBM25Service(use_cache=False)
+    particionado = ShardedBM25Service(num_shards=3, use_cache=False)
+    try:
+        for filtros in CONSULTAS:
+            consulta = SearchQuery(query="despido indemnización", limit=100, **filtros)
+            esperado = unico.search_documents_with_facets(db, consulta)
+            obtenido = particionado.search_documents_with_facets(db, consulta)
+
+            assert obtenido["results"] == esperado["results"]
+            assert obtenido["facets"] == esperado["facets"]
+
+            # La paginación recorre los mismos documentos en el mismo orden
+            assert paginar(particionado, db, **filtros) == paginar(unico, db, **filtros)
+        assert particionado.index_status()["shards"] == {"count": 3, "alive": 3}
+    finally:
+        particionado.close()
+        db.close()
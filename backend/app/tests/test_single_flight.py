@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.single_flight import SingleFlight
+
+def test_hilos_concurrentes_comparten_una_ejecucion():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "respuesta"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["respuesta"] * 5
+    assert flight.stats() == {"executions": 1, "coalesced": 4, "in_flight": 0}
+
+def test_corrutinas_concurrentes_comparten_resultado_y_error():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "respuesta"
+
+    async def failing():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("fallo")
+
+    async def main():
+        results = await asyncio.gather(*[flight.ado("k", slow) for _ in range(10)])
+        assert results == ["respuesta"] * 10
+        errors = await asyncio.gather(*[flight.ado("e", failing) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(error, RuntimeError) for error in errors)
+
+    asyncio.run(main())
+    assert len(calls) == 1
+
+    # Una vez terminada, la siguiente llamada vuelve a ejecutar
+    asyncio.run(flight.ado("k", slow))
+    assert len(calls) == 2
+
+def test_cancelar_la_primera_peticion_no_afecta_a_las_demas():
+    flight = SingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "respuesta"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("k", slow))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.ado("k", slow)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await asyncio.gather(*followers) == ["respuesta"] * 3
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(main())
+    assert len(calls) == 1
+    assert flight.stats() == {"executions": 1, "coalesced": 3, "in_flight": 0}
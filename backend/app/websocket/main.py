@@ -1,4 +1,5 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Dict, Optional
 import json
 import asyncio
@@ -6,6 +7,9 @@ import logging
 import redis.asyncio as redis
 import os
 from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.auth_service import AuthService
+from app.services.query_events import QUERY_EVENTS_CHANNEL_PREFIX
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +22,8 @@ class ConnectionManager:
     def __init__(self):
         # {caso_id: [conexiones]}
         self.active_connections: Dict[int, List[WebSocket]] = {}
+        # {user_id: [conexiones]} para los eventos de consultas en segundo plano
+        self.user_connections: Dict[str, List[WebSocket]] = {}
         self.redis: Optional[redis.Redis] = None
         self.pubsub = None
         self.redis_task = None
@@ -27,6 +33,8 @@ class ConnectionManager:
             self.redis = await redis.from_url(settings.REDIS_URL)
             self.pubsub = self.redis.pubsub()
             await self.pubsub.subscribe("chat_messages")
+            # Canales por usuario con la finalización de consultas de /queries
+            await self.pubsub.psubscribe(f"{QUERY_EVENTS_CHANNEL_PREFIX}*")
             self.redis_task = asyncio.create_task(self.redis_listener())
             logger.info("Redis PubSub configurado correctamente")
         except Exception as e:
@@ -44,12 +52,18 @@ class ConnectionManager:
                     if caso_id:
                         # Evita un loop enviando solo a las conexiones locales
                         await self.broadcast_local(json.dumps(data["message"]), caso_id)
+                elif message and message["type"] == "pmessage":
+                    data = json.loads(message["data"])
+                    user_id = data.get("user_id")
+                    if user_id:
+                        await self.send_to_user(json.dumps(data["message"]), user_id)
                 await asyncio.sleep(0.01)
         except Exception as e:
             logger.error(f"Error en el listener de Redis: {str(e)}")
         finally:
             if self.pubsub:
                 await self.pubsub.unsubscribe("chat_messages")
+                await self.pubsub.punsubscribe(f"{QUERY_EVENTS_CHANNEL_PREFIX}*")
 
     async def connect(self, websocket: WebSocket, caso_id: int):
         await websocket.accept()
@@ -66,6 +80,27 @@ class ConnectionManager:
             except ValueError:
                 pass  # Ya fue removido
 
+    async def connect_user(self, websocket: WebSocket, user_id: str):
+        await websocket.accept()
+        self.user_connections.setdefault(user_id, []).append(websocket)
+        logger.info(f"Usuario {user_id} suscrito a sus consultas. Total conexiones: {len(self.user_connections[user_id])}")
+
+    def disconnect_user(self, websocket: WebSocket, user_id: str):
+        connections = self.user_connections.get(user_id, [])
+        if websocket in connections:
+            connections.remove(websocket)
+        if not connections:
+            self.user_connections.pop(user_id, None)
+
+    async def send_to_user(self, message: str, user_id: str):
+        """Envía un evento de consulta a las conexiones locales del usuario"""
+        for connection in list(self.user_connections.get(user_id, [])):
+            try:
+                await connection.send_text(message)
+            except Exception as e:
+                logger.error(f"Error al enviar evento de consulta: {str(e)}")
+                self.disconnect_user(connection, user_id)
+
     async def broadcast_local(self, message: str, caso_id: int):
         """Envía un mensaje sólo a las conexiones locales"""
         if caso_id in self.active_connections:
@@ -103,6 +138,29 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+def _websocket_token(websocket: WebSocket) -> Optional[str]:
+    """
+    JWT de la conexión: cabecera Authorization: Bearer o, como los navegadores
+    no pueden enviar cabeceras al abrir un WebSocket, el parámetro ?token=
+    """
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return websocket.query_params.get("token")
+
+def _authenticated_user_id(token: Optional[str]) -> Optional[str]:
+    """Valida el JWT (el mismo de la API) y devuelve el id del usuario activo, o None"""
+    if not token:
+        return None
+    db = SessionLocal()
+    try:
+        user = AuthService.get_current_user(token=token, db=db)
+        return str(user.id) if user.activo else None
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+
 @app.on_event("startup")
 async def startup_event():
     await manager.setup_redis()
@@ -141,6 +199,31 @@ async def websocket_endpoint(websocket: WebSocket, caso_id: int):
         logger.error(f"Error en WebSocket: {str(e)}")
         manager.disconnect(websocket, caso_id)
 
+@app.websocket("/ws/queries")
+async def query_events_endpoint(websocket: WebSocket):
+    """
+    Eventos de finalización de las consultas de /queries del usuario
+    autenticado con el JWT de la API (?token= o Authorization: Bearer); sin un
+    token válido la conexión se cierra con el código 1008.
+    Tras suscribirse, el cliente debe consultar una vez GET /queries/{id} de
+    las consultas pendientes, por si terminaron antes de la suscripción.
+    """
+    # El canal es el del usuario del token, nunca uno elegido por el cliente
+    user_id = await run_in_threadpool(_authenticated_user_id, _websocket_token(websocket))
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await manager.connect_user(websocket, user_id)
+    try:
+        while True:
+            # El cliente no envía datos; la lectura sólo detecta la desconexión
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        manager.disconnect_user(websocket, user_id)
+    except Exception as e:
+        logger.error(f"Error en WebSocket de consultas: {str(e)}")
+        manager.disconnect_user(websocket, user_id)
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Iniciando servidor WebSocket...")
@@ -40,19 +40,78 @@ DEBUG = os.getenv("DEBUG", "True").lower() == "true"
 # Configuración de OpenAI/LLM
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 GPT_MODEL = os.getenv("GPT_MODEL", "gpt-3.5-turbo")  # Cambiado a gpt-3.5-turbo por defecto (más económico)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")  # URL de una API compatible con OpenAI (vacío = OpenAI); p. ej. el servidor simulado local
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))  # Conexiones simultáneas del pool HTTP asíncrono hacia OpenAI
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))  # Solicitudes por minuto hacia OpenAI (se ajusta con las cabeceras de la API)
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))  # Tokens por minuto hacia OpenAI (se ajusta con las cabeceras de la API)
+LLM_RATE_LIMIT_MAX_WAIT = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT", "30"))  # Segundos máximos en la cola del limitador
+LLM_RATE_LIMIT_STATE_FILE = os.getenv("LLM_RATE_LIMIT_STATE_FILE", "")  # Archivo para compartir el límite entre workers (vacío = por proceso)
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))  # Fallas consecutivas de OpenAI que abren el circuito
+LLM_CIRCUIT_RESET_TIMEOUT = float(os.getenv("LLM_CIRCUIT_RESET_TIMEOUT", "30"))  # Segundos con el circuito abierto (respuestas sólo con documentos)
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "True").lower() == "true"  # Solicitud de respaldo cuando OpenAI tarda más que el p95
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "2"))  # Espera mínima en segundos antes de la solicitud de respaldo
+LLM_PRICES = os.getenv("LLM_PRICES", "")  # JSON {"modelo": [entrada, salida]} en USD por millón de tokens (vacío = precios por defecto)
+LLM_TELEMETRY_MAX_USERS = int(os.getenv("LLM_TELEMETRY_MAX_USERS", "1000"))  # Usuarios con uso propio en la telemetría; el resto se agrupa en "otros"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # Token Bearer requerido por GET /metrics (vacío = endpoint desactivado)
 
 # Configuración de optimización de consumo de tokens
 ECONOMY_MODE = os.getenv("ECONOMY_MODE", "True").lower() == "true"  # Activado por defecto
 MAX_TOKENS_OUTPUT = int(os.getenv("MAX_TOKENS_OUTPUT", "150"))  # Límite de tokens en respuesta
 MAX_DOCUMENTS = int(os.getenv("MAX_DOCUMENTS", "2"))  # Número máximo de documentos a incluir
-MAX_CHARS_PER_DOC = int(os.getenv("MAX_CHARS_PER_DOC", "300"))  # Caracteres máximos por documento
+MAX_CHARS_PER_DOC = int(os.getenv("MAX_CHARS_PER_DOC", "300"))  # Obsoleto: el contenido se limita con PROMPT_TOKEN_BUDGET
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))  # Tokens máximos del prompt (instrucciones + documentos) en respuestas rápidas
+LEGAL_PROMPT_TOKEN_BUDGET = int(os.getenv("LEGAL_PROMPT_TOKEN_BUDGET", "3000"))  # Tokens máximos del prompt en respuestas legales detalladas
 ENABLE_CACHE = os.getenv("ENABLE_CACHE", "True").lower() == "true"  # Caché activado por defecto
 DAILY_QUERY_LIMIT = int(os.getenv("DAILY_QUERY_LIMIT", "25"))  # Límite diario de consultas
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "604800"))  # Segundos de vida de una respuesta cacheada (7 días)
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "500"))  # Respuestas en memoria por worker
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))  # Respuestas máximas en disco
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() == "true"  # Reutilizar respuestas de consultas parecidas
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))  # Similitud mínima entre consultas (0-1)
+SEMANTIC_CACHE_MIN_OVERLAP = float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", "0.5"))  # Coincidencia mínima de documentos recuperados (0-1)
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))  # Consultas en el índice semántico por worker
+EXTRACTIVE_ANSWERS_ENABLED = os.getenv("EXTRACTIVE_ANSWERS_ENABLED", "True").lower() == "true"  # Responder preguntas frecuentes con un pasaje, sin LLM
+EXTRACTIVE_ANSWER_THRESHOLD = float(os.getenv("EXTRACTIVE_ANSWER_THRESHOLD", "0.75"))  # Puntuación mínima (cobertura y margen BM25, 0-1) para omitir el LLM
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "True").lower() == "true"  # Elegir modelo y max_tokens según la complejidad de la consulta
+MODEL_ROUTER_SIMPLE_MODEL = os.getenv("MODEL_ROUTER_SIMPLE_MODEL", "")  # Modelo de las consultas simples (vacío = GPT_MODEL)
+MODEL_ROUTER_COMPLEX_MODEL = os.getenv("MODEL_ROUTER_COMPLEX_MODEL", "")  # Modelo de las consultas complejas (vacío = GPT_MODEL)
+MODEL_ROUTER_SIMPLE_THRESHOLD = float(os.getenv("MODEL_ROUTER_SIMPLE_THRESHOLD", "0.35"))  # Complejidad (0-1) por debajo de la cual la consulta es simple
+MODEL_ROUTER_COMPLEX_THRESHOLD = float(os.getenv("MODEL_ROUTER_COMPLEX_THRESHOLD", "0.65"))  # Complejidad (0-1) desde la cual la consulta es compleja
+PRECOMPUTED_ANSWERS_ENABLED = os.getenv("PRECOMPUTED_ANSWERS_ENABLED", "True").lower() == "true"  # /ask responde primero desde el almacén de respuestas precalculadas
+PRECOMPUTE_TOP_N = int(os.getenv("PRECOMPUTE_TOP_N", "300"))  # Grupos de preguntas frecuentes a precalcular
+PRECOMPUTE_MIN_HITS = int(os.getenv("PRECOMPUTE_MIN_HITS", "3"))  # Consultas mínimas de un grupo para precalcular su respuesta
+PRECOMPUTE_CLUSTER_THRESHOLD = float(os.getenv("PRECOMPUTE_CLUSTER_THRESHOLD", "0.85"))  # Similitud mínima para agrupar preguntas casi idénticas (0-1)
+
+# Configuración de la generación masiva de respuestas (/bulk y app/scripts/bulk_generate.py)
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))  # Llamadas simultáneas al LLM por trabajo
+BULK_RETRIEVAL_BATCH_SIZE = int(os.getenv("BULK_RETRIEVAL_BATCH_SIZE", "25"))  # Preguntas por lote de búsqueda BM25
+BULK_MAX_QUESTIONS = int(os.getenv("BULK_MAX_QUESTIONS", "5000"))  # Preguntas máximas por trabajo de /bulk
+BULK_JOBS_DIR = os.getenv("BULK_JOBS_DIR", os.path.join(BASE_DIR, "data", "bulk_jobs"))  # Preguntas y resultados de cada trabajo
+
+# Configuración de la cola de consultas en segundo plano (/queries)
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "4"))  # Consultas procesadas a la vez por proceso
+QUERY_WORKERS_EMBEDDED = os.getenv("QUERY_WORKERS_EMBEDDED", "True").lower() == "true"  # Ejecutar los workers dentro de la API (False = app/scripts/query_worker.py)
+QUERY_WORKER_POLL_INTERVAL = float(os.getenv("QUERY_WORKER_POLL_INTERVAL", "1"))  # Segundos de espera cuando la cola está vacía
+QUERY_JOB_LEASE_SECONDS = float(os.getenv("QUERY_JOB_LEASE_SECONDS", "120"))  # Arriendo de una consulta reservada (se renueva mientras se procesa)
+QUERY_JOB_MAX_ATTEMPTS = int(os.getenv("QUERY_JOB_MAX_ATTEMPTS", "3"))  # Intentos máximos por consulta
+QUERY_JOB_RETRY_DELAY = float(os.getenv("QUERY_JOB_RETRY_DELAY", "5"))  # Espera base en segundos antes de reintentar (se duplica en cada intento)
+QUERY_EVENTS_ENABLED = os.getenv("QUERY_EVENTS_ENABLED", "True").lower() == "true"  # Avisar por WebSocket (Redis, canal por usuario) cuando termina una consulta
+
+# Configuración del índice de búsqueda BM25
+BM25_FRESHNESS_CHECK_INTERVAL = float(os.getenv("BM25_FRESHNESS_CHECK_INTERVAL", "30"))  # Segundos entre verificaciones de cambios en el corpus
+BM25_SHARDS = int(os.getenv("BM25_SHARDS", "0"))  # Procesos de shard del índice BM25 (0 o 1 = índice en el propio proceso)
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "2000"))  # Documentos hidratados en memoria para resultados de búsqueda (0 = desactivado)
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # Tamaño aproximado máximo del caché de documentos hidratados
+SEARCH_WARMUP_ENABLED = os.getenv("SEARCH_WARMUP_ENABLED", "True").lower() == "true"  # Calentar índices al arrancar
+SEARCH_WARMUP_QUERIES = int(os.getenv("SEARCH_WARMUP_QUERIES", "50"))  # Consultas recientes a recalcular al arrancar
 
 # Directorio para almacenar caché
 CACHE_DIR = os.path.join(BASE_DIR, "cache")
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# Almacén de respuestas precalculadas y registro de preguntas frecuentes
+ANSWER_STORE_DB = os.path.join(CACHE_DIR, "answer_store.db")
+
 # Validación de la configuración de OpenAI
 if not OPENAI_API_KEY or OPENAI_API_KEY == "your_openai_api_key_here" or OPENAI_API_KEY == "sk-your-actual-openai-api-key":
     logger.warning(